@@ -1,22 +1,20 @@
-import pandas as pd
-import re
+from __future__ import annotations
+
 import numpy as np
 from pathlib import Path
 
-# Possible names for wells of a 94 well plate
-#TODO Add compatibility for 384 well plates
-possible_wells = ['A1', 'B1', 'C1', 'D1', 'E1', 'F1', 'G1', 'H1',
-                  'A2', 'B2', 'C2', 'D2', 'E2', 'F2', 'G2', 'H2',
-                  'A3', 'B3', 'C3', 'D3', 'E3', 'F3', 'G3', 'H3',
-                  'A4', 'B4', 'C4', 'D4', 'E4', 'F4', 'G4', 'H4',
-                  'A5', 'B5', 'C5', 'D5', 'E5', 'F5', 'G5', 'H5',
-                  'A6', 'B6', 'C6', 'D6', 'E6', 'F6', 'G6', 'H6',
-                  'A7', 'B7', 'C7', 'D7', 'E7', 'F7', 'G7', 'H7',
-                  'A8', 'B8', 'C8', 'D8', 'E8', 'F8', 'G8', 'H8',
-                  'A9', 'B9', 'C9', 'D9', 'E9', 'F9', 'G9', 'H9',
-                  'A10', 'B10', 'C10', 'D10', 'E10', 'F10', 'G10', 'H10',
-                  'A11', 'B11', 'C11', 'D11', 'E11', 'F11', 'G11', 'H11',
-                  'A12', 'B12', 'C12', 'D12', 'E12', 'F12', 'G12', 'H12']
+from .lazy import LazyModule
+from .parsing import ParseScanSummary, ParsedScanSummary, CD, ABS, CD_PER_ABS, N_CHANNELS
+from .cache import ScanSummaryCache
+from .spectrum import Spectrum
+from .plates import GetPlateGeometry, IsWellLabel, PLATE_96, PLATE_1536
+from .instrument import Stage, Staged, Count
+
+pd = LazyModule('pandas')
+
+# Possible names for wells of a 96 well plate. Other plates
+# are described by EKKOTools.plates.PlateGeometry
+possible_wells = PLATE_96.labels
 
 # Added average to possible wells as this indicates
 # that a Well was created by averaging multiple wells
@@ -26,157 +24,441 @@ possible_wells.append('Average')
 class Well():
     '''
     Class for handling information within a well. Instatiation is not done
-    directly, but rather from the EKKOScanSummary class which formats the 
-    dataframe in a specific way for ingestion by the Well class.
+    directly, but rather from the EKKOScanSummary class which hands each
+    Well a view into its (n_wells, n_wavelengths, channel) spectra array.
+
+    The CD, ABS and CD_PER_ABS attributes are dictionaries with
+    wavelength:intensity key:value pairs. They are built from the array
+    on first access and memoized. They can be overwritten with user-defined
+    spectra (dicts, Spectrum objects or arrays aligned with Well.wavelengths),
+    which are then also returned by get_spectrum. Unless CD_PER_ABS is
+    assigned itself, it follows the current CD and ABS.
     '''
-    def __init__(self, df: pd.DataFrame, parent_scanfile: Path,  analyte_name: str = None):
-        self.df = df.reset_index()
-        if not self.df["WL"][0] in possible_wells:
-            raise ValueError(f"Well format not understood in {parent_scanfile.name}\tWell: {str(self.df['WL'][0])}")
-        else:
-            self.name = self.df["WL"][0]
-            self.parent_scanfile = parent_scanfile
-            self.df = self.df.drop(0)
-            self.df = self.df.set_index("WL")
-            self.__analyte = analyte_name
-
-            # CD attribute which can hold user-defined 
-            # spectra which are dictionaries that have 
-            # wavelength:intensity key:value pairs
-            self.CD = self.get_CD()
-            self.ABS = self.get_abs()
-            self.CD_PER_ABS = self.get_CD_per_abs()
+    __slots__ = (
+        'name', 'parent_scanfile', 'spectra', 'wavelengths', 'wavelength_labels',
+        '_analyte', '_assigned', '_cache', '_blank')
+
+    def __init__(
+        self,
+        spectra: np.ndarray,
+        wavelengths: np.ndarray,
+        name: str,
+        parent_scanfile: Path = None,
+        analyte_name: str = None,
+        wavelength_labels: list = None):
+        if name != 'Average' and not IsWellLabel(name):
+            raise ValueError(f"Well format not understood in {getattr(parent_scanfile, 'name', None)}\tWell: {name}")
+
+        self.name = name
+        self.parent_scanfile = parent_scanfile
+        self.spectra = spectra
+        self.wavelengths = wavelengths
+        if wavelength_labels is None:
+            wavelength_labels = [f'{wl:g}' for wl in wavelengths]
+        self.wavelength_labels = wavelength_labels
+        self._analyte = analyte_name
+
+        # User-assigned spectra keyed by channel
+        self._assigned = None
+        # Memoized dicts and derived arrays
+        self._cache = None
+        # EKKOTools.blank.Blank which was subtracted from the spectra
+        self._blank = None
+
+    @classmethod
+    def from_dataframe(cls, df: pd.DataFrame, parent_scanfile: Path, analyte_name: str = None):
+        '''
+        Creates a Well from a dataframe with WL, CD-mDeg and ABS columns whose
+        first row holds the well label in the WL column
+        '''
+        df = df.reset_index(drop=True)
+        data = df.iloc[1:]
+        spectra = np.empty((len(data), N_CHANNELS), dtype=np.float64)
+        spectra[:, CD] = data['CD-mDeg'].astype(np.float64)
+        spectra[:, ABS] = data['ABS'].astype(np.float64)
+        with np.errstate(divide='ignore', invalid='ignore'):
+            spectra[:, CD_PER_ABS] = spectra[:, CD] / spectra[:, ABS]
+        labels = [str(wl) for wl in data['WL']]
+        return cls(
+            spectra,
+            np.asarray(labels, dtype=np.float64),
+            name=df['WL'][0],
+            parent_scanfile=parent_scanfile,
+            analyte_name=analyte_name,
+            wavelength_labels=labels)
 
     @property
     def analyte(self) -> str:
-        return self.__analyte
+        return self._analyte
 
     @analyte.setter
     def analyte(self, analyte_name: str) -> None:
-        self.__analyte = analyte_name
+        self._analyte = analyte_name
+
+    @property
+    def blank(self):
+        '''The EKKOTools.blank.Blank which was subtracted from the spectra, if any'''
+        return self._blank
+
+    @property
+    def df(self) -> pd.DataFrame:
+        '''The raw CD and ABS of the well as a dataframe indexed by wavelength'''
+        return pd.DataFrame(
+            {'CD-mDeg': self.spectra[:, CD], 'ABS': self.spectra[:, ABS]},
+            index=pd.Index(self.wavelength_labels, name='WL'))
+
+    @property
+    def CD(self) -> dict:
+        return self._get_dict(CD)
+
+    @CD.setter
+    def CD(self, spectrum: dict) -> None:
+        self._assign(CD, spectrum)
+
+    @property
+    def ABS(self) -> dict:
+        return self._get_dict(ABS)
+
+    @ABS.setter
+    def ABS(self, spectrum: dict) -> None:
+        self._assign(ABS, spectrum)
+
+    @property
+    def CD_PER_ABS(self) -> dict:
+        return self._get_dict(CD_PER_ABS)
+
+    @CD_PER_ABS.setter
+    def CD_PER_ABS(self, spectrum: dict) -> None:
+        self._assign(CD_PER_ABS, spectrum)
+
+    def get_spectrum(self, channel: int) -> np.ndarray:
+        '''
+        Current spectrum of a channel (EKKOTools.parsing.CD, ABS or CD_PER_ABS)
+        as an array aligned with Well.wavelengths. This includes spectra which
+        were assigned to the CD, ABS and CD_PER_ABS attributes. The array must
+        not be modified in place.
+        '''
+        assigned = self._assigned.get(channel) if self._assigned else None
+        if isinstance(assigned, np.ndarray):
+            return assigned
+        if assigned is not None:
+            raise ValueError(f'The spectrum assigned to well {self.name} was not measured at the wavelengths of the well')
+
+        if channel == CD_PER_ABS and self._assigned:
+            cache = self._get_cache()
+            if ('array', CD_PER_ABS) not in cache:
+                with np.errstate(divide='ignore', invalid='ignore'):
+                    cache[('array', CD_PER_ABS)] = self.get_spectrum(CD) / self.get_spectrum(ABS)
+            return cache[('array', CD_PER_ABS)]
+
+        return self.spectra[:, channel]
+
+    def get_current_spectra(self) -> np.ndarray:
+        '''
+        (n_wavelengths, channel) array of the current spectra of every
+        channel, like Well.spectra but including assigned (e.g. smoothed or
+        blank corrected) spectra. Without assigned spectra this is
+        Well.spectra itself, which must not be modified in place.
+        '''
+        if not self._assigned:
+            return self.spectra
+        return np.stack([_aligned_spectrum(self, channel) for channel in range(N_CHANNELS)], axis=-1)
+
+    def as_spectrum(self, channel: int) -> Spectrum:
+        '''Current spectrum of a channel as an EKKOTools.spectrum.Spectrum'''
+        return Spectrum.from_well(self, channel)
+
+    def _get_dict(self, channel: int) -> dict:
+        assigned = self._assigned.get(channel) if self._assigned else None
+        if isinstance(assigned, dict):
+            return assigned
+
+        cache = self._get_cache()
+        if ('dict', channel) not in cache:
+            try:
+                spectrum = self.get_spectrum(channel)
+            except ValueError:
+                # CD or ABS were assigned with different wavelengths
+                cd, absorbance = self.CD, self.ABS
+                cache[('dict', channel)] = {wl: cd[wl] / absorbance[wl] if absorbance[wl] else np.nan for wl in cd if wl in absorbance}
+            else:
+                cache[('dict', channel)] = dict(zip(self.wavelength_labels, spectrum.tolist()))
+        return cache[('dict', channel)]
+
+    def _assign(self, channel: int, spectrum) -> None:
+        '''
+        Stores a user-defined spectrum. Dicts whose keys are the wavelengths
+        of the well are stored as arrays so that get_spectrum can return them.
+        '''
+        spectrum_dict = None
+        if isinstance(spectrum, Spectrum):
+            if spectrum.ndim != 1 or list(spectrum.wavelength_labels) != list(self.wavelength_labels):
+                raise ValueError(f'Spectrum of shape {spectrum.shape} does not match the {len(self.wavelengths)} wavelengths of well {self.name}')
+            spectrum = spectrum.values
+        if isinstance(spectrum, dict):
+            if list(spectrum.keys()) == self.wavelength_labels:
+                spectrum_dict = spectrum
+                spectrum = np.fromiter(spectrum.values(), dtype=np.float64, count=len(spectrum))
+        else:
+            spectrum = np.asarray(spectrum, dtype=np.float64)
+            if spectrum.shape != self.wavelengths.shape:
+                raise ValueError(f'Spectrum of shape {spectrum.shape} does not match the {len(self.wavelengths)} wavelengths of well {self.name}')
+
+        if self._assigned is None:
+            self._assigned = {}
+        self._assigned[channel] = spectrum
+
+        # Drop everything which was memoized from the old spectrum
+        cache = self._get_cache()
+        cache.pop(('dict', channel), None)
+        if channel in (CD, ABS):
+            cache.pop(('dict', CD_PER_ABS), None)
+            cache.pop(('array', CD_PER_ABS), None)
+
+        # Hand the same dict back from the attribute
+        if spectrum_dict is not None:
+            cache[('dict', channel)] = spectrum_dict
+
+    def _get_cache(self) -> dict:
+        if self._cache is None:
+            self._cache = {}
+        return self._cache
 
     def get_CD(self) -> dict:
-        return {
-            wl: float(self.df["CD-mDeg"][wl])
-            for wl in self.df.index
-        }
+        return dict(zip(self.wavelength_labels, self.spectra[:, CD].tolist()))
 
     def get_abs(self) -> dict:
-        return {
-            wl: float(self.df["ABS"][wl])
-            for wl in self.df.index
-        }
+        return dict(zip(self.wavelength_labels, self.spectra[:, ABS].tolist()))
 
     def get_CD_per_abs(self) -> dict:
         '''Returns the CD divided by the ABS at all wavelengths (aka g-factor)'''
-        abs = self.get_abs()
-        cd = self.get_CD()
-        return {wl: float(cd[wl] / abs[wl]) for wl in self.df.index}
+        return dict(zip(self.wavelength_labels, self.spectra[:, CD_PER_ABS].tolist()))
+
+def _aligned_spectrum(well: Well, channel: int) -> np.ndarray:
+    '''Current spectrum of a channel on the wavelengths of the well, also if a dict with other wavelengths was assigned'''
+    try:
+        return well.get_spectrum(channel)
+    except ValueError:
+        spectrum = (well.CD, well.ABS, well.CD_PER_ABS)[channel]
+        return np.array([spectrum.get(wl, np.nan) for wl in well.wavelength_labels], dtype=np.float64)
 
 class EKKOScanSummary():
     '''
     Class for handling EKKO ScanSummary files (.cdxs).
 
-    Instantiate with a pathlib Path object or string.
+    Instantiate with a pathlib Path object or string. The file is read
+    once by EKKOTools.parsing.ParseScanSummary. The spectra of all wells
+    are held in one contiguous (n_wells, n_wavelengths, channel) float64
+    array, and each Well is a view into it. The plate attribute is the
+    EKKOTools.plates.PlateGeometry of the well_plate_type (96, 384 or 1536
+    wells) and plate_map holds the row of the spectra array of every well
+    of the plate.
+
+    Pass a EKKOTools.cache.ScanSummaryCache (or True for the default cache)
+    as cache to reuse the parsed contents of files which have not changed.
     '''
-    def __init__(self, file: Path):
+    @Staged('ingest')
+    def __init__(self, file: Path, cache = None):
 
         if not isinstance(file, Path):
             file = Path(file)
-            if file.is_dir():
-                raise ValueError(f"Path handed to EKKOScanSummary is a directory, not a dir!")
-            if file.suffix != ".cdxs" or file.suffix != ".CDXS":
-                raise ValueError(f"The file {self.file.name} is not formatted like a EKKO CD Wellplate Reader cdxs file")
+        if file.is_dir():
+            raise ValueError(f"Path handed to EKKOScanSummary is a directory, not a file!")
+        if file.suffix.casefold() != ".cdxs":
+            raise ValueError(f"The file {file.name} is not formatted like a EKKO CD Wellplate Reader cdxs file")
 
         self.file = file
 
-        self.content = pd.read_csv((self.file), header = None)
-        self.content = self.content[0].str.split('\t', expand=True)
-
-        if self.content[0][0] != "Hinds Instruments CD Reader":
-            raise ValueError(f"The file {self.file.name} is not formatted like a EKKO CD Wellplate Reader cdxs file")
+        scan_key = self._scan_key if self._has_scan_key() else None
 
-        self.name = file.stem
-        # Added re.sub here to control for different amounts of spacing
-        self.date = re.sub("\s+", " ", self.content[0][1]).split(' ')[0]
-        self.scan_process = self.content[0][4]
-        self.well_plate_type = self.content[1][9]
+        if cache is True:
+            cache = ScanSummaryCache.default()
 
-        # This section assigns maps analytes to wells
-        if self._has_scan_key():
-            self.wells = self._assign_wells_from_scan_key()
-        
+        with Stage('ingest.cache'):
+            cached = cache.get(self.file, scan_key) if cache else None
+        if cached is not None:
+            parsed, analyte_map = cached
+            Count('cache_hits')
         else:
-            # Look in the well information table for anything
-            for i, row in self.content.iterrows():
-                if 'Well Info' in row[0]:
-                    well_info_table_start = i + 1
-                if 'End Annotation' in row[0]:
-                    well_info_table_end = i
-            
-            # Debug well info table
-            #print(well_info_table_start, well_info_table_end)
-            #print(self.content.iloc[well_info_table_start + 1:well_info_table_end])
-
-            info_table = self.content.iloc[well_info_table_start + 1:well_info_table_end].set_index(0).replace('MT', np.NaN).dropna(axis=0,how='all').dropna(axis=1,how='all')
-            info_table.replace(np.NaN, None)
-
-            # If the well info dataframe is empty, just assign the wells with no analyte information
-            if info_table.empty:
-                self.wells = [Well(scan, self.file) for scan in self.scan_list]
+            parsed = ParseScanSummary(self.file, possible_wells=PLATE_1536.label_set)
+            # This section assigns maps analytes to wells
+            if scan_key is not None:
+                with Stage('ingest.scan_key'):
+                    analyte_map = self._read_scan_key()
             else:
-                # Gets the well information table as a dict of columns, where each column has rows (letters of well plate)
-                d = {}
-                for column, row_analyte_dict in info_table.to_dict().items():
-                    row_letter, well_information = list(row_analyte_dict.keys())[0], list(row_analyte_dict.values())[0]
-                    well = f"{row_letter}{column}"
-                    d[well] = well_information
-                self.wells = self._assign_wells_from_dict(d)
+                analyte_map = parsed.well_info
+            if cache:
+                with Stage('ingest.cache'):
+                    cache.put(self.file, scan_key, parsed, analyte_map)
+
+        with Stage('ingest.load'):
+            self._load(parsed, analyte_map)
+        Count('files')
+        Count('wells', len(self.wells))
+
+    @classmethod
+    def from_parsed(cls, parsed: ParsedScanSummary, analyte_map: dict = None):
+        '''
+        Creates an EKKOScanSummary from already parsed contents (e.g. from a
+        EKKOTools.store.SpectralStore) without reading the file
+        '''
+        summary = cls.__new__(cls)
+        summary.file = Path(parsed.file)
+        summary._load(parsed, analyte_map if analyte_map is not None else parsed.well_info)
+        return summary
+
+    def _load(self, parsed: ParsedScanSummary, analyte_map: dict) -> None:
+        self.name = self.file.stem
+        self.header = parsed.header
+        self.date = parsed.date
+        self.scan_process = parsed.scan_process
+        self.well_plate_type = parsed.well_plate_type
+        self.well_names = parsed.well_names
+        self.wavelength_labels = parsed.wavelength_labels
+        self.wavelengths = parsed.wavelengths
+        self.spectra = parsed.spectra
+
+        self.plate = GetPlateGeometry(self.well_plate_type, self.well_names)
+        for name in self.well_names:
+            if name not in self.plate:
+                raise ValueError(f"Well format not understood in {self.file.name}\tWell: {name}")
+
+        # (plate row, plate column) -> row of self.spectra, -1 for wells which were not measured
+        self.plate_map = np.full(self.plate.shape, -1, dtype=np.intp)
+        self._well_rows = {}
+        for i, name in enumerate(self.well_names):
+            self._well_rows.setdefault(name, i)
+        for name, i in self._well_rows.items():
+            self.plate_map[self.plate.position(name)] = i
+
+        self.wells = self._assign_wells_from_dict(analyte_map)
+
+    def __getstate__(self) -> dict:
+        '''
+        Pickles the plate array once. Wells which are views into it are
+        stored as their row in the array and rebuilt by __setstate__.
+        '''
+        state = self.__dict__.copy()
+        state['wells'] = [self._well_state(well) for well in self.wells]
+        # Summaries opened from a SpectralStore are reattached to its memory map
+        if state.get('_store') is not None:
+            state['spectra'] = None
+        return state
+
+    def __setstate__(self, state: dict) -> None:
+        self.__dict__.update(state)
+        if self.spectra is None:
+            from .store import OpenSpectralStore
+            directory, index = self._store
+            self.spectra = OpenSpectralStore(directory).get_summary_spectra(index)
+        self.wells = [self._well_from_state(well) for well in self.wells]
+
+    def _well_state(self, well: Well):
+        row = self._well_row(well)
+        if row is None:
+            return well
+        return (row, well.analyte, well._assigned, well._blank)
+
+    def _well_row(self, well: Well) -> int:
+        '''Row of the plate array which the well is a view of, or None'''
+        offset = well.spectra.__array_interface__['data'][0] - self.spectra.__array_interface__['data'][0]
+        row, remainder = divmod(offset, self.spectra.strides[0])
+        if remainder or not 0 <= row < len(self.spectra) or \
+            well.spectra.shape != self.spectra.shape[1:] or well.spectra.strides != self.spectra.strides[1:]:
+            return None
+        return row
+
+    def _well_from_state(self, state):
+        if isinstance(state, Well):
+            return state
+        row, analyte, assigned, blank = state
+        well = Well(self.spectra[row], self.wavelengths, self.well_names[row], self.file, analyte, self.wavelength_labels)
+        well._assigned = assigned
+        well._blank = blank
+        return well
+
+    @property
+    def content(self) -> pd.DataFrame:
+        '''
+        Every line of the file split on tabs. This reads the file again
+        and is only kept for compatibility, use the parsed attributes instead.
+        '''
+        content = pd.read_csv((self.file), header = None)
+        return content[0].str.split('\t', expand=True)
 
     @property
     def blocksize(self):
         '''
         Length of the well scans which is 1 for each wavelength plus the well label (A1, A2, H3, etc...)
         '''
-        digits = re.findall(r'\b\d+\b', self.content[0][4])
-        block_size = (int(digits[1]) - int(digits[0])) / int(digits[2]) + 2
-        return int(block_size)
+        return len(self.wavelength_labels) + 1
 
     @property
     def scandata(self):
         '''Raw scan data which is not split'''
-        df = pd.read_csv(self.file, skiprows=11, delimiter="\t", on_bad_lines='warn', usecols=["WL", "CD-mDeg", "ABS"])
-        df.drop(df.tail(17).index, inplace=True)
-        return df
+        return pd.concat(self.scan_list, ignore_index=True)
 
     @property
     def scan_list(self):
         '''
         List of unformatted scan pd.DataFrame objects which can be interpreted by the EKKOScanFormats.Well class
         '''
-        scan_list = np.array_split(self.scandata, len(
-            self.scandata["WL"])/self.blocksize)
-        return scan_list
+        return [self._scan_dataframe(i) for i in range(len(self.well_names))]
+
+    def _scan_dataframe(self, i: int) -> pd.DataFrame:
+        '''Block of the scan data for the i-th well with the well label as its first row'''
+        start = i * self.blocksize
+        return pd.DataFrame({
+            'WL': [self.well_names[i]] + self.wavelength_labels,
+            'CD-mDeg': np.concatenate(([np.nan], self.spectra[i, :, CD])),
+            'ABS': np.concatenate(([np.nan], self.spectra[i, :, ABS]))},
+            index=range(start, start + self.blocksize))
+
+    def get_current_spectra(self) -> np.ndarray:
+        '''
+        (n_wells, n_wavelengths, channel) array of the current spectra of
+        self.wells, including spectra which were assigned to them. If no
+        well was changed, this is the plate array itself.
+        '''
+        wells = self.wells
+        if len(wells) == len(self.spectra) and all(
+            well._assigned is None and well.name == name and self._well_row(well) == i
+            for i, (well, name) in enumerate(zip(wells, self.well_names))):
+            return self.spectra
+
+        if not wells:
+            return self.spectra[:0]
+        return np.stack([well.get_current_spectra() for well in wells])
 
     def get_wavelengths(self):
         # Extracts wavelengths from first well plate reading. Assumes all wells measured same WL
-        wavelengths = self.scandata["WL"][1:self.blocksize]
-        return wavelengths
+        return pd.Series(self.wavelength_labels, index=range(1, self.blocksize), name='WL')
 
     def get_wells(self):
-        first_column = self.content[0][12:] # These array positions are hard coded, so they may have to be changed
-        wells = []
-        for row in first_column:
-            if row in possible_wells:
-                wells.append(row)
-            else:
-                pass
-        return wells
+        return list(self.well_names)
+
+    def get_plate_spectra(self, channel: int = CD) -> np.ndarray:
+        '''
+        Spectra of a channel (EKKOTools.parsing.CD, ABS or CD_PER_ABS) laid out
+        like the plate as an (n_rows, n_columns, n_wavelengths) array, so that
+        plate_spectra[self.plate.position('B3')] is the spectrum of well B3.
+        Wells which were not measured are NaN.
+        '''
+        plate_spectra = self.spectra[self.plate_map, :, channel]
+        plate_spectra[self.plate_map < 0] = np.nan
+        return plate_spectra
 
     def get_specific_well(self, well_label: str = None) -> Well:
         '''Returns the first Well object of the EKKOScanSummary which has the name well_label'''
-        if well_label not in possible_wells:
+        if well_label != 'Average' and well_label not in self.plate:
             raise ValueError(f'{well_label} is not a valid well label.')
+        return self._find_well(well_label)
+
+    def _find_well(self, well_label: str) -> Well:
+        '''Looks the well up by its row in the plate array, or scans self.wells if the list was changed'''
+        row = self._well_rows.get(well_label)
+        if row is not None and row < len(self.wells) and self.wells[row].name == well_label:
+            return self.wells[row]
 
         for well in self.wells:
             if well.name == well_label:
@@ -188,15 +470,15 @@ class EKKOScanSummary():
 
     def get_CD(self, well_name):
         '''Pass in string containing well name (A1 or H11) to get CD of a particular well'''
-        for well in self.wells:
-            if well.name == well_name:
-                return well.get_CD()
+        well = self._find_well(well_name)
+        if well is not None:
+            return well.get_CD()
         raise ValueError("Well {} not found".format(well_name))
 
     def get_CD_per_absorbance(self, well_name: str):
-        for well in self.wells:
-            if well.name == well_name:
-                return well.get_CD_per_abs()
+        well = self._find_well(well_name)
+        if well is not None:
+            return well.get_CD_per_abs()
         raise ValueError("Well {} not found".format(well_name))
 
     def _has_scan_key(self):
@@ -217,16 +499,17 @@ class EKKOScanSummary():
 
     def _assign_wells_from_scan_key(self):
         '''Attempts to pull data about the scan file from a second file labeled experiment_summary_scan_key.csv. Can also be xlsx file'''
+        return self._assign_wells_from_dict(self._read_scan_key())
 
+    def _read_scan_key(self) -> dict:
+        '''Reads the well:analyte map from the scan key found by _has_scan_key'''
         if self._scan_key.suffix == '.csv':
-            analyte_map = pd.read_csv(self._scan_key, header = None).set_index(0)[1].to_dict()
+            return pd.read_csv(self._scan_key, header = None).set_index(0)[1].to_dict()
         elif self._scan_key.suffix == '.xlsx':
-            analyte_map = pd.read_excel(self._scan_key, header = None).set_index(0)[1].to_dict()
+            return pd.read_excel(self._scan_key, header = None).set_index(0)[1].to_dict()
         else:
             raise TypeError('Scan key file format not recognized')
 
-        return self._assign_wells_from_dict(analyte_map)
-
     def _assign_wells_from_dict(self, d: dict):
         #print(f'PRocess: {self.scan_process}')
         #print(f'Length of scan list {len(self.scan_list)}')
@@ -237,7 +520,9 @@ class EKKOScanSummary():
         #for s in self.scan_list:
         #    print(s)
         #    print('\n')
-        local_wells = [Well(scan, self.file) for scan in self.scan_list]
+        local_wells = [
+            Well(self.spectra[i], self.wavelengths, name, self.file, wavelength_labels=self.wavelength_labels)
+            for i, name in enumerate(self.well_names)]
 
         for well in local_wells:
             if well.name in d.keys():
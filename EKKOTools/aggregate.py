@@ -0,0 +1,180 @@
+'''
+Grouped statistics of replicate wells.
+'''
+import numpy as np
+
+from .EKKOScanFormats import Well, EKKOScanSummary
+from .parsing import CD, ABS, CD_PER_ABS, N_CHANNELS
+from .instrument import Staged
+
+class ReplicateStatistics():
+    '''
+    Per-wavelength statistics of the replicate wells of one analyte.
+    Instantiation is not done directly, but rather from AggregateReplicates.
+
+    Attributes
+    ----------
+    analyte: str
+        Analyte of the replicates
+
+    wavelengths: np.ndarray
+        Wavelengths (nm) of shape (n_wavelengths,)
+
+    wavelength_labels: list[str]
+        Wavelengths as they are written in the scan files
+
+    mean, std, sem: np.ndarray
+        Arrays of shape (n_wavelengths, channel) like Well.spectra. NaN values
+        of the replicates are ignored.
+
+    count: np.ndarray
+        Integer array of shape (n_wavelengths, channel) with the number of
+        non-NaN replicates
+
+    wells: list[Well]
+        The replicate wells
+    '''
+    def __init__(self, analyte, wavelengths, wavelength_labels, mean, std, sem, count, wells):
+        self.analyte = analyte
+        self.wavelengths = wavelengths
+        self.wavelength_labels = wavelength_labels
+        self.mean = mean
+        self.std = std
+        self.sem = sem
+        self.count = count
+        self.wells = wells
+
+    def __repr__(self) -> str:
+        return f'ReplicateStatistics({self.analyte!r}, {len(self.wells)} wells)'
+
+    def to_well(self) -> Well:
+        '''
+        The average Well of the replicates like GetAverageWell. Its CD and
+        ABS are the mean spectra and its CD_PER_ABS is the mean CD divided by
+        the mean ABS.
+        '''
+        spectra = np.empty((len(self.wavelengths), N_CHANNELS), dtype=np.float64)
+        spectra[:, CD] = self.mean[:, CD]
+        spectra[:, ABS] = self.mean[:, ABS]
+        with np.errstate(divide='ignore', invalid='ignore'):
+            spectra[:, CD_PER_ABS] = spectra[:, CD] / spectra[:, ABS]
+        return Well(
+            spectra,
+            self.wavelengths,
+            'Average',
+            parent_scanfile=None,
+            analyte_name=f'{self.analyte}_avg',
+            wavelength_labels=self.wavelength_labels)
+
+@Staged('average')
+def AggregateReplicates(
+    wells,
+    ddof: int = 1,
+    key = None) -> dict:
+    '''
+    Computes the mean, standard deviation, standard error of the mean and
+    count of every analyte at every wavelength and channel in one grouped
+    reduction over the spectra of all wells.
+
+    Parameters
+    ----------
+    wells: list[Well] | EKKOScanSummary | EKKOCorpus | list[EKKOScanSummary]
+        Wells to aggregate. Wells without an analyte are skipped.
+
+    ddof: int
+        Delta degrees of freedom of the standard deviation. With the default
+        of 1, the std of a single replicate is NaN.
+
+    key: callable
+        Returns the group of a Well. Defaults to its analyte.
+
+    Returns
+    ----------
+    dict[str, ReplicateStatistics]
+        Statistics keyed by analyte (or key). Call to_well() on them to get
+        the averaged wells.
+    '''
+    if key is None:
+        key = lambda well: well.analyte
+
+    wells, spectra = _wells_and_spectra(wells)
+
+    # Wells are aggregated grid by grid, and every group must be measured on one grid
+    groups, rows_by_grid, grid_of_group = {}, {}, {}
+    for i, well in enumerate(wells):
+        group = key(well)
+        if group is None:
+            continue
+        grid = tuple(well.wavelength_labels)
+        if grid_of_group.setdefault(group, grid) != grid:
+            raise ValueError(f'The replicates of {group} were not measured at the same wavelengths. Align them with EKKOTools.resample.ResampleWells first.')
+        groups[i] = group
+        rows_by_grid.setdefault(grid, []).append(i)
+
+    results = {}
+    for rows in rows_by_grid.values():
+        results.update(_aggregate([wells[i] for i in rows], _select(spectra, rows), [groups[i] for i in rows], ddof))
+    return results
+
+def _select(spectra, rows: list[int]) -> np.ndarray:
+    if isinstance(spectra, np.ndarray):
+        return spectra if len(rows) == len(spectra) else spectra[rows]
+    return np.stack([spectra[i] for i in rows])
+
+def _wells_and_spectra(wells) -> tuple:
+    '''
+    Flat list of wells and their current spectra. The spectra of summaries
+    are taken from their plate arrays, those of single wells are stacked.
+    '''
+    if isinstance(wells, (Well, EKKOScanSummary)):
+        wells = [wells]
+    elif hasattr(wells, 'summaries'):
+        wells = wells.summaries
+    wells = list(wells)
+
+    if wells and all(isinstance(x, EKKOScanSummary) for x in wells):
+        flat = [well for summary in wells for well in summary.wells]
+        blocks = [summary.get_current_spectra() for summary in wells]
+        # Plates with different grids cannot be concatenated
+        if len({block.shape[1] for block in blocks}) == 1:
+            return flat, np.concatenate(blocks)
+        return flat, [row for block in blocks for row in block]
+
+    return wells, [well.get_current_spectra() for well in wells]
+
+def _aggregate(wells: list[Well], spectra: np.ndarray, groups: list, ddof: int) -> dict:
+    # Sort the wells by group so that every group is a contiguous block for np.add.reduceat
+    ids = {}
+    inverse = np.array([ids.setdefault(group, len(ids)) for group in groups], dtype=np.intp)
+    keys = list(ids)
+    order = np.argsort(inverse, kind='stable')
+    inverse = inverse[order]
+    starts = np.flatnonzero(np.r_[True, inverse[1:] != inverse[:-1]])
+    sorted_spectra = spectra[order]
+
+    finite = np.isfinite(sorted_spectra)
+    count = np.add.reduceat(finite.astype(np.intp), starts, axis=0)
+    total = np.add.reduceat(np.where(finite, sorted_spectra, 0.0), starts, axis=0)
+    with np.errstate(divide='ignore', invalid='ignore'):
+        mean = total / count
+        deviations = np.where(finite, sorted_spectra - mean[inverse], 0.0)
+        std = np.sqrt(np.add.reduceat(deviations ** 2, starts, axis=0) / (count - ddof))
+        sem = std / np.sqrt(count)
+    std[count - ddof <= 0] = np.nan
+    sem[count - ddof <= 0] = np.nan
+
+    results = {}
+    ends = np.r_[starts[1:], len(order)]
+    for k, (start, end) in enumerate(zip(starts, ends)):
+        members = [wells[i] for i in order[start:end]]
+        group = keys[inverse[start]]
+        results[group] = ReplicateStatistics(
+            group,
+            members[0].wavelengths,
+            members[0].wavelength_labels,
+            mean[k],
+            std[k],
+            sem[k],
+            count[k],
+            members)
+    return results
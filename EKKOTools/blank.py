@@ -0,0 +1,185 @@
+'''
+Blank (solvent or host) correction of whole plates.
+'''
+from pathlib import Path
+
+import numpy as np
+
+from .EKKOScanFormats import Well, EKKOScanSummary
+from .parsing import CD, ABS, CD_PER_ABS
+
+# Ways of grouping the wells of a plate with their blanks
+BLANK_GROUPS = ['plate', 'row', 'column']
+
+class Blank():
+    '''
+    Record of the blank which was subtracted from a well (see Well.blank).
+    All wells corrected with the same blank wells share one Blank.
+
+    Attributes
+    ----------
+    file: Path
+        ScanSummary file of the blank wells
+
+    wells: tuple[str]
+        Labels of the blank wells which were averaged
+
+    spectra: np.ndarray
+        (n_wavelengths, channel) array of the averaged blank. Only its CD
+        and ABS channels are subtracted.
+    '''
+    __slots__ = ('file', 'wells', 'spectra')
+
+    def __init__(self, file: Path, wells: tuple, spectra: np.ndarray):
+        self.file = file
+        self.wells = wells
+        self.spectra = spectra
+
+    def __repr__(self) -> str:
+        return f"Blank({getattr(self.file, 'name', self.file)}, {', '.join(self.wells)})"
+
+def BlankCorrectWells(
+    scan_summaries,
+    analyte: str = None,
+    wells: list[str] = None,
+    by: str = 'plate',
+    reference = None) -> list[Well]:
+    '''
+    Subtracts blanks from the CD and ABS spectra of every sample well of
+    plates and recomputes CD_PER_ABS from the corrected spectra. The
+    corrected spectra are assigned to the CD, ABS and CD_PER_ABS attributes
+    of the wells, and Well.blank records which blank was applied.
+
+    The corrected spectra are the current spectra of the wells, which every
+    function of EKKOTools works on (Well.get_spectrum, get_current_spectra
+    and everything built on them). Only the measured data in the plate
+    array (Well.spectra, EKKOScanSummary.spectra) and the get_CD, get_abs
+    and get_CD_per_abs methods of the wells still hold the uncorrected
+    values.
+
+    Each plate is corrected in one array operation. The blank of a group
+    of wells is the mean of its blank wells. All plates are checked before
+    the first one is corrected, so no well is changed if a ValueError is
+    raised.
+
+    Parameters
+    ----------
+    scan_summaries: EKKOScanSummary | EKKOCorpus | list[EKKOScanSummary]
+        Plates to correct
+
+    analyte: str
+        Analyte of the blank wells (e.g. 'DMSO')
+
+    wells: list[str]
+        Labels of the blank wells (e.g. ['A12', 'B12']). Can be combined
+        with analyte.
+
+    by: str
+        'plate' subtracts the mean of all blank wells of the plate from every
+        sample well. 'row' and 'column' subtract the mean of the blank wells
+        in the same row or column of the plate.
+
+    reference: EKKOScanSummary | Path
+        Plate which holds the blank wells. By default the blank wells are
+        taken from the plate which is corrected.
+
+    Returns
+    ----------
+    list[Well]
+        Sample wells which were not corrected because their group has no
+        blank well
+    '''
+    if analyte is None and wells is None:
+        raise ValueError('The blank wells must be chosen by analyte and/or wells')
+    if by not in BLANK_GROUPS:
+        raise ValueError(f'by must be one of {BLANK_GROUPS}, not {by}')
+
+    if isinstance(scan_summaries, EKKOScanSummary):
+        scan_summaries = [scan_summaries]
+    if reference is not None and not isinstance(reference, EKKOScanSummary):
+        reference = EKKOScanSummary(reference)
+
+    # Every plate is checked before any well is changed, so that an error
+    # leaves all plates as they were instead of half of them corrected
+    uncorrected, corrections, seen = [], [], set()
+    for summary in scan_summaries:
+        if id(summary) in seen:
+            raise ValueError(f'{summary.file.name} was passed more than once')
+        seen.add(id(summary))
+        correction, skipped = _plan_correction(summary, analyte, wells, by, reference)
+        uncorrected.extend(skipped)
+        if correction is not None:
+            corrections.append((summary, correction))
+
+    for summary, correction in corrections:
+        _apply_correction(summary, *correction)
+    return uncorrected
+
+def _is_blank(well: Well, analyte: str, wells: list[str]) -> bool:
+    return (analyte is not None and well.analyte == analyte) or (wells is not None and well.name in wells)
+
+def _group(summary: EKKOScanSummary, well: Well, by: str):
+    if by == 'plate':
+        return 0
+    row, column = summary.plate.position(well.name)
+    return row if by == 'row' else column
+
+def _plan_correction(
+    summary: EKKOScanSummary,
+    analyte: str,
+    wells: list[str],
+    by: str,
+    reference: EKKOScanSummary) -> tuple[tuple, list[Well]]:
+    '''
+    Checks a plate and returns ((samples, sample_groups, means, blanks), uncorrected)
+    for _apply_correction without changing any well. The first item is None
+    if no well of the plate is corrected.
+    '''
+    source = summary if reference is None else reference
+    if source.wavelength_labels != summary.wavelength_labels:
+        raise ValueError(f'The blank plate {source.file.name} was not measured at the wavelengths of {summary.file.name}')
+
+    # Mean blank of every group
+    blank_rows = {}
+    for i, well in enumerate(source.wells):
+        if _is_blank(well, analyte, wells):
+            blank_rows.setdefault(_group(source, well, by), []).append(i)
+    if not blank_rows:
+        return None, list(summary.wells)
+
+    source_spectra = source.get_current_spectra()
+    groups = list(blank_rows)
+    means = np.stack([np.nanmean(source_spectra[blank_rows[g]], axis=0) for g in groups])
+    blanks = [Blank(source.file, tuple(source.wells[i].name for i in blank_rows[g]), means[k]) for k, g in enumerate(groups)]
+
+    # Group index of every sample well, -1 if its group has no blank
+    group_index = {g: k for k, g in enumerate(groups)}
+    samples, sample_groups, uncorrected = [], [], []
+    for i, well in enumerate(summary.wells):
+        if reference is None and _is_blank(well, analyte, wells):
+            continue
+        if well.blank is not None:
+            raise ValueError(f'Well {well.name} of {summary.file.name} was already corrected with {well.blank}')
+        k = group_index.get(_group(summary, well, by), -1)
+        if k < 0:
+            uncorrected.append(well)
+        else:
+            samples.append(i)
+            sample_groups.append(k)
+    if not samples:
+        return None, uncorrected
+
+    return (samples, np.asarray(sample_groups), means, blanks), uncorrected
+
+def _apply_correction(summary: EKKOScanSummary, samples: list[int], sample_groups: np.ndarray, means: np.ndarray, blanks: list[Blank]) -> None:
+    '''Subtracts the blanks planned by _plan_correction from the sample wells of a plate'''
+    corrected = summary.get_current_spectra()[samples] - means[sample_groups]
+    with np.errstate(divide='ignore', invalid='ignore'):
+        corrected[:, :, CD_PER_ABS] = corrected[:, :, CD] / corrected[:, :, ABS]
+
+    for i, k, spectra in zip(samples, sample_groups, corrected):
+        well = summary.wells[i]
+        well.CD = spectra[:, CD]
+        well.ABS = spectra[:, ABS]
+        well.CD_PER_ABS = spectra[:, CD_PER_ABS]
+        well._blank = blanks[k]
@@ -0,0 +1,250 @@
+'''
+Persistent on-disk cache of parsed EKKO ScanSummary files.
+
+Each entry is a single uncompressed .npz file holding the parsed spectra, the
+wavelength labels and the metadata of one .cdxs file together with the analyte
+map which was read from its scan key. Entries are keyed by a fingerprint of
+the path, size and modification time of the .cdxs file and of its scan key,
+so editing either file invalidates the entry.
+'''
+import os
+import json
+import hashlib
+import tempfile
+import threading
+import numpy as np
+from collections import OrderedDict
+from functools import lru_cache
+from pathlib import Path
+
+from .parsing import ParsedScanSummary
+
+# Increment when the layout of the cache entries changes
+CACHE_VERSION = 1
+
+DEFAULT_CACHE_DIR = Path('~/.cache/EKKOTools').expanduser()
+
+# Environment variable which overrides DEFAULT_CACHE_DIR
+CACHE_DIR_VARIABLE = 'EKKOTOOLS_CACHE_DIR'
+
+class ScanSummaryCache():
+    '''
+    Directory of parsed ScanSummary files which is used by EKKOScanSummary
+    to skip parsing files which have been read before.
+
+    Parameters
+    ----------
+    directory: Path
+        Folder in which the entries are stored. Defaults to the
+        EKKOTOOLS_CACHE_DIR environment variable or ~/.cache/EKKOTools
+
+    max_bytes: int
+        Upper bound on the total size of the entries. The least recently
+        used entries are evicted once it is exceeded. None disables eviction.
+
+    hash_contents: bool
+        Adds a SHA-256 of the file contents to the fingerprint. This reads
+        every file on lookup but catches edits which preserve size and mtime.
+
+    The size and recency of every entry are kept in an in-memory index which
+    is read from the directory once, on first use, so put, invalidate and
+    evict do not scan the directory. Entries written by other processes
+    after that are added to the index when they are hit. The index is
+    guarded by a lock, so one cache can be shared by the threads of a
+    thread pool.
+    '''
+    def __init__(
+        self,
+        directory: Path = None,
+        max_bytes: int = 2 * 1024**3,
+        hash_contents: bool = False):
+        if directory is None:
+            directory = os.environ.get(CACHE_DIR_VARIABLE, DEFAULT_CACHE_DIR)
+        self.directory = Path(directory)
+        self.max_bytes = max_bytes
+        self.hash_contents = hash_contents
+        self._lock = threading.RLock()
+        self._reset_index()
+
+    @classmethod
+    def default(cls):
+        '''Shared cache in the default directory, used for cache=True'''
+        return _default_cache(str(os.environ.get(CACHE_DIR_VARIABLE, DEFAULT_CACHE_DIR)))
+
+    def __getstate__(self) -> dict:
+        # Worker processes rebuild the index from the directory
+        state = self.__dict__.copy()
+        state.update(_entries=None, _files=None, _total=0)
+        del state['_lock']
+        return state
+
+    def __setstate__(self, state: dict) -> None:
+        self.__dict__.update(state)
+        self._lock = threading.RLock()
+
+    def get(self, file: Path, scan_key: Path = None) -> tuple:
+        '''
+        Returns the cached (ParsedScanSummary, analyte_map) of a file or None
+        if the file has not been cached or has changed since.
+        '''
+        entry = self._entry_path(file, scan_key)
+        try:
+            with np.load(entry, allow_pickle=False) as data:
+                spectra = data['spectra']
+                meta = json.loads(data['meta'].tobytes().decode('utf-8'))
+        except (OSError, KeyError, ValueError):
+            return None
+
+        # Mark the entry as recently used for the eviction policy
+        try:
+            os.utime(entry)
+        except OSError:
+            pass
+        with self._lock:
+            self._touch(entry)
+
+        parsed = ParsedScanSummary(
+            file=Path(file),
+            header=meta['header'],
+            well_names=meta['well_names'],
+            wavelength_labels=meta['wavelength_labels'],
+            spectra=spectra,
+            well_info=meta['well_info'])
+        return parsed, meta['analyte_map']
+
+    def put(self, file: Path, scan_key: Path, parsed: ParsedScanSummary, analyte_map: dict) -> None:
+        '''Stores the parsed contents of a file and evicts entries if the cache is full'''
+        self.directory.mkdir(parents=True, exist_ok=True)
+
+        # Older entries of the same file can never be hit again
+        self.invalidate(file)
+
+        meta = json.dumps({
+            'header': parsed.header,
+            'well_names': parsed.well_names,
+            'wavelength_labels': parsed.wavelength_labels,
+            'well_info': parsed.well_info,
+            'analyte_map': {str(k): _native(v) for k, v in analyte_map.items()},
+        }).encode('utf-8')
+
+        entry = self._entry_path(file, scan_key)
+        fd, tmp = tempfile.mkstemp(dir=self.directory, suffix='.tmp')
+        with os.fdopen(fd, 'wb') as f:
+            np.savez(f, spectra=parsed.spectra, meta=np.frombuffer(meta, dtype=np.uint8))
+        os.replace(tmp, entry)
+
+        with self._lock:
+            self._add(entry.name, os.stat(entry).st_size)
+            if self.max_bytes is not None and self._total > self.max_bytes:
+                self.evict(self.max_bytes)
+
+    def invalidate(self, file: Path) -> None:
+        '''Removes every entry of a file'''
+        with self._lock:
+            self._load_index()
+            for name in list(self._files.get(_path_hash(file), ())):
+                (self.directory / name).unlink(missing_ok=True)
+                self._discard(name)
+
+    def evict(self, max_bytes: int) -> None:
+        '''Removes the least recently used entries until the cache is at most max_bytes'''
+        with self._lock:
+            self._load_index()
+            while self._entries and self._total > max_bytes:
+                name = next(iter(self._entries))
+                (self.directory / name).unlink(missing_ok=True)
+                self._discard(name)
+
+    def clear(self) -> None:
+        '''Removes every entry in the cache'''
+        with self._lock:
+            for entry in self.directory.glob('*.npz'):
+                entry.unlink(missing_ok=True)
+            self._reset_index()
+
+    @property
+    def size(self) -> int:
+        '''Total size of the entries in bytes'''
+        with self._lock:
+            self._load_index()
+            return self._total
+
+    # The methods below expect the caller to hold self._lock
+
+    def _reset_index(self) -> None:
+        # Entry name -> size in bytes, least recently used first. None until loaded
+        self._entries = None
+        # Path hash of a file -> names of its entries
+        self._files = None
+        self._total = 0
+
+    def _load_index(self) -> None:
+        if self._entries is not None:
+            return
+        entries = []
+        for entry in self.directory.glob('*.npz'):
+            try:
+                stat = entry.stat()
+            except OSError:
+                continue
+            entries.append((stat.st_mtime, entry.name, stat.st_size))
+
+        self._entries, self._files, self._total = OrderedDict(), {}, 0
+        for _, name, size in sorted(entries):
+            self._add(name, size)
+
+    def _add(self, name: str, size: int) -> None:
+        self._load_index()
+        self._discard(name)
+        self._entries[name] = size
+        self._files.setdefault(name.partition('-')[0], set()).add(name)
+        self._total += size
+
+    def _discard(self, name: str) -> None:
+        size = self._entries.pop(name, None)
+        if size is None:
+            return
+        self._total -= size
+        names = self._files[name.partition('-')[0]]
+        names.discard(name)
+        if not names:
+            del self._files[name.partition('-')[0]]
+
+    def _touch(self, entry: Path) -> None:
+        self._load_index()
+        if entry.name in self._entries:
+            self._entries.move_to_end(entry.name)
+        else:
+            try:
+                self._add(entry.name, os.stat(entry).st_size)
+            except OSError:
+                pass
+
+    def _entry_path(self, file: Path, scan_key: Path = None) -> Path:
+        fingerprint = [CACHE_VERSION, self._fingerprint(file)]
+        if scan_key is not None:
+            fingerprint.append(self._fingerprint(scan_key))
+        digest = hashlib.sha1(repr(fingerprint).encode('utf-8')).hexdigest()
+        return self.directory / f'{_path_hash(file)}-{digest}.npz'
+
+    def _fingerprint(self, file: Path) -> tuple:
+        stat = os.stat(file)
+        fingerprint = (str(Path(file).resolve()), stat.st_size, stat.st_mtime_ns)
+        if self.hash_contents:
+            digest = hashlib.sha256()
+            with open(file, 'rb') as f:
+                for block in iter(lambda: f.read(1024**2), b''):
+                    digest.update(block)
+            fingerprint += (digest.hexdigest(),)
+        return fingerprint
+
+@lru_cache(maxsize=None)
+def _default_cache(directory: str) -> ScanSummaryCache:
+    return ScanSummaryCache(directory)
+
+def _path_hash(file: Path) -> str:
+    return hashlib.sha1(str(Path(file).resolve()).encode('utf-8')).hexdigest()
+
+def _native(value):
+    '''Converts NumPy scalars from pandas to their Python equivalent for json'''
+    return value.item() if isinstance(value, np.generic) else value
@@ -0,0 +1,221 @@
+'''
+Collections of EKKOScanSummary objects with indexes for fast lookups.
+'''
+import bisect
+from datetime import date, datetime
+from pathlib import Path
+
+from .EKKOScanFormats import Well, EKKOScanSummary
+
+# Formats tried when interpreting EKKOScanSummary.date
+DATE_FORMATS = ['%m/%d/%Y', '%m/%d/%y', '%Y-%m-%d', '%d.%m.%Y']
+
+class EKKOCorpus():
+    '''
+    Collection of EKKOScanSummary objects which keeps an inverted index of
+    analyte -> (summary, well) and secondary indexes of the summaries by
+    date, scan_process and well_plate_type. The indexes are updated
+    incrementally when summaries are added, removed or replaced, so the
+    cost of an update depends on the size of the summary, not the corpus.
+
+    Instantiate with a list of EKKOScanSummary objects or use
+    EKKOCorpus.from_folder.
+
+    If the analyte of a Well is changed after it was added, call reindex().
+    '''
+    def __init__(self, scan_summaries: list[EKKOScanSummary] = None):
+        # Summaries by a slot number which never changes while they are in
+        # the corpus. The indexes refer to the slots and map them (as dict
+        # keys in insertion order) to the wells or to None.
+        self._slots = {}
+        self._next_slot = 0
+        self._analytes = {}
+        self._indexed_analytes = {}
+        self._dates = {}
+        self._sorted_dates = []
+        self._scan_processes = {}
+        self._well_plate_types = {}
+        self._files = {}
+
+        if scan_summaries is not None:
+            self.extend(scan_summaries)
+
+    @classmethod
+    def from_folder(cls, folder: Path, **kwargs):
+        '''
+        Creates a corpus from all .cdxs files of a folder. Keyword arguments
+        are handed to GetAllEKKOScanSummaries (n_jobs, cache, ...).
+        '''
+        from .utilities import GetAllEKKOScanSummaries
+        return cls(GetAllEKKOScanSummaries(folder, **kwargs))
+
+    def __len__(self) -> int:
+        return len(self._slots)
+
+    def __iter__(self):
+        return iter(self._slots.values())
+
+    def __contains__(self, summary: EKKOScanSummary) -> bool:
+        return self._key(summary) in self._files
+
+    def add(self, summary: EKKOScanSummary) -> None:
+        '''
+        Adds a summary to the corpus and its indexes. A summary of a file
+        which is already in the corpus replaces the old one.
+        '''
+        if summary in self:
+            self.remove(summary)
+
+        i = self._next_slot
+        self._next_slot += 1
+        self._slots[i] = summary
+        self._files[self._key(summary)] = i
+        self._index(i)
+
+    def extend(self, scan_summaries: list[EKKOScanSummary]) -> None:
+        '''Adds several summaries to the corpus'''
+        for summary in scan_summaries:
+            self.add(summary)
+
+    def remove(self, summary: EKKOScanSummary) -> None:
+        '''Removes the summary of a file from the corpus'''
+        i = self._files.pop(self._key(summary))
+        self._unindex(i)
+        del self._slots[i]
+
+    def reindex(self) -> None:
+        '''Rebuilds every index from the summaries'''
+        summaries = self.summaries
+        self.__init__()
+        self.extend(summaries)
+
+    @property
+    def summaries(self) -> list[EKKOScanSummary]:
+        '''All EKKOScanSummary objects in the order they were added'''
+        return list(self._slots.values())
+
+    @property
+    def analytes(self) -> set[str]:
+        '''Set of all analyte strings in the corpus'''
+        return set(self._analytes)
+
+    @property
+    def wells(self) -> list[Well]:
+        '''All Well objects in the corpus'''
+        return [well for summary in self._slots.values() for well in summary.wells]
+
+    def get_locations(self, analyte: str) -> list[tuple[EKKOScanSummary, Well]]:
+        '''Returns (EKKOScanSummary, Well) pairs of every well which holds the analyte'''
+        return [(self._slots[i], well) for i, wells in self._analytes.get(analyte, {}).items() for well in wells]
+
+    def get_wells(self, analyte: str) -> list[Well]:
+        '''Returns every Well which holds the analyte'''
+        return [well for wells in self._analytes.get(analyte, {}).values() for well in wells]
+
+    def get_summaries_by_date(self, date: str) -> list[EKKOScanSummary]:
+        '''Returns the summaries whose date string equals date'''
+        return [self._slots[i] for i in self._dates.get(date, {})]
+
+    def get_summaries_between(self, start: date, end: date) -> list[EKKOScanSummary]:
+        '''
+        Returns the summaries measured from start to end (inclusive). Both
+        may be a datetime.date or a string in one of DATE_FORMATS.
+        '''
+        start, end = _parse_date(start), _parse_date(end)
+        lo = bisect.bisect_left(self._sorted_dates, (start, -1))
+        hi = bisect.bisect_right(self._sorted_dates, (end, self._next_slot))
+        return [self._slots[i] for _, i in self._sorted_dates[lo:hi]]
+
+    def get_summaries_by_scan_process(self, scan_process: str) -> list[EKKOScanSummary]:
+        '''Returns the summaries measured with a scan process'''
+        return [self._slots[i] for i in self._scan_processes.get(scan_process, {})]
+
+    def get_summaries_by_well_plate_type(self, well_plate_type: str) -> list[EKKOScanSummary]:
+        '''Returns the summaries measured on a type of well plate'''
+        return [self._slots[i] for i in self._well_plate_types.get(well_plate_type, {})]
+
+    def query(
+        self,
+        analyte: str = None,
+        date: str = None,
+        scan_process: str = None,
+        well_plate_type: str = None) -> list[Well]:
+        '''
+        Returns the wells which match all of the given criteria. Criteria
+        which are None are ignored.
+        '''
+        summaries = None
+        for index, key in ((self._dates, date), (self._scan_processes, scan_process), (self._well_plate_types, well_plate_type)):
+            if key is None:
+                continue
+            matches = set(index.get(key, {}))
+            summaries = matches if summaries is None else summaries & matches
+
+        if analyte is not None:
+            return [well for i, wells in self._analytes.get(analyte, {}).items() if summaries is None or i in summaries for well in wells]
+
+        if summaries is None:
+            return self.wells
+
+        return [well for i in sorted(summaries) for well in self._slots[i].wells]
+
+    def _index(self, i: int) -> None:
+        summary = self._slots[i]
+
+        for well in summary.wells:
+            self._analytes.setdefault(well.analyte, {}).setdefault(i, []).append(well)
+        # The analytes at indexing time, in case a well's analyte is changed later
+        self._indexed_analytes[i] = {well.analyte for well in summary.wells}
+
+        self._dates.setdefault(summary.date, {})[i] = None
+        self._scan_processes.setdefault(summary.scan_process, {})[i] = None
+        self._well_plate_types.setdefault(summary.well_plate_type, {})[i] = None
+
+        try:
+            bisect.insort(self._sorted_dates, (_parse_date(summary.date), i))
+        except ValueError:
+            # Dates which cannot be interpreted are still found by get_summaries_by_date
+            pass
+
+    def _unindex(self, i: int) -> None:
+        summary = self._slots[i]
+
+        for analyte in self._indexed_analytes.pop(i):
+            _discard(self._analytes, analyte, i)
+        _discard(self._dates, summary.date, i)
+        _discard(self._scan_processes, summary.scan_process, i)
+        _discard(self._well_plate_types, summary.well_plate_type, i)
+
+        try:
+            key = (_parse_date(summary.date), i)
+        except ValueError:
+            return
+        j = bisect.bisect_left(self._sorted_dates, key)
+        if j < len(self._sorted_dates) and self._sorted_dates[j] == key:
+            del self._sorted_dates[j]
+
+    @staticmethod
+    def _key(summary: EKKOScanSummary) -> str:
+        return str(Path(summary.file).resolve())
+
+def _discard(index: dict, key, i: int) -> None:
+    '''Removes slot i from index[key] and drops the key once it is empty'''
+    slots = index.get(key)
+    if slots is None:
+        return
+    slots.pop(i, None)
+    if not slots:
+        del index[key]
+
+def _parse_date(d) -> date:
+    '''Interprets a date string in one of DATE_FORMATS'''
+    if isinstance(d, datetime):
+        return d.date()
+    if isinstance(d, date):
+        return d
+    for fmt in DATE_FORMATS:
+        try:
+            return datetime.strptime(d, fmt).date()
+        except ValueError:
+            pass
+    raise ValueError(f'Date {d} is not in a recognized format')
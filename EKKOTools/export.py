@@ -0,0 +1,252 @@
+'''
+Bulk export of EKKOScanSummary objects to columnar formats.
+'''
+import itertools
+import warnings
+from concurrent.futures import ProcessPoolExecutor
+from pathlib import Path
+
+import numpy as np
+
+from .EKKOScanFormats import EKKOScanSummary
+from .cache import _native
+from .corpus import _parse_date
+from .instrument import Staged
+from .parsing import CD, ABS, CD_PER_ABS
+from .utilities import IterEKKOScanSummaries
+
+# Names of the spectrum columns of each channel
+CHANNEL_COLUMNS = {CD: 'CD', ABS: 'ABS', CD_PER_ABS: 'CD_PER_ABS'}
+
+# Metadata columns written for every well
+METADATA_COLUMNS = ['file', 'date', 'scan_process', 'well_plate_type', 'well', 'analyte']
+
+@Staged('export.parquet')
+def WriteParquetDataset(
+    scan_summaries,
+    root: Path,
+    layout: str = 'long',
+    partition_cols: list[str] = ('scan_process',),
+    batch_size: int = 100,
+    overwrite: bool = False,
+    n_jobs: int = 1,
+    cache = None,
+    errors: str = 'raise') -> Path:
+    '''
+    Writes the CD, ABS and CD_PER_ABS spectra of every well to a
+    (hive-partitioned) Parquet dataset which can be read with
+    pandas.read_parquet(root) or pyarrow.dataset.dataset(root).
+
+    The summaries are converted and written batch_size at a time, so memory
+    use does not grow with the size of the corpus when a folder or a
+    generator of summaries is exported.
+
+    Parameters
+    ----------
+    scan_summaries: Path | EKKOCorpus | Iterable[EKKOScanSummary]
+        Summaries to export. A folder is parsed batch by batch with
+        IterEKKOScanSummaries.
+
+    root: Path
+        Directory of the dataset
+
+    layout: str
+        'long' writes one row per well and wavelength with a wavelength
+        column and one column per channel. 'wide' writes one row per well
+        with the columns CD_<wl>, ABS_<wl> and CD_PER_ABS_<wl>. All summaries
+        of a wide dataset must share the wavelength grid of the first one.
+
+    partition_cols: list[str]
+        Metadata columns (see METADATA_COLUMNS) used to partition the dataset
+        into directories. Empty for a single directory of files.
+
+    batch_size: int
+        Number of summaries converted to one Arrow record batch
+
+    overwrite: bool
+        Replace files of an existing dataset in root. By default an error
+        is raised if root already holds files.
+
+    n_jobs, cache:
+        Handed to IterEKKOScanSummaries when a folder is exported
+
+    errors: str
+        'raise', 'warn' or 'ignore' files of a folder which cannot be parsed
+
+    Returns
+    ----------
+    Path
+        The root of the dataset
+    '''
+    try:
+        import pyarrow as pa
+        import pyarrow.dataset as ds
+    except ImportError as e:
+        raise ImportError('WriteParquetDataset requires pyarrow (pip install pyarrow)') from e
+
+    if layout not in ('long', 'wide'):
+        raise ValueError(f"layout must be 'long' or 'wide', not {layout}")
+    if errors not in ('raise', 'warn', 'ignore'):
+        raise ValueError(f"errors must be 'raise', 'warn' or 'ignore', not {errors}")
+    partition_cols = list(partition_cols or [])
+    for column in partition_cols:
+        if column not in METADATA_COLUMNS:
+            raise ValueError(f'Can only partition by the metadata columns {METADATA_COLUMNS}, not {column}')
+
+    root = Path(root)
+
+    pool = _folder_pool(scan_summaries, n_jobs)
+
+    try:
+        batches = _summary_batches(scan_summaries, batch_size, pool, cache, errors)
+        first = next(batches, None)
+        if first is None:
+            raise ValueError('There are no scan summaries to export')
+
+        wavelength_labels = list(first[0].wavelength_labels)
+        schema = _schema(pa, layout, wavelength_labels)
+        convert = _long_batch if layout == 'long' else _wide_batch
+
+        def record_batches():
+            for batch in itertools.chain([first], batches):
+                yield pa.RecordBatch.from_pydict(convert(pa, batch, wavelength_labels), schema=schema)
+
+        ds.write_dataset(
+            record_batches(),
+            root,
+            schema=schema,
+            format='parquet',
+            partitioning=partition_cols or None,
+            partitioning_flavor='hive' if partition_cols else None,
+            basename_template='part-{i}.parquet',
+            existing_data_behavior='delete_matching' if overwrite else 'error')
+    finally:
+        if pool is not None:
+            pool.shutdown(cancel_futures=True)
+
+    return root
+
+def _folder_pool(scan_summaries, n_jobs: int) -> ProcessPoolExecutor:
+    '''One pool for all batches of a folder which is parsed with n_jobs workers'''
+    if isinstance(scan_summaries, (str, Path)) and n_jobs != 1:
+        return ProcessPoolExecutor(max_workers=n_jobs if n_jobs is not None and n_jobs > 0 else None)
+    return None
+
+def _summary_batches(scan_summaries, batch_size: int, pool, cache, errors: str):
+    '''Yields lists of batch_size summaries. Folders are parsed one batch at a time.'''
+    if isinstance(scan_summaries, (str, Path)):
+        folder = Path(scan_summaries)
+        if not folder.is_dir():
+            raise NotADirectoryError('Can only find scan summaries within a directory')
+        files = sorted(folder.glob('*.cdxs'))
+        for i in range(0, len(files), batch_size):
+            batch = []
+            results = IterEKKOScanSummaries(files[i:i + batch_size], executor=pool if pool is not None else 'process', cache=cache)
+            for file, summary, error in results:
+                if error is None:
+                    batch.append(summary)
+                elif errors == 'raise':
+                    raise error
+                elif errors == 'warn':
+                    warnings.warn(f'Could not read {file.name}: {error}')
+            if batch:
+                yield batch
+        return
+
+    if isinstance(scan_summaries, EKKOScanSummary):
+        scan_summaries = [scan_summaries]
+
+    batch = []
+    for summary in scan_summaries:
+        batch.append(summary)
+        if len(batch) == batch_size:
+            yield batch
+            batch = []
+    if batch:
+        yield batch
+
+def _schema(pa, layout: str, wavelength_labels: list[str]):
+    string = pa.dictionary(pa.int32(), pa.string())
+    fields = [
+        pa.field('file', string),
+        pa.field('date', pa.date32()),
+        pa.field('scan_process', string),
+        pa.field('well_plate_type', string),
+        pa.field('well', string),
+        pa.field('analyte', string),
+    ]
+    if layout == 'long':
+        fields.append(pa.field('wavelength', pa.float64()))
+        fields.extend(pa.field(name, pa.float64()) for name in CHANNEL_COLUMNS.values())
+    else:
+        fields.extend(pa.field(f'{name}_{wl}', pa.float64()) for name in CHANNEL_COLUMNS.values() for wl in wavelength_labels)
+    return pa.schema(fields)
+
+def _metadata(summary: EKKOScanSummary) -> dict:
+    try:
+        date = _parse_date(summary.date)
+    except (TypeError, ValueError):
+        date = None
+    return {
+        'file': str(summary.file),
+        'date': date,
+        'scan_process': summary.scan_process,
+        'well_plate_type': summary.well_plate_type}
+
+def _summary_spectra(summary: EKKOScanSummary, wavelength_labels: list[str] = None) -> np.ndarray:
+    '''(n_wells, n_wavelengths, channel) array of the current spectra of the wells of a summary'''
+    if wavelength_labels is not None and list(summary.wavelength_labels) != wavelength_labels:
+        raise ValueError(f'{summary.file} was not measured at the wavelengths of the first summary, which a wide dataset requires')
+    return summary.get_current_spectra()
+
+def _metadata_columns(pa, summaries: list[EKKOScanSummary], rows_per_well: list[int]) -> dict:
+    '''
+    Metadata columns of a batch with rows_per_well[i] rows for every well of
+    summaries[i]. Strings are dictionary encoded so that repeated values are
+    only held once.
+    '''
+    n_wells = [len(summary.wells) for summary in summaries]
+    summary_rows = np.repeat(np.arange(len(summaries), dtype=np.int32), np.multiply(n_wells, rows_per_well))
+    well_rows = np.repeat(np.arange(sum(n_wells), dtype=np.int32), np.repeat(rows_per_well, n_wells))
+
+    metadata = [_metadata(summary) for summary in summaries]
+    columns = {}
+    for name in ('file', 'scan_process', 'well_plate_type'):
+        columns[name] = pa.DictionaryArray.from_arrays(summary_rows, pa.array([m[name] for m in metadata], pa.string()))
+    columns['date'] = pa.array([m['date'] for m in metadata], pa.date32()).take(summary_rows)
+
+    wells = [well for summary in summaries for well in summary.wells]
+    columns['well'] = pa.DictionaryArray.from_arrays(well_rows, pa.array([well.name for well in wells], pa.string()))
+    analytes = [_analyte_label(well.analyte) for well in wells]
+    has_analyte = np.array([analyte is not None for analyte in analytes], dtype=bool)
+    columns['analyte'] = pa.DictionaryArray.from_arrays(
+        pa.array(well_rows, mask=~has_analyte[well_rows]),
+        pa.array([analyte if analyte is not None else '' for analyte in analytes], pa.string()))
+    return columns
+
+def _analyte_label(analyte) -> str:
+    '''
+    Analyte as a string for the analyte column. Scan keys read by pandas
+    can hold ints, floats and NaN, NaN and None become null.
+    '''
+    analyte = _native(analyte)
+    if analyte is None or (isinstance(analyte, float) and np.isnan(analyte)):
+        return None
+    return str(analyte)
+
+def _long_batch(pa, summaries: list[EKKOScanSummary], wavelength_labels: list[str]) -> dict:
+    spectra = [_summary_spectra(summary) for summary in summaries]
+    columns = _metadata_columns(pa, summaries, [block.shape[1] for block in spectra])
+    columns['wavelength'] = np.concatenate([np.tile(summary.wavelengths, len(block)) for summary, block in zip(summaries, spectra)])
+    for channel, name in CHANNEL_COLUMNS.items():
+        columns[name] = np.concatenate([block[:, :, channel].ravel() for block in spectra])
+    return columns
+
+def _wide_batch(pa, summaries: list[EKKOScanSummary], wavelength_labels: list[str]) -> dict:
+    spectra = [_summary_spectra(summary, wavelength_labels) for summary in summaries]
+    columns = _metadata_columns(pa, summaries, [1] * len(summaries))
+    spectra = np.concatenate(spectra)
+    for channel, name in CHANNEL_COLUMNS.items():
+        for i, wl in enumerate(wavelength_labels):
+            columns[f'{name}_{wl}'] = spectra[:, i, channel]
+    return columns
@@ -0,0 +1,184 @@
+'''
+Vectorized peak features (lambda max, extrema, zero crossings, band
+integrals and FWHM) of the spectra of many wells.
+'''
+from __future__ import annotations
+
+import numpy as np
+
+from .lazy import LazyModule
+from .aggregate import _wells_and_spectra, _select
+from .parsing import CD, ABS, CD_PER_ABS
+
+pd = LazyModule('pandas')
+
+# Channels of SpectralFeatures. CD_PER_ABS is the dissymmetry (g-)factor.
+FEATURE_CHANNELS = {'cd': CD, 'abs': ABS, 'g': CD_PER_ABS}
+
+FEATURES = ['lambda_max', 'extremum', 'zero_crossings', 'integral', 'fwhm']
+
+def SpectralFeatures(
+    wells,
+    wl_range: list[float, float] = None,
+    channels: list[str] = ('cd', 'abs', 'g'),
+    bands: dict = None) -> pd.DataFrame:
+    '''
+    Table of peak features of the current spectra of every well. The
+    spectra of all wells measured on the same wavelengths are processed
+    as one array, so a corpus of 10k wells takes milliseconds. To screen
+    for the strongest Cotton effect:
+
+        features = SpectralFeatures(corpus, wl_range=[450, 650])
+        features.loc[features['cd_extremum'].abs().nlargest(10).index]
+
+    Parameters
+    ----------
+    wells: list[Well] | EKKOScanSummary | EKKOCorpus | list[EKKOScanSummary]
+        Wells to describe
+
+    wl_range: list[float, float]
+        Lowest and highest wavelength (inclusive) searched for the peak.
+        None uses all wavelengths.
+
+    channels: list[str]
+        Any of 'cd', 'abs' and 'g' (CD_PER_ABS)
+
+    bands: dict[str, list[float, float]]
+        Named wavelength ranges which are integrated in addition to wl_range,
+        e.g. {'soret': [400, 450]}
+
+    Returns
+    ----------
+    pd.DataFrame
+        One row per well with the columns file, well and analyte, and for
+        every channel
+            {channel}_lambda_max       wavelength of the largest |intensity|
+            {channel}_extremum         signed intensity at lambda_max
+            {channel}_zero_crossings   number of sign changes
+            {channel}_integral         trapezoidal integral over wl_range
+            {channel}_fwhm             full width at half of the extremum
+            {channel}_integral_{band}  integral over each band
+        Features of wells without finite values in the range are NaN.
+    '''
+    for channel in channels:
+        if channel not in FEATURE_CHANNELS:
+            raise ValueError(f'channels must be in {list(FEATURE_CHANNELS)}, not {channel}')
+    bands = {} if bands is None else bands
+
+    wells, spectra = _wells_and_spectra(wells)
+
+    rows_by_grid = {}
+    for i, well in enumerate(wells):
+        rows_by_grid.setdefault(tuple(well.wavelength_labels), []).append(i)
+
+    columns = {}
+    for rows in rows_by_grid.values():
+        wavelengths = np.asarray(wells[rows[0]].wavelengths, dtype=np.float64)
+        block = _select(spectra, rows)
+        for channel in channels:
+            values = block[:, :, FEATURE_CHANNELS[channel]]
+            features = _spectra_features(values, wavelengths, wl_range, bands)
+            for name, column in features.items():
+                columns.setdefault(f'{channel}_{name}', np.full(len(wells), np.nan))[rows] = column
+
+    table = pd.DataFrame({
+        'file': [getattr(well.parent_scanfile, 'name', well.parent_scanfile) for well in wells],
+        'well': [well.name for well in wells],
+        'analyte': [well.analyte for well in wells]})
+    for name, column in columns.items():
+        table[name] = column
+    return table
+
+def _window(wavelengths: np.ndarray, wl_range) -> slice:
+    '''Slice of the ascending wavelengths inside wl_range (inclusive)'''
+    if wl_range is None:
+        return slice(0, len(wavelengths))
+    lo, hi = min(wl_range), max(wl_range)
+    return slice(np.searchsorted(wavelengths, lo, side='left'), np.searchsorted(wavelengths, hi, side='right'))
+
+def _integral(y: np.ndarray, x: np.ndarray) -> np.ndarray:
+    if len(x) < 2:
+        return np.full(len(y), np.nan)
+    return np.trapezoid(np.where(np.isfinite(y), y, 0.0), x, axis=1)
+
+def _spectra_features(spectra: np.ndarray, wavelengths: np.ndarray, wl_range, bands: dict) -> dict:
+    '''Features of the (n_wells, n_wavelengths) spectra measured on wavelengths'''
+    # The range is found with searchsorted, which needs ascending wavelengths
+    if len(wavelengths) > 1 and not np.all(np.diff(wavelengths) > 0):
+        order = np.argsort(wavelengths, kind='stable')
+        wavelengths, spectra = wavelengths[order], spectra[:, order]
+
+    window = _window(wavelengths, wl_range)
+    x, y = wavelengths[window], np.asarray(spectra[:, window], dtype=np.float64)
+    n_wells, n = y.shape
+
+    finite = np.isfinite(y)
+    has_values = finite.any(axis=1)
+    magnitude = np.where(finite, np.abs(y), -1.0)
+    peak = magnitude.argmax(axis=1) if n else np.zeros(n_wells, dtype=np.intp)
+    wells = np.arange(n_wells)
+
+    features = {}
+    if n:
+        features['lambda_max'] = np.where(has_values, x[peak], np.nan)
+        features['extremum'] = np.where(has_values, y[wells, peak], np.nan)
+    else:
+        features['lambda_max'] = np.full(n_wells, np.nan)
+        features['extremum'] = np.full(n_wells, np.nan)
+
+    # Sign changes between consecutive non-zero points. The last non-zero
+    # sign is carried forward over zeros and NaN.
+    signs = np.sign(np.where(finite, y, 0.0))
+    index = np.where(signs != 0, np.arange(n), -1)
+    np.maximum.accumulate(index, axis=1, out=index)
+    carried = np.where(index >= 0, signs[wells[:, None], np.maximum(index, 0)], 0.0)
+    crossings = np.count_nonzero((carried[:, 1:] != carried[:, :-1]) & (carried[:, :-1] != 0), axis=1)
+    features['zero_crossings'] = np.where(has_values, crossings, np.nan)
+
+    features['integral'] = np.where(has_values, _integral(y, x), np.nan)
+    features['fwhm'] = _fwhm(y, x, peak, features['extremum'])
+
+    for band, band_range in bands.items():
+        band_window = _window(wavelengths, band_range)
+        band_values = np.asarray(spectra[:, band_window], dtype=np.float64)
+        integral = _integral(band_values, wavelengths[band_window])
+        integral[~np.isfinite(band_values).any(axis=1)] = np.nan
+        features[f'integral_{band}'] = integral
+
+    return features
+
+def _fwhm(y: np.ndarray, x: np.ndarray, peak: np.ndarray, extremum: np.ndarray) -> np.ndarray:
+    '''
+    Width of the contiguous region around the peak where the intensity has
+    the sign of the extremum and at least half of its magnitude. The edges
+    are interpolated linearly. NaN if the region reaches an end of x.
+    '''
+    n_wells, n = y.shape
+    if n < 3:
+        return np.full(n_wells, np.nan)
+    wells = np.arange(n_wells)
+
+    with np.errstate(invalid='ignore'):
+        # Oriented so that every peak is positive
+        s = np.where(np.isfinite(y), y * np.sign(extremum)[:, None], -np.inf)
+        half = np.abs(extremum) / 2
+        below = s < half[:, None]
+
+    index = np.arange(n)
+    left = np.where(below & (index < peak[:, None]), index, -1).max(axis=1)
+    right = np.where(below & (index > peak[:, None]), index, n).min(axis=1)
+    resolved = np.isfinite(extremum) & (extremum != 0) & (left >= 0) & (right < n)
+
+    l0, r0 = np.clip(left, 0, n - 2), np.clip(right, 1, n - 1)
+    with np.errstate(divide='ignore', invalid='ignore'):
+        # Crossing between left and left + 1 and between right - 1 and right
+        sl0, sl1 = s[wells, l0], s[wells, l0 + 1]
+        x_left = x[l0] + (half - sl0) / (sl1 - sl0) * (x[l0 + 1] - x[l0])
+        sr0, sr1 = s[wells, r0 - 1], s[wells, r0]
+        x_right = x[r0 - 1] + (sr0 - half) / (sr0 - sr1) * (x[r0] - x[r0 - 1])
+
+        # A NaN edge has no interpolation, so the last point above half is used
+        x_left = np.where(np.isfinite(sl0), x_left, x[l0 + 1])
+        x_right = np.where(np.isfinite(sr1), x_right, x[r0 - 1])
+
+    return np.where(resolved, x_right - x_left, np.nan)
@@ -0,0 +1,200 @@
+'''
+Stage timers, counters and optional tracemalloc measurements of the hot
+paths of EKKOTools (parsing, ingestion, smoothing, PickN, averaging and
+export).
+
+Instrumentation is off by default, and every hook then returns after
+checking one module global. It is switched on for a block of code with
+
+    with Instrumentation(callback=print, trace_memory=True) as run:
+        corpus = EKKOCorpus.from_folder(folder)
+    run.report()
+
+or for a whole process by setting the environment variable
+EKKOTOOLS_INSTRUMENT to 1 (or to 'memory' to also trace memory), which
+logs every stage at DEBUG and a summary at exit at INFO level to the
+'EKKOTools.instrument' logger.
+
+Stages run in worker processes (n_jobs > 1) are not recorded, but the
+counters of the files and wells they return are.
+'''
+import atexit
+import functools
+import json
+import logging
+import os
+import time
+import tracemalloc
+from contextlib import nullcontext
+
+# Environment variable which enables the instrumentation of the whole process
+INSTRUMENT_VARIABLE = 'EKKOTOOLS_INSTRUMENT'
+
+logger = logging.getLogger('EKKOTools.instrument')
+
+# Instrumentation which currently records, None when disabled
+_ACTIVE = None
+
+# Shared no-op context which Stage returns while disabled
+_DISABLED = nullcontext()
+
+class Instrumentation():
+    '''
+    Records the stages and counters of EKKOTools while it is active. Use it
+    as a context manager. Instrumentations can be nested, the inner one
+    records until it exits.
+
+    Parameters
+    ----------
+    callback: callable
+        Called with a dict for every finished stage
+            {'type': 'stage', 'name': ..., 'seconds': ...}
+        (plus 'memory_peak' and 'memory_delta' in bytes when trace_memory)
+        and once with the summary of report() on exit.
+
+    logger: logging.Logger
+        Logger which receives the same records as JSON messages, stages at
+        DEBUG and the summary at INFO level. The record dict is attached as
+        the ekko attribute of the log record for structured handlers.
+
+    trace_memory: bool
+        Measure the peak and net memory allocated by every stage with
+        tracemalloc. Tracing slows Python down considerably.
+
+    Attributes
+    ----------
+    stages: dict[str, dict]
+        calls, seconds (total) and max_seconds of every stage, and
+        memory_peak (largest) when trace_memory
+    counters: dict[str, int]
+        Totals of the counters, e.g. files, wells and bytes
+    '''
+    def __init__(self, callback = None, logger: logging.Logger = None, trace_memory: bool = False):
+        self.callback = callback
+        self.logger = logger
+        self.trace_memory = trace_memory
+        self.stages = {}
+        self.counters = {}
+        self._previous = None
+        self._memory_stack = []
+        self._started_tracing = False
+
+    def __repr__(self) -> str:
+        return f'Instrumentation({len(self.stages)} stages, {len(self.counters)} counters)'
+
+    def __enter__(self):
+        global _ACTIVE
+        self._previous, _ACTIVE = _ACTIVE, self
+        if self.trace_memory and not tracemalloc.is_tracing():
+            tracemalloc.start()
+            self._started_tracing = True
+        return self
+
+    def __exit__(self, *exc):
+        global _ACTIVE
+        _ACTIVE, self._previous = self._previous, None
+        if self._started_tracing:
+            tracemalloc.stop()
+            self._started_tracing = False
+        self._emit(self.report(), logging.INFO)
+        return False
+
+    def report(self) -> dict:
+        '''Summary of all stages and counters, ready for json.dumps'''
+        return {
+            'type': 'summary',
+            'stages': {name: dict(stage) for name, stage in self.stages.items()},
+            'counters': dict(self.counters)}
+
+    def _emit(self, record: dict, level: int) -> None:
+        if self.callback is not None:
+            self.callback(record)
+        if self.logger is not None and self.logger.isEnabledFor(level):
+            self.logger.log(level, json.dumps(record), extra={'ekko': record})
+
+    def _count(self, name: str, n: int) -> None:
+        self.counters[name] = self.counters.get(name, 0) + n
+
+    def _enter_memory(self) -> None:
+        current, peak = tracemalloc.get_traced_memory()
+        # The peak of an enclosing stage must survive the reset
+        if self._memory_stack:
+            self._memory_stack[-1][1] = max(self._memory_stack[-1][1], peak)
+        tracemalloc.reset_peak()
+        self._memory_stack.append([current, current])
+
+    def _exit_memory(self, record: dict) -> None:
+        current, peak = tracemalloc.get_traced_memory()
+        start, inner_peak = self._memory_stack.pop()
+        peak = max(peak, inner_peak)
+        if self._memory_stack:
+            self._memory_stack[-1][1] = max(self._memory_stack[-1][1], peak)
+        record['memory_peak'] = peak - start
+        record['memory_delta'] = current - start
+
+    def _record(self, record: dict) -> None:
+        stage = self.stages.setdefault(record['name'], {'calls': 0, 'seconds': 0.0, 'max_seconds': 0.0})
+        stage['calls'] += 1
+        stage['seconds'] += record['seconds']
+        stage['max_seconds'] = max(stage['max_seconds'], record['seconds'])
+        if 'memory_peak' in record:
+            stage['memory_peak'] = max(stage.get('memory_peak', 0), record['memory_peak'])
+        self._emit(record, logging.DEBUG)
+
+class _Stage():
+    __slots__ = ('instrumentation', 'name', 'start', 'memory')
+
+    def __init__(self, instrumentation: Instrumentation, name: str):
+        self.instrumentation = instrumentation
+        self.name = name
+
+    def __enter__(self):
+        self.memory = self.instrumentation.trace_memory and tracemalloc.is_tracing()
+        if self.memory:
+            self.instrumentation._enter_memory()
+        self.start = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc):
+        record = {'type': 'stage', 'name': self.name, 'seconds': time.perf_counter() - self.start}
+        if self.memory:
+            self.instrumentation._exit_memory(record)
+        self.instrumentation._record(record)
+        return False
+
+def Stage(name: str):
+    '''
+    Context manager which times a named stage (e.g. 'parse.read') if
+    instrumentation is active and does nothing otherwise
+    '''
+    if _ACTIVE is None:
+        return _DISABLED
+    return _Stage(_ACTIVE, name)
+
+def Count(name: str, n: int = 1) -> None:
+    '''Adds n to a named counter (e.g. 'files') if instrumentation is active'''
+    if _ACTIVE is not None:
+        _ACTIVE._count(name, n)
+
+def Staged(name: str):
+    '''Decorator which runs a whole function as a Stage'''
+    def decorator(function):
+        @functools.wraps(function)
+        def wrapper(*args, **kwargs):
+            if _ACTIVE is None:
+                return function(*args, **kwargs)
+            with _Stage(_ACTIVE, name):
+                return function(*args, **kwargs)
+        return wrapper
+    return decorator
+
+def _instrument_process() -> None:
+    '''Activates a process-wide Instrumentation if INSTRUMENT_VARIABLE is set'''
+    value = os.environ.get(INSTRUMENT_VARIABLE, '').strip().casefold()
+    if value in ('', '0', 'false', 'no', 'off'):
+        return
+    instrumentation = Instrumentation(logger=logger, trace_memory=value == 'memory')
+    instrumentation.__enter__()
+    atexit.register(instrumentation.__exit__, None, None, None)
+
+_instrument_process()
@@ -0,0 +1,39 @@
+'''
+Deferred imports of heavy dependencies (pandas, matplotlib, ...), so that
+importing EKKOTools, e.g. in the workers of a process pool which only
+parse files, does not pay for libraries it never uses.
+'''
+import importlib
+
+class LazyModule():
+    '''
+    Stand-in for a module which is imported on the first attribute access.
+
+        pd = LazyModule('pandas')
+        pd.DataFrame(...)  # pandas is imported here
+
+    Modules which use it in annotations need from __future__ import
+    annotations, so that the annotations do not trigger the import.
+
+    Parameters
+    ----------
+    name: str
+        Absolute name of the module, e.g. 'matplotlib.pyplot'
+    '''
+    def __init__(self, name: str):
+        self.__dict__['_name'] = name
+        self.__dict__['_module'] = None
+
+    def __repr__(self) -> str:
+        state = 'imported' if self._module is not None else 'not imported'
+        return f'LazyModule({self._name!r}, {state})'
+
+    def __getattr__(self, attribute: str):
+        if self._module is None:
+            self.__dict__['_module'] = importlib.import_module(self._name)
+        return getattr(self._module, attribute)
+
+    def __setattr__(self, attribute: str, value) -> None:
+        if self._module is None:
+            self.__dict__['_module'] = importlib.import_module(self._name)
+        setattr(self._module, attribute, value)
@@ -0,0 +1,230 @@
+'''
+Single-pass parser for EKKO ScanSummary files (.cdxs).
+
+The file is read from disk exactly once and tokenized in one walk over its
+lines. The header, the scan body and the Well Info trailer are returned as a
+ParsedScanSummary whose spectra are typed NumPy arrays.
+'''
+import os
+import re
+import numpy as np
+from pathlib import Path
+
+from .instrument import Stage, Count
+
+HEADER_TEXT = 'Hinds Instruments CD Reader'
+
+# Column names of the scan body which are read by EKKOTools
+WAVELENGTH_COLUMN = 'WL'
+CD_COLUMN = 'CD-mDeg'
+ABS_COLUMN = 'ABS'
+
+# Positions of the channels along the last axis of ParsedScanSummary.spectra
+CD = 0
+ABS = 1
+CD_PER_ABS = 2
+N_CHANNELS = 3
+
+# Value used in the Well Info table for empty wells
+EMPTY_WELL = 'MT'
+
+_well_label = re.compile(r'^[A-Z]{1,2}\d{1,2}$')
+
+class ParsedScanSummary():
+    '''
+    Typed contents of an EKKO ScanSummary file. Instantiation is not done
+    directly, but rather from the ParseScanSummary function.
+
+    Attributes
+    ----------
+    header: list[list[str]]
+        Tab separated tokens of every non-blank line above the scan body
+
+    well_names: list[str]
+        Well labels (A1, B1, ...) in the order they were scanned
+
+    wavelength_labels: list[str]
+        Wavelengths exactly as they are written in the file
+
+    wavelengths: np.ndarray
+        Wavelengths as a float64 array of shape (n_wavelengths,)
+
+    spectra: np.ndarray
+        Contiguous float64 array of shape (n_wells, n_wavelengths, 3) holding
+        the CD, ABS and CD_PER_ABS channels (see the CD, ABS and CD_PER_ABS
+        constants)
+
+    well_info: dict
+        Analytes from the Well Info table keyed by well label
+    '''
+    def __init__(
+        self,
+        file: Path,
+        header: list,
+        well_names: list,
+        wavelength_labels: list,
+        spectra: np.ndarray,
+        well_info: dict):
+        self.file = file
+        self.header = header
+        self.well_names = well_names
+        self.wavelength_labels = wavelength_labels
+        self.wavelengths = _to_float_array(wavelength_labels)
+        self.spectra = spectra
+        self.well_info = well_info
+
+    @property
+    def date(self) -> str:
+        # Added re.sub here to control for different amounts of spacing
+        return re.sub(r"\s+", " ", self.header[1][0]).split(' ')[0]
+
+    @property
+    def scan_process(self) -> str:
+        return self.header[4][0]
+
+    @property
+    def well_plate_type(self) -> str:
+        return self.header[9][1]
+
+def ParseScanSummary(file: Path, possible_wells = None) -> ParsedScanSummary:
+    '''
+    Reads an EKKO ScanSummary file once and returns its typed contents.
+
+    Parameters
+    ----------
+    file: Path
+        Path to the .cdxs file
+
+    possible_wells: iterable[str]
+        Well labels which are accepted in the scan body. Any label outside
+        of this collection raises a ValueError. If None, every label
+        formatted like A1 or AB12 is accepted. A set or frozenset, e.g.
+        PlateGeometry.label_set, is used as is.
+
+    Returns
+    ----------
+    ParsedScanSummary
+    '''
+    file = Path(file)
+
+    with Stage('parse.read'), open(file, 'r', encoding='utf-8', errors='replace') as f:
+        rows = [line.split('\t') for line in f.read().splitlines() if line.strip()]
+        Count('bytes', os.fstat(f.fileno()).st_size)
+
+    if not rows or rows[0][0] != HEADER_TEXT:
+        raise ValueError(f"The file {file.name} is not formatted like a EKKO CD Wellplate Reader cdxs file")
+
+    # Locate the column header of the scan body
+    for header_end, row in enumerate(rows):
+        if row[0].strip() == WAVELENGTH_COLUMN:
+            break
+    else:
+        raise ValueError(f"Could not find the scan data in {file.name}")
+
+    columns = [c.strip() for c in rows[header_end]]
+    try:
+        cd_column = columns.index(CD_COLUMN)
+        abs_column = columns.index(ABS_COLUMN)
+    except ValueError:
+        raise ValueError(f"The scan data in {file.name} does not have {CD_COLUMN} and {ABS_COLUMN} columns")
+
+    if possible_wells is not None and not isinstance(possible_wells, (set, frozenset)):
+        possible_wells = frozenset(possible_wells)
+
+    # Walk the scan body. Each well is a label row followed by one row per wavelength.
+    well_names = []
+    block_lengths = []
+    wavelength_labels = []
+    values = []
+    trailer_start = len(rows)
+    with Stage('parse.scan'):
+        for i in range(header_end + 1, len(rows)):
+            row = rows[i]
+            token = row[0].strip()
+            if _well_label.match(token):
+                if possible_wells is not None and token not in possible_wells:
+                    raise ValueError(f"Well format not understood in {file.name}\tWell: {token}")
+                well_names.append(token)
+                block_lengths.append(0)
+            elif well_names and _is_number(token):
+                if len(well_names) == 1:
+                    wavelength_labels.append(token)
+                values.append((_field(row, cd_column), _field(row, abs_column)))
+                block_lengths[-1] += 1
+            else:
+                trailer_start = i
+                break
+
+    if not well_names:
+        raise ValueError(f"No well scans were found in {file.name}")
+
+    n_wavelengths = len(wavelength_labels)
+    if any(length != n_wavelengths for length in block_lengths):
+        raise ValueError(f"Wells in {file.name} were not all measured at the same wavelengths")
+
+    with Stage('parse.arrays'):
+        spectra = np.empty((len(well_names), n_wavelengths, N_CHANNELS), dtype=np.float64)
+        spectra[:, :, :CD_PER_ABS] = _to_float_array(values).reshape(len(well_names), n_wavelengths, 2)
+        with np.errstate(divide='ignore', invalid='ignore'):
+            np.divide(spectra[:, :, CD], spectra[:, :, ABS], out=spectra[:, :, CD_PER_ABS])
+
+    with Stage('parse.well_info'):
+        well_info = _parse_well_info(rows[trailer_start:])
+
+    return ParsedScanSummary(
+        file=file,
+        header=rows[:header_end],
+        well_names=well_names,
+        wavelength_labels=wavelength_labels,
+        spectra=spectra,
+        well_info=well_info)
+
+def _parse_well_info(rows: list) -> dict:
+    '''
+    Reads the analytes out of the "Well Info:" table. Every row of the table
+    is a row letter followed by one cell per plate column. Empty wells are
+    left out of the returned dict.
+    '''
+    start, end = None, len(rows)
+    for i, row in enumerate(rows):
+        if 'Well Info' in row[0]:
+            start = i + 1
+        if 'End Annotation' in row[0]:
+            end = i
+            break
+
+    if start is None:
+        return {}
+
+    info = {}
+    # Skip the first row of the table which holds the column numbers
+    for row in rows[start + 1:end]:
+        row_letter = row[0].strip()
+        for column, cell in enumerate(row[1:], start=1):
+            cell = cell.strip()
+            if cell and cell != EMPTY_WELL:
+                info[f'{row_letter}{column}'] = cell
+    return info
+
+def _field(row: list, i: int) -> str:
+    return row[i] if i < len(row) else ''
+
+def _is_number(token: str) -> bool:
+    try:
+        float(token)
+    except ValueError:
+        return False
+    return True
+
+def _to_float_array(values: list) -> np.ndarray:
+    '''Converts (nested) lists of strings to float64, treating unreadable values as NaN'''
+    try:
+        return np.asarray(values, dtype=np.str_).astype(np.float64)
+    except ValueError:
+        return np.vectorize(_to_float, otypes=[np.float64])(np.asarray(values, dtype=object))
+
+def _to_float(token: str) -> float:
+    try:
+        return float(token)
+    except ValueError:
+        return np.nan
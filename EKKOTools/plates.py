@@ -0,0 +1,112 @@
+'''
+Geometry of the well plates read by the EKKO reader. Maps well labels
+(A1, H12, P24, AF48, ...) to integer row and column indices in O(1).
+'''
+import re
+import string
+from functools import lru_cache
+
+class PlateGeometry():
+    '''
+    Rows and columns of a well plate.
+
+    Rows are labelled A to Z followed by AA, AB, ... and columns are
+    numbered from 1. Indices are 0-based and wells are numbered row-major
+    by index(), so index = row * n_columns + column.
+    '''
+    def __init__(self, n_rows: int, n_columns: int, name: str = None):
+        self.n_rows = n_rows
+        self.n_columns = n_columns
+        self.name = name if name is not None else f'{n_rows * n_columns} Well Plate'
+
+        self.row_labels = _row_labels(n_rows)
+        self._rows = {label: i for i, label in enumerate(self.row_labels)}
+        self._positions = {
+            f'{row}{column + 1}': (r, column)
+            for r, row in enumerate(self.row_labels)
+            for column in range(n_columns)}
+        # Hand this to ParseScanSummary(possible_wells=...) to check labels without building a set per file
+        self.label_set = frozenset(self._positions)
+
+    def __repr__(self) -> str:
+        return f'PlateGeometry({self.n_rows}, {self.n_columns}, {self.name!r})'
+
+    def __reduce__(self):
+        # Unpickled geometries share the lookup tables of the module-level plates
+        return (_plate_geometry, (self.n_rows, self.n_columns, self.name))
+
+    def __len__(self) -> int:
+        return self.n_rows * self.n_columns
+
+    def __contains__(self, label: str) -> bool:
+        return label in self._positions
+
+    @property
+    def shape(self) -> tuple[int, int]:
+        return (self.n_rows, self.n_columns)
+
+    @property
+    def labels(self) -> list[str]:
+        '''Well labels in the order in which the EKKO reader scans them (A1, B1, ..., H1, A2, ...)'''
+        return [f'{row}{column + 1}' for column in range(self.n_columns) for row in self.row_labels]
+
+    def position(self, label: str) -> tuple[int, int]:
+        '''(row, column) indices of a well label'''
+        try:
+            return self._positions[label]
+        except KeyError:
+            raise ValueError(f'{label} is not a valid well label for a {self.name}')
+
+    def index(self, label: str) -> int:
+        '''Row-major index of a well label'''
+        row, column = self.position(label)
+        return row * self.n_columns + column
+
+    def label(self, row: int, column: int) -> str:
+        '''Well label at the (row, column) indices'''
+        if not (0 <= row < self.n_rows and 0 <= column < self.n_columns):
+            raise IndexError(f'({row}, {column}) is outside of a {self.name}')
+        return f'{self.row_labels[row]}{column + 1}'
+
+    def row_index(self, row_label: str) -> int:
+        '''Index of a row letter'''
+        return self._rows[row_label]
+
+def _row_labels(n_rows: int) -> list[str]:
+    letters = list(string.ascii_uppercase)
+    letters += [f'A{x}' for x in string.ascii_uppercase]
+    return letters[:n_rows]
+
+PLATE_96 = PlateGeometry(8, 12)
+PLATE_384 = PlateGeometry(16, 24)
+PLATE_1536 = PlateGeometry(32, 48)
+
+PLATES = {len(plate): plate for plate in (PLATE_96, PLATE_384, PLATE_1536)}
+
+def GetPlateGeometry(well_plate_type: str = None, well_names: list[str] = None) -> PlateGeometry:
+    '''
+    Returns the PlateGeometry for the well_plate_type of a ScanSummary file
+    (e.g. "96 Well Plate"). If the type is not recognized, the smallest
+    plate which holds all of well_names is returned.
+    '''
+    for number in re.findall(r'\d+', str(well_plate_type)):
+        if int(number) in PLATES:
+            return PLATES[int(number)]
+
+    if well_names is not None:
+        for plate in sorted(PLATES.values(), key=len):
+            if all(name in plate for name in well_names):
+                return plate
+
+    return PLATE_96
+
+def IsWellLabel(label: str) -> bool:
+    '''True if the label names a well of any supported plate'''
+    return label in PLATE_1536
+
+@lru_cache(maxsize=None)
+def _plate_geometry(n_rows: int, n_columns: int, name: str) -> PlateGeometry:
+    for plate in PLATES.values():
+        if (plate.n_rows, plate.n_columns, plate.name) == (n_rows, n_columns, name):
+            return plate
+    return PlateGeometry(n_rows, n_columns, name)
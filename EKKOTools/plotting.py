@@ -1,26 +1,25 @@
 import math
-import matplotlib.pyplot as plt
 
 import numpy as np
 
 from pathlib import Path
 
+from .lazy import LazyModule
 from .EKKOScanFormats import EKKOScanSummary, Well
-from .utilities import GetAllSpectraFromWells
+from .aggregate import _wells_and_spectra
+from .utilities import GetAllSpectraFromWells, GetChannel
+
+plt = LazyModule('matplotlib.pyplot')
+
+# Drawing modes of PlotOverlay
+OVERLAY_MODES = ['lines', 'density']
 
 def PruneNAN(data: dict):
-    '''Removes values from a dictionary in which the values or the keys are nan'''
-    removal = []
-    for key, value in data.items():
-        if str(key) == 'nan':
-            removal.append(key)
-            print(key)
-        if str(value) == 'nan':
-            if key not in removal:
-                removal.append(key)
-    for r in removal:
-        del data[r]
-    return data
+    '''
+    Returns a copy of a dictionary without the items in which the values
+    or the keys are nan. The input dictionary is not changed.
+    '''
+    return {key: value for key, value in data.items() if str(key) != 'nan' and str(value) != 'nan'}
 
 def PlotSpectrum(
     data: dict, 
@@ -35,8 +34,6 @@ def PlotSpectrum(
 
     x, y = list(float(key) for key in data.keys()), list(float(value) for value in data.values())
 
-    print(" should mention that dictionaries also have a method .get() which accepts a default parameter (itself defaulting to None), so that kwargs.get('errormessage') returns the value if that key exists and None otherwise (similarly kwargs.get('errormessage', 17) does what you might think it does). When you don't care about the difference between the key existing and having None as a value or the key not existing, this can be handy.")
-
     # xlimits
     try:
         xlimits = kwargs.pop('xlimits')
@@ -150,19 +147,14 @@ def PlotMultipleSpectra(
     if xlim is not None:
         plt.xlim(xlim[0], xlim[1])
 
-    maxy = 0
-
     for scan_data in list_of_spectra:
         data = PruneNAN(scan_data)
 
-        x, y = list(float(key) for key in data.keys()), list(data.values())
+        x = np.fromiter(data.keys(), dtype=np.float64, count=len(data))
+        y = np.fromiter(data.values(), dtype=np.float64, count=len(data))
 
         ax_CD.plot(x, y)
 
-        if max([abs(y_tmp) for y_tmp in y]) >= maxy:
-            maxy = max([abs(y_tmp) for y_tmp in y])
-
-    print('YLIMITS HAVE BEEN FIXED WARNING')
     if ylimits is not None:
         plt.ylim(ylimits[0], ylimits[1])
 
@@ -178,8 +170,14 @@ def PlotAllSpectra(
     plot_max: bool = False,
     plot_wl: float = None,
     plot_legend: bool = True,
+    overlay: bool = False,
     **kwargs):       
-    '''Plots all the spectra (cd, abs, cd_per_abs) for a list of wells'''
+    '''
+    Plots all the spectra (cd, abs, cd_per_abs) for a list of wells.
+    With overlay=True every panel is drawn by PlotOverlay as one
+    LineCollection without a legend, which is much faster for hundreds of
+    wells. plot_max, plot_wl and plot_legend are ignored then.
+    '''
     # Check if a single well was given
     if isinstance(wells, Well):
         wells = [wells]
@@ -205,6 +203,18 @@ def PlotAllSpectra(
 
     plt.suptitle(title, **label_font)
 
+    if overlay:
+        panels = [('CD', 'cd', 'CD (mdeg)'), ('Absorbance', 'abs', 'Absorbance'), ('G-factor', 'cd_per_abs', 'CD (mdeg / abs)')]
+        for ax, (panel, spectra_type, ylabel) in zip(axs, panels):
+            ax.set_title(panel, **label_font)
+            ax.set_xlabel("Wavelength (nm)", **label_font)
+            ax.set_ylabel(ylabel, **label_font)
+            PlotOverlay(wells, spectra_type, ax=ax, xlim=xlim)
+        if return_fig:
+            return fig, axs
+        plt.show()
+        return
+
     # For CD Plot
     axs[0].set_title("CD", **label_font)
     axs[0].set_xlabel("Wavelength (nm)", **label_font)
@@ -286,16 +296,161 @@ def PlotAllAbsorbance(
     
     plt.show()
 
+def PlotOverlay(
+    wells,
+    spectra_type: str = 'cd',
+    mode: str = 'lines',
+    ax = None,
+    xlim: list = None,
+    ylim: list = None,
+    color = None,
+    alpha: float = None,
+    linewidth: float = 0.8,
+    bins: int = 200,
+    title: str = '',
+    return_fig: bool = False):
+    '''
+    Overlays the spectra of many wells, e.g. a whole 384-well plate or all
+    replicates of a corpus, on one axis.
+
+    The spectra are stacked into one array, NaN values and wavelengths
+    outside of xlim are masked on the whole array, and all spectra are
+    drawn as a single LineCollection (mode='lines') or as a 2D histogram
+    of the number of spectra through each point (mode='density'), which
+    stays readable for tens of thousands of wells.
+
+    Parameters
+    ----------
+    wells: list[Well] | EKKOScanSummary | EKKOCorpus | list[EKKOScanSummary]
+        Wells to plot
+
+    spectra_type: str
+        'cd', 'abs', or 'cd_per_abs'
+
+    mode: str
+        'lines' or 'density'
+
+    ax: matplotlib.axes.Axes
+        Axis to draw on. By default a new figure is created.
+
+    xlim, ylim: list[float, float]
+        Wavelength and intensity range. By default the range of the data.
+
+    color:
+        Color of all lines. By default the lines cycle through the colors
+        of the matplotlib style like ax.plot.
+
+    alpha: float
+        Opacity of the lines. By default it decreases with the number of wells.
+
+    linewidth: float
+        Width of the lines
+
+    bins: int
+        Number of intensity bins of the density image
+
+    title: str
+        Title of the axis
+
+    return_fig: bool
+        Return the figure and axis of a new figure rather than showing it
+
+    Returns
+    ----------
+    matplotlib.collections.LineCollection | matplotlib.collections.QuadMesh
+        The drawn artist if ax is given, otherwise (fig, ax) if return_fig
+    '''
+    from matplotlib.collections import LineCollection
+    from matplotlib.colors import LogNorm
+
+    if mode not in OVERLAY_MODES:
+        raise ValueError(f'mode must be one of {OVERLAY_MODES}, not {mode}')
+    channel = GetChannel(spectra_type)
+    wells, spectra = _wells_and_spectra(wells)
+
+    # One (n_wells, n_wavelengths) block per wavelength grid
+    rows_by_grid = {}
+    for i, well in enumerate(wells):
+        rows_by_grid.setdefault(tuple(well.wavelength_labels), []).append(i)
+    blocks = []
+    for rows in rows_by_grid.values():
+        x = np.asarray(wells[rows[0]].wavelengths, dtype=np.float64)
+        if isinstance(spectra, np.ndarray):
+            y = spectra[rows, :, channel]
+        else:
+            y = np.stack([spectra[i][:, channel] for i in rows])
+        if xlim is not None:
+            inside = (x >= xlim[0]) & (x <= xlim[1])
+            x, y = x[inside], y[:, inside]
+        blocks.append((rows, x, np.asarray(y, dtype=np.float64)))
+
+    new_figure = ax is None
+    if new_figure:
+        fig, ax = plt.subplots()
+    if title:
+        ax.set_title(title)
+
+    finite_x = np.concatenate([np.repeat(x[None], len(y), axis=0)[np.isfinite(y)] for _, x, y in blocks]) if blocks else np.empty(0)
+    finite_y = np.concatenate([y[np.isfinite(y)] for _, _, y in blocks]) if blocks else np.empty(0)
+
+    if mode == 'lines':
+        # (n_wells, n_wavelengths, 2) segments. NaN leave gaps in the lines.
+        segments = [np.stack(np.broadcast_arrays(x[None], y), axis=-1) for _, x, y in blocks]
+        order = np.concatenate([rows for rows, _, _ in blocks]) if blocks else np.empty(0, dtype=np.intp)
+        if color is None:
+            cycle = plt.rcParams['axes.prop_cycle'].by_key().get('color', ['C0'])
+            colors = [cycle[i % len(cycle)] for i in order]
+        else:
+            colors = color
+        if alpha is None:
+            alpha = min(1.0, max(0.05, 20 / max(len(order), 1)))
+        artist = LineCollection(
+            [line for block in segments for line in block],
+            colors=colors,
+            linewidths=linewidth,
+            alpha=alpha)
+        ax.add_collection(artist, autolim=False)
+    else:
+        # Wavelength bins centred on the measured wavelengths
+        centres = np.unique(finite_x)
+        if len(centres) > 1:
+            middles = (centres[1:] + centres[:-1]) / 2
+            x_edges = np.concatenate([[2 * centres[0] - middles[0]], middles, [2 * centres[-1] - middles[-1]]])
+        else:
+            x_edges = np.array([centres[0] - 0.5, centres[0] + 0.5]) if len(centres) else np.array([0.0, 1.0])
+        y_range = ylim if ylim is not None else ((finite_y.min(), finite_y.max()) if len(finite_y) else (0.0, 1.0))
+        if y_range[0] == y_range[1]:
+            y_range = (y_range[0] - 0.5, y_range[1] + 0.5)
+        counts, _, y_edges = np.histogram2d(finite_x, finite_y, bins=[x_edges, bins], range=[x_edges[[0, -1]], y_range])
+        counts = np.ma.masked_equal(counts.T, 0)
+        artist = ax.pcolormesh(x_edges, y_edges, counts, norm=LogNorm(vmin=1, vmax=max(counts.max(), 1)) if counts.count() else None, shading='flat')
+        ax.figure.colorbar(artist, ax=ax, label='Spectra')
+
+    if xlim is not None:
+        ax.set_xlim(xlim)
+    elif len(finite_x):
+        ax.set_xlim(finite_x.min(), finite_x.max())
+    if ylim is not None:
+        ax.set_ylim(ylim)
+    elif len(finite_y):
+        margin = 0.05 * (finite_y.max() - finite_y.min()) or 0.5
+        ax.set_ylim(finite_y.min() - margin, finite_y.max() + margin)
+
+    if not new_figure:
+        return artist
+    if return_fig:
+        return fig, ax
+    plt.show()
+
 def PruneDictionaryKeys(d: dict = None, range: list = None):
-    '''Removes dictionary keys with float values outside of the accepted range'''
+    '''
+    Returns a dictionary without the keys with float values outside of
+    the accepted range. The input dictionary is not changed.
+    '''
     if range is None:
         return d
     else:
-        for k,v in d.copy().items():
-            wl = float(k)
-            if wl < range[0] or wl > range[1]:
-                d.pop(k)
-        return d
+        return {k: v for k, v in d.items() if range[0] <= float(k) <= range[1]}
 
 if __name__ == "__main__":
     file = Path("./data/AAB_1019_summary.cdxs")
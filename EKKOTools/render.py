@@ -0,0 +1,257 @@
+'''
+Headless batch rendering of CD, absorbance and g-factor panels to image
+files.
+
+Figures are drawn with the Agg, SVG and PDF canvases of matplotlib
+directly, so pyplot and an interactive backend are never loaded. Every
+worker process creates its figure once and redraws only the lines for
+each page.
+'''
+import math
+import os
+import re
+from concurrent.futures import ProcessPoolExecutor
+from pathlib import Path
+
+import numpy as np
+
+from .aggregate import _wells_and_spectra
+from .parsing import CD, ABS, CD_PER_ABS
+
+# Formats of RenderSpectraPanels
+RENDER_FORMATS = ['png', 'svg', 'pdf']
+
+# Fonts of PlotAllSpectra, with fallbacks so that missing Helvetica does not warn on every page
+RENDER_STYLE = {
+    'font.size': 11,
+    'font.family': 'sans-serif',
+    'font.sans-serif': ['Helvetica', 'Arial', 'DejaVu Sans'],
+}
+
+# Title, channel and y label of each panel
+PANELS = [
+    ('CD', CD, 'CD (mdeg)'),
+    ('Absorbance', ABS, 'Absorbance'),
+    ('G-factor', CD_PER_ABS, 'CD (mdeg / abs)'),
+]
+
+# Figure of this process which is reused for every page
+_TEMPLATE = None
+
+def RenderSpectraPanels(
+    wells,
+    directory: Path = None,
+    group_by = 'analyte',
+    formats: list[str] = ('png',),
+    pdf: Path = None,
+    n_jobs: int = 1,
+    chunksize: int = None,
+    xlim: list[float, float] = None,
+    size: tuple[float, float] = (17, 6),
+    dpi: int = 100,
+    legend: int = 10) -> list[Path]:
+    '''
+    Renders one page with the CD, absorbance and g-factor panels of
+    PlotAllSpectra per group of wells, e.g. per analyte of a run, and
+    writes it to image files without opening any window.
+
+    Parameters
+    ----------
+    wells: list[Well] | EKKOScanSummary | EKKOCorpus | list[EKKOScanSummary]
+        Wells to plot. Their current spectra are drawn.
+
+    directory: Path
+        Directory of the image files, which are named after the groups
+        (e.g. analyte_1.png). It is created if needed. None writes only
+        the pdf.
+
+    group_by: str | callable
+        'analyte', 'file' or 'well', or a function which returns the group
+        of a Well. Wells in the group None are skipped.
+
+    formats: list[str]
+        Any of 'png', 'svg' and 'pdf'. Each page is written in every format.
+
+    pdf: Path
+        Multi-page PDF with one page per group in addition to the image
+        files
+
+    n_jobs: int
+        Number of worker processes. 1 renders in this process and None or
+        -1 uses one worker per CPU.
+
+    chunksize: int
+        Number of pages handed to a worker at once. By default the pages
+        are split into about four chunks per worker.
+
+    xlim: list[float, float]
+        Wavelength range of the panels
+
+    size: tuple[float, float]
+        Size of a page in inches
+
+    dpi: int
+        Resolution of the png files
+
+    legend: int
+        Label the lines with their file and well on pages with at most this
+        many lines. 0 leaves out the legends.
+
+    Returns
+    ----------
+    list[Path]
+        Written files, in the order of the groups
+    '''
+    formats = list(formats) if directory is not None else []
+    for f in formats:
+        if f not in RENDER_FORMATS:
+            raise ValueError(f'formats must be in {RENDER_FORMATS}, not {f}')
+    if directory is None and pdf is None:
+        raise ValueError('Either a directory or a pdf must be given')
+
+    pages = _pages(wells, group_by)
+    if directory is not None:
+        directory = Path(directory)
+        directory.mkdir(parents=True, exist_ok=True)
+    if pdf is not None:
+        pdf = Path(pdf)
+        pdf.parent.mkdir(parents=True, exist_ok=True)
+    options = (xlim, tuple(size), dpi, legend)
+
+    if n_jobs is None or n_jobs < 1:
+        n_jobs = os.cpu_count() or 1
+    if n_jobs == 1 or len(pages) <= 1:
+        written = _render_pages(pages, directory, formats, options) if formats else []
+        if pdf is not None:
+            written.extend(_render_pdf(pages, pdf, options))
+        return written
+
+    if chunksize is None:
+        chunksize = max(1, math.ceil(len(pages) / (4 * n_jobs)))
+    with ProcessPoolExecutor(max_workers=n_jobs) as pool:
+        # PdfPages writes sequentially, so the multi-page PDF is one task which runs beside the images
+        pdf_future = pool.submit(_render_pdf, pages, pdf, options) if pdf is not None else None
+        futures = [pool.submit(_render_pages, pages[i:i + chunksize], directory, formats, options)
+                   for i in range(0, len(pages), chunksize)] if formats else []
+        written = [path for future in futures for path in future.result()]
+        if pdf_future is not None:
+            written.extend(pdf_future.result())
+    return written
+
+def _group_key(group_by):
+    if callable(group_by):
+        return group_by
+    if group_by == 'analyte':
+        return lambda well: well.analyte
+    if group_by == 'file':
+        return lambda well: getattr(well.parent_scanfile, 'name', well.parent_scanfile)
+    if group_by == 'well':
+        return lambda well: f"{getattr(well.parent_scanfile, 'stem', well.parent_scanfile)}_{well.name}"
+    raise ValueError(f"group_by must be 'analyte', 'file', 'well' or a function, not {group_by}")
+
+def _pages(wells, group_by) -> list[dict]:
+    '''
+    The data of every page as plain arrays, which are cheap to send to the
+    workers: a title, a file name and (label, wavelengths, spectra) traces
+    '''
+    key = _group_key(group_by)
+    wells, spectra = _wells_and_spectra(wells)
+
+    groups = {}
+    for i, well in enumerate(wells):
+        group = key(well)
+        if group is not None:
+            groups.setdefault(group, []).append(i)
+
+    pages, names = [], set()
+    for group, rows in groups.items():
+        name = re.sub(r'[^\w.-]+', '_', str(group)).strip('_') or 'page'
+        stem, k = name, 1
+        while name in names:
+            name, k = f'{stem}_{k}', k + 1
+        names.add(name)
+
+        traces = []
+        for i in rows:
+            well = wells[i]
+            source = getattr(well.parent_scanfile, 'name', well.parent_scanfile)
+            label = well.name if source is None else f'{source} {well.name}'
+            traces.append((label, np.asarray(well.wavelengths, dtype=np.float64), np.asarray(spectra[i])))
+        pages.append({'title': str(group), 'name': name, 'traces': traces})
+    return pages
+
+def _template(size: tuple):
+    '''Figure, axes, title and a pool of lines per axes of this process, created on first use'''
+    global _TEMPLATE
+    if _TEMPLATE is None or tuple(_TEMPLATE[0].get_size_inches()) != size:
+        from matplotlib.figure import Figure
+
+        fig = Figure(figsize=size)
+        axs = fig.subplots(nrows=1, ncols=3, sharex=True, sharey=False)
+        title = fig.suptitle('', fontsize=13)
+        for ax, (panel, _, ylabel) in zip(axs, PANELS):
+            ax.set_title(panel, fontsize=13)
+            ax.set_xlabel('Wavelength (nm)', fontsize=13)
+            ax.set_ylabel(ylabel, fontsize=13)
+        _TEMPLATE = (fig, axs, title, [[] for _ in axs])
+    return _TEMPLATE
+
+def _draw(page: dict, options: tuple):
+    '''
+    Redraws the template with the traces of a page. The lines of earlier
+    pages are updated with set_data rather than created again.
+    '''
+    import matplotlib
+
+    xlim, size, _, legend = options
+    fig, axs, title, pools = _template(size)
+    title.set_text(page['title'])
+    colors = matplotlib.rcParams['axes.prop_cycle'].by_key().get('color', ['C0'])
+    traces = page['traces']
+
+    for ax, pool, (_, channel, _) in zip(axs, pools, PANELS):
+        if ax.get_legend() is not None:
+            ax.get_legend().remove()
+        while len(pool) < len(traces):
+            pool.append(ax.plot([], [], color=colors[len(pool) % len(colors)])[0])
+
+        for line, (label, x, spectra) in zip(pool, traces):
+            y = spectra[:, channel]
+            if xlim is not None:
+                inside = (x >= xlim[0]) & (x <= xlim[1])
+                x, y = x[inside], y[inside]
+            line.set_data(x, y)
+            line.set_label(label)
+            line.set_visible(True)
+        for line in pool[len(traces):]:
+            line.set_visible(False)
+
+        ax.relim(visible_only=True)
+        ax.autoscale(enable=True)
+        if 0 < len(traces) <= legend:
+            ax.legend(handles=pool[:len(traces)])
+    if xlim is not None:
+        axs[0].set_xlim(xlim)
+    return fig
+
+def _render_pages(pages: list[dict], directory: Path, formats: list[str], options: tuple) -> list[Path]:
+    import matplotlib
+
+    written = []
+    with matplotlib.rc_context(RENDER_STYLE):
+        for page in pages:
+            fig = _draw(page, options)
+            for f in formats:
+                path = directory / f"{page['name']}.{f}"
+                fig.savefig(path, format=f, dpi=options[2])
+                written.append(path)
+    return written
+
+def _render_pdf(pages: list[dict], pdf: Path, options: tuple) -> list[Path]:
+    import matplotlib
+    from matplotlib.backends.backend_pdf import PdfPages
+
+    with matplotlib.rc_context(RENDER_STYLE), PdfPages(pdf) as document:
+        for page in pages:
+            document.savefig(_draw(page, options))
+    return [pdf]
@@ -0,0 +1,221 @@
+'''
+Alignment of spectra measured with different scan processes (wavelength
+ranges or steps) onto a common wavelength grid.
+'''
+from functools import lru_cache
+
+import numpy as np
+
+from .EKKOScanFormats import Well, EKKOScanSummary, _aligned_spectrum
+from .parsing import CD, ABS, CD_PER_ABS
+
+# Interpolation methods of ResampleSpectra
+METHODS = ['linear', 'cubic']
+
+# Ways of combining the wavelength ranges of several grids
+POLICIES = ['intersection', 'union']
+
+def CommonGrid(
+    grids: list[np.ndarray],
+    policy: str = 'intersection',
+    step: float = None) -> np.ndarray:
+    '''
+    Wavelength grid which covers the ranges of several grids.
+
+    Parameters
+    ----------
+    grids: list[np.ndarray]
+        Wavelengths of each scan process
+
+    policy: str
+        'intersection' spans the range which every grid measured. 'union'
+        spans all of the ranges, so spectra are NaN where they were not
+        measured.
+
+    step: float
+        Spacing of the grid (nm). Defaults to the finest step of the grids.
+
+    Returns
+    ----------
+    np.ndarray
+        Ascending wavelengths. If all grids are equal, the first grid itself.
+    '''
+    if policy not in POLICIES:
+        raise ValueError(f'policy must be one of {POLICIES}, not {policy}')
+    grids = [np.asarray(grid, dtype=np.float64) for grid in grids]
+    if all(np.array_equal(grid, grids[0]) for grid in grids[1:]):
+        return grids[0]
+
+    if policy == 'intersection':
+        lo, hi = max(grid.min() for grid in grids), min(grid.max() for grid in grids)
+        if lo > hi:
+            raise ValueError('The wavelength ranges of the grids do not overlap')
+    else:
+        lo, hi = min(grid.min() for grid in grids), max(grid.max() for grid in grids)
+
+    if step is None:
+        step = min(np.abs(np.diff(grid)).min() for grid in grids if len(grid) > 1)
+    n = int(np.floor((hi - lo) / step + 1e-9)) + 1
+    return np.round(lo + step * np.arange(n), 9)
+
+def ResampleSpectra(
+    spectra: np.ndarray,
+    source: np.ndarray,
+    target: np.ndarray,
+    method: str = 'linear') -> np.ndarray:
+    '''
+    Interpolates spectra from the source wavelengths onto the target
+    wavelengths. The interpolation is linear in the intensities, so all
+    NaN-free spectra are resampled as one matrix product with a weight
+    matrix which is cached for each (source, target, method). Spectra
+    holding NaN are interpolated one by one over their finite points.
+
+    Parameters
+    ----------
+    spectra: np.ndarray
+        Array of shape (..., n_source)
+
+    source, target: np.ndarray
+        Wavelengths of the spectra and of the result
+
+    method: str
+        'linear' or 'cubic' (a natural cubic spline)
+
+    Returns
+    ----------
+    np.ndarray
+        Array of shape (..., n_target) which is NaN at target wavelengths
+        outside of the source range
+    '''
+    spectra = np.asarray(spectra, dtype=np.float64)
+    weights, inside = _resampling_matrix(_grid_key(source), _grid_key(target), method)
+
+    flat = spectra.reshape(-1, spectra.shape[-1])
+    resampled = np.empty((len(flat), len(inside)), dtype=np.float64)
+
+    finite = np.isfinite(flat).all(axis=1)
+    resampled[finite] = flat[finite] @ weights.T
+
+    source = np.asarray(source, dtype=np.float64)
+    for i in np.flatnonzero(~finite):
+        keep = np.isfinite(flat[i])
+        if keep.sum() < 2:
+            resampled[i] = np.nan
+            continue
+        sub_weights, _ = _resampling_matrix(_grid_key(source[keep]), _grid_key(target), method)
+        resampled[i] = sub_weights @ flat[i, keep]
+
+    resampled[:, ~inside] = np.nan
+    return resampled.reshape(spectra.shape[:-1] + (len(inside),))
+
+def ResampleWells(
+    wells,
+    grid: np.ndarray = None,
+    policy: str = 'intersection',
+    method: str = 'linear',
+    step: float = None) -> list[Well]:
+    '''
+    Aligns wells measured with different scan processes onto one grid.
+
+    The current CD and ABS spectra of all wells measured on the same grid
+    are resampled in one matrix product, and CD_PER_ABS is recomputed from
+    them. New Well objects are returned and the input wells are unchanged.
+
+    Parameters
+    ----------
+    wells: list[Well] | EKKOScanSummary | EKKOCorpus
+        Wells to resample
+
+    grid: np.ndarray
+        Target wavelengths. By default the CommonGrid of the wells.
+
+    policy, step:
+        See CommonGrid
+
+    method: str
+        'linear' or 'cubic'
+
+    Returns
+    ----------
+    list[Well]
+        Wells on the common grid in the order of the input
+    '''
+    if method not in METHODS:
+        raise ValueError(f'method must be one of {METHODS}, not {method}')
+    if isinstance(wells, Well):
+        wells = [wells]
+    elif isinstance(wells, EKKOScanSummary) or hasattr(wells, 'summaries'):
+        wells = wells.wells
+
+    groups = {}
+    for i, well in enumerate(wells):
+        groups.setdefault(tuple(well.wavelength_labels), []).append(i)
+
+    if grid is None:
+        grid = CommonGrid([wells[rows[0]].wavelengths for rows in groups.values()], policy=policy, step=step)
+    grid = np.asarray(grid, dtype=np.float64)
+    labels = [f'{wl:g}' for wl in grid]
+
+    resampled = [None] * len(wells)
+    for rows in groups.values():
+        group = [wells[i] for i in rows]
+        source = group[0].wavelengths
+
+        # (n_wells, channel, n_wavelengths) so that the wavelengths are the last axis
+        spectra = np.stack([np.stack([_aligned_spectrum(well, CD), _aligned_spectrum(well, ABS)]) for well in group])
+        if np.array_equal(source, grid):
+            aligned = spectra
+        else:
+            aligned = ResampleSpectra(spectra, source, grid, method=method)
+
+        plate = np.empty((len(group), len(grid), 3), dtype=np.float64)
+        plate[:, :, CD] = aligned[:, 0]
+        plate[:, :, ABS] = aligned[:, 1]
+        with np.errstate(divide='ignore', invalid='ignore'):
+            plate[:, :, CD_PER_ABS] = plate[:, :, CD] / plate[:, :, ABS]
+
+        for i, well, spectrum in zip(rows, group, plate):
+            new = Well(spectrum, grid, well.name, well.parent_scanfile, well.analyte, labels)
+            new._blank = well._blank
+            resampled[i] = new
+
+    return resampled
+
+def _grid_key(wavelengths) -> tuple:
+    return tuple(np.asarray(wavelengths, dtype=np.float64).tolist())
+
+@lru_cache(maxsize=128)
+def _resampling_matrix(source: tuple, target: tuple, method: str) -> tuple[np.ndarray, np.ndarray]:
+    '''
+    (n_target, n_source) matrix W for which W @ y interpolates y onto the
+    target and a boolean mask of the target wavelengths inside the source range
+    '''
+    if method not in METHODS:
+        raise ValueError(f'method must be one of {METHODS}, not {method}')
+    source = np.asarray(source)
+    target = np.asarray(target)
+    order = np.argsort(source)
+    xs = source[order]
+
+    tolerance = 1e-9 * max(1.0, np.abs(xs).max()) if len(xs) else 0.0
+    inside = (target >= xs[0] - tolerance) & (target <= xs[-1] + tolerance) if len(xs) else np.zeros(len(target), dtype=bool)
+    weights = np.zeros((len(target), len(source)), dtype=np.float64)
+
+    if len(xs) == 1:
+        weights[inside, order[0]] = 1.0
+    elif len(xs) > 1:
+        t = np.clip(target, xs[0], xs[-1])
+        if method == 'linear':
+            idx = np.clip(np.searchsorted(xs, t, side='right') - 1, 0, len(xs) - 2)
+            fraction = (t - xs[idx]) / (xs[idx + 1] - xs[idx])
+            rows = np.arange(len(target))
+            weights[rows, order[idx]] = 1 - fraction
+            weights[rows, order[idx + 1]] += fraction
+        else:
+            from scipy.interpolate import CubicSpline
+            weights[:, order] = CubicSpline(xs, np.eye(len(xs)), bc_type='natural')(t)
+        weights[~inside] = 0.0
+
+    weights.setflags(write=False)
+    inside.setflags(write=False)
+    return weights, inside
@@ -1,15 +1,25 @@
-from scipy.signal import savgol_filter
-from .EKKOScanFormats import Well
+import warnings
+from functools import lru_cache
+
+import numpy as np
+from .EKKOScanFormats import Well, EKKOScanSummary
+from .corpus import EKKOCorpus
+from .parsing import CD, ABS, CD_PER_ABS
+from .instrument import Staged
 
 from numpy.linalg import LinAlgError
 
+# Names of the Well attributes which hold each channel of Well.spectra
+SPECTRUM_ATTRIBUTES = {CD: 'CD', ABS: 'ABS', CD_PER_ABS: 'CD_PER_ABS'}
+
 def SmoothWellSpectra(
-    well: Well, 
-    window_length: int, 
+    well: Well,
+    window_length: int,
     polyorder: int) -> Well:
     '''
-    Smooths all spectra in a well and stores them in the 
-    spectrum attributes (CD, ABS, and CD_PER_ABS)
+    Smooths all spectra in a well and stores them in the
+    spectrum attributes (CD, ABS, and CD_PER_ABS). Spectra which cannot be
+    smoothed are left unchanged and reported with warnings.warn.
 
     Parameters
     ----------
@@ -30,40 +40,143 @@ def SmoothWellSpectra(
         could just use this function to modify the spectral attributes of the
         Well object directly.
     '''
-
-    cd = well.get_CD()
-    abs = well.get_abs()
-    cd_per_abs = well.get_CD_per_abs()
-
-    # Get the wavelengths
-    keys = cd.keys()
-
-    cd = [float(x) for x in cd.values()]
-    abs = [float(x) for x in abs.values()] 
-    cd_per_abs = [float(x) for x in cd_per_abs.values()]
-
-    try:
-        well.CD = dict(zip(keys, savgol_filter(
-            cd, 
-            window_length=window_length, 
-            polyorder=polyorder)))
-    except LinAlgError:
-        print(f"Could not smooth CD for {well.parent_scanfile} well {well.name}")
-
-    try:
-        well.ABS = dict(zip(keys, savgol_filter(
-            abs, 
-            window_length=window_length, 
-            polyorder=polyorder)))
-    except LinAlgError:
-        print(f"Could not smooth absorbance for {well.parent_scanfile} well {well.name}")
-
-    try:
-        well.CD_PER_ABS = dict(zip(keys, savgol_filter(
-            cd_per_abs, 
-            window_length=window_length, 
-            polyorder=polyorder)))
-    except LinAlgError:
-        print(f"Could not smooth CD_PER_ABS for {well.parent_scanfile} well {well.name}")
+    names = {'CD': 'CD', 'ABS': 'absorbance', 'CD_PER_ABS': 'CD_PER_ABS'}
+    for _, attribute in SmoothWells([well], window_length=window_length, polyorder=polyorder):
+        warnings.warn(f"Could not smooth {names[attribute]} for {well.parent_scanfile} well {well.name}")
 
     return well
+
+@Staged('smooth')
+def SmoothWells(
+    wells: list[Well],
+    window_length: int,
+    polyorder: int,
+    deriv: int = 0,
+    mode: str = 'interp') -> list[tuple[Well, str]]:
+    '''
+    Smooths the current CD, ABS and CD_PER_ABS spectra (including assigned
+    spectra, e.g. after blank correction) of many wells at once and stores
+    them in the spectrum attributes like SmoothWellSpectra. Wells which
+    share a wavelength grid are filtered as one matrix.
+
+    Parameters
+    ----------
+    wells: list[Well] | EKKOScanSummary | EKKOCorpus
+        Wells to smooth. A summary or corpus smooths all of its wells.
+
+    window_length: int
+        Number of side points to use for the Savitzky-Golay filter
+
+    polyorder: int
+        Order of the low-degree smoothing polynomial for the Savitzky-Golay filter
+
+    deriv: int
+        Order of the derivative to compute. Derivatives are taken with
+        respect to wavelength, so the wavelength step is used as delta.
+
+    mode: str
+        Edge handling of scipy.signal.savgol_filter
+
+    Returns
+    ----------
+    failures: list[tuple[Well, str]]
+        (well, attribute) pairs which could not be smoothed, see
+        SmoothSpectra. Those attributes are left unchanged.
+    '''
+    if isinstance(wells, Well):
+        wells = [wells]
+    elif isinstance(wells, (EKKOScanSummary, EKKOCorpus)):
+        wells = wells.wells
+
+    groups = {}
+    for well in wells:
+        groups.setdefault(tuple(well.wavelength_labels), []).append(well)
+
+    failures = []
+    for group in groups.values():
+        wavelengths = group[0].wavelengths
+        delta = float(wavelengths[1] - wavelengths[0]) if len(wavelengths) > 1 else 1.0
+
+        # (n_wells, channel, n_wavelengths) so that the filter runs along the last axis
+        spectra = np.stack([well.get_current_spectra() for well in group]).transpose(0, 2, 1)
+        smoothed, failed = SmoothSpectra(spectra, window_length, polyorder, deriv=deriv, delta=delta, mode=mode)
+
+        for well, rows, row_failed in zip(group, smoothed, failed):
+            for channel, attribute in SPECTRUM_ATTRIBUTES.items():
+                if row_failed[channel]:
+                    failures.append((well, attribute))
+                else:
+                    setattr(well, attribute, rows[channel])
+
+    return failures
+
+def SmoothSpectra(
+    spectra: np.ndarray,
+    window_length: int,
+    polyorder: int,
+    deriv: int = 0,
+    delta: float = 1.0,
+    mode: str = 'interp') -> tuple[np.ndarray, np.ndarray]:
+    '''
+    Applies a Savitzky-Golay filter along the last axis of an array of spectra.
+
+    The filter is linear, so it is applied to every NaN-free spectrum at once
+    as a single matrix product with a cached filter matrix. Spectra holding
+    NaN are filtered one by one with scipy.signal.savgol_filter.
+
+    Parameters
+    ----------
+    spectra: np.ndarray
+        Array of shape (..., n_wavelengths)
+
+    window_length, polyorder, deriv, delta, mode:
+        See scipy.signal.savgol_filter
+
+    Returns
+    ----------
+    smoothed: np.ndarray
+        Filtered spectra with the same shape as the input
+
+    failed: np.ndarray
+        Boolean array of shape spectra.shape[:-1] which is True where the
+        filter raised a LinAlgError, or a ValueError because mode='interp'
+        cannot fit the edges of a spectrum holding NaN. Those spectra are
+        returned unchanged.
+    '''
+    spectra = np.asarray(spectra, dtype=np.float64)
+    flat = spectra.reshape(-1, spectra.shape[-1])
+
+    smoothed = np.empty_like(flat)
+    failed = np.zeros(len(flat), dtype=bool)
+
+    finite = np.isfinite(flat).all(axis=1)
+    matrix = _savgol_matrix(flat.shape[1], window_length, polyorder, deriv, float(delta), mode)
+    smoothed[finite] = flat[finite] @ matrix.T
+
+    for i in np.flatnonzero(~finite):
+        from scipy.signal import savgol_filter
+        try:
+            smoothed[i] = savgol_filter(flat[i], window_length=window_length, polyorder=polyorder, deriv=deriv, delta=delta, mode=mode)
+        except (LinAlgError, ValueError):
+            smoothed[i] = flat[i]
+            failed[i] = True
+
+    return smoothed.reshape(spectra.shape), failed.reshape(spectra.shape[:-1])
+
+@lru_cache(maxsize=64)
+def _savgol_matrix(
+    n_points: int,
+    window_length: int,
+    polyorder: int,
+    deriv: int,
+    delta: float,
+    mode: str) -> np.ndarray:
+    '''
+    (n_points, n_points) matrix M for which M @ x equals savgol_filter(x).
+    Column j is the response of the filter to a unit impulse at point j.
+    '''
+    from scipy.signal import savgol_filter
+
+    matrix = savgol_filter(np.eye(n_points), window_length=window_length, polyorder=polyorder, deriv=deriv, delta=delta, axis=0, mode=mode)
+    matrix.setflags(write=False)
+    return matrix
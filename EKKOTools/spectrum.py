@@ -0,0 +1,184 @@
+'''
+Array-backed spectra with a shared wavelength axis.
+'''
+import numbers
+import numpy as np
+
+class Spectrum():
+    '''
+    One spectrum or a stack of spectra measured on the same wavelengths.
+
+    values has the shape (..., n_wavelengths) and wavelengths the shape
+    (n_wavelengths,). The wavelength array is shared, not copied, between
+    spectra derived from each other.
+
+    Spectra support +, -, * and / with other spectra on the same
+    wavelengths, with scalars and with arrays, following the NumPy
+    broadcasting rules. A stack of shape (n_wells, n_wavelengths) minus a
+    single spectrum subtracts it from every well:
+
+        samples = Spectrum.from_wells(wells, CD)
+        corrected = samples - Spectrum.from_well(blank, CD)
+
+    Indexing selects spectra of a stack and Spectrum.between selects a
+    wavelength range. Both return views.
+
+    Parameters
+    ----------
+    values: np.ndarray
+        Intensities with the wavelengths along the last axis
+
+    wavelengths: np.ndarray
+        Wavelengths (nm) of the last axis of values
+
+    wavelength_labels: list[str]
+        Wavelengths as they are written in the scan file (the keys of the
+        Well.CD, Well.ABS and Well.CD_PER_ABS dicts)
+    '''
+    __slots__ = ('values', 'wavelengths', 'wavelength_labels')
+
+    # Make NumPy defer to Spectrum for array <op> Spectrum
+    __array_priority__ = 1000
+
+    def __init__(
+        self,
+        values: np.ndarray,
+        wavelengths: np.ndarray,
+        wavelength_labels: list[str] = None):
+        self.values = np.asarray(values)
+        self.wavelengths = np.asarray(wavelengths)
+        if self.values.ndim == 0 or self.values.shape[-1] != len(self.wavelengths):
+            raise ValueError(f'Last axis of the values {self.values.shape} does not match the {len(self.wavelengths)} wavelengths')
+        if wavelength_labels is None:
+            wavelength_labels = [f'{wl:g}' for wl in self.wavelengths]
+        self.wavelength_labels = wavelength_labels
+
+    @classmethod
+    def from_well(cls, well, channel: int):
+        '''Current spectrum of a channel (EKKOTools.parsing.CD, ABS or CD_PER_ABS) of a Well'''
+        return cls(well.get_spectrum(channel), well.wavelengths, well.wavelength_labels)
+
+    @classmethod
+    def from_wells(cls, wells: list, channel: int):
+        '''Stack of shape (n_wells, n_wavelengths) of the spectra of wells measured on the same wavelengths'''
+        if len(wells) == 0:
+            raise ValueError('Cannot build a spectrum from no wells')
+        first = wells[0]
+        for well in wells[1:]:
+            if well.wavelength_labels != first.wavelength_labels:
+                raise ValueError(f'Well {well.name} of {well.parent_scanfile} was not measured at the same wavelengths as well {first.name}')
+        return cls(np.stack([well.get_spectrum(channel) for well in wells]), first.wavelengths, first.wavelength_labels)
+
+    @classmethod
+    def from_summary(cls, summary, channel: int):
+        '''
+        Stack of the current spectra of all wells of an EKKOScanSummary.
+        Unless spectra were assigned to the wells (e.g. by blank correction),
+        this is a view into the plate array, so nothing is copied.
+        '''
+        return cls(summary.get_current_spectra()[:, :, channel], summary.wavelengths, summary.wavelength_labels)
+
+    @classmethod
+    def from_dict(cls, spectrum: dict):
+        '''Spectrum from a wavelength:intensity dict like Well.CD'''
+        labels = list(spectrum.keys())
+        return cls(
+            np.fromiter(spectrum.values(), dtype=np.float64, count=len(spectrum)),
+            np.asarray(labels, dtype=np.float64),
+            labels)
+
+    def to_dict(self) -> dict:
+        '''wavelength:intensity dict like Well.CD. Only for a single spectrum.'''
+        if self.values.ndim != 1:
+            raise ValueError(f'Only a single spectrum can be converted to a dict, not a stack of shape {self.values.shape}')
+        return dict(zip(self.wavelength_labels, self.values.tolist()))
+
+    def __repr__(self) -> str:
+        return f'Spectrum(shape={self.shape}, wavelengths={self.wavelengths[0]:g}-{self.wavelengths[-1]:g})' if len(self.wavelengths) else f'Spectrum(shape={self.shape})'
+
+    @property
+    def shape(self) -> tuple:
+        return self.values.shape
+
+    @property
+    def ndim(self) -> int:
+        return self.values.ndim
+
+    def __len__(self) -> int:
+        return len(self.values)
+
+    def __array__(self, dtype=None, copy=None):
+        if dtype is None:
+            return self.values
+        return self.values.astype(dtype)
+
+    def __getitem__(self, index):
+        '''Selects spectra of a stack. The wavelength axis is always kept.'''
+        values = self.values[index]
+        if values.ndim == 0 or values.shape[-1] != self.values.shape[-1]:
+            raise IndexError('Indexing a Spectrum selects spectra of a stack, use between() to select wavelengths')
+        return Spectrum(values, self.wavelengths, self.wavelength_labels)
+
+    def __iter__(self):
+        for i in range(len(self)):
+            yield self[i]
+
+    def between(self, start: float, end: float):
+        '''View of the wavelengths from start to end (nm), both inclusive'''
+        inside = np.flatnonzero((self.wavelengths >= min(start, end)) & (self.wavelengths <= max(start, end)))
+        if len(inside) == 0:
+            window = slice(0, 0)
+        else:
+            window = slice(inside[0], inside[-1] + 1)
+        return Spectrum(self.values[..., window], self.wavelengths[window], self.wavelength_labels[window])
+
+    def mean(self, axis: int = 0):
+        '''Mean over an axis of the stack, ignoring NaN'''
+        return Spectrum(np.nanmean(self.values, axis=axis), self.wavelengths, self.wavelength_labels)
+
+    def _operand(self, other):
+        if isinstance(other, Spectrum):
+            if other.wavelengths is not self.wavelengths and not np.array_equal(other.wavelengths, self.wavelengths):
+                raise ValueError('Spectra must be measured have equal wavelengths measured.')
+            return other.values
+        if isinstance(other, (numbers.Number, np.ndarray, np.generic, list, tuple)):
+            return other
+        return NotImplemented
+
+    def _apply(self, other, operation, reflected: bool = False):
+        operand = self._operand(other)
+        if operand is NotImplemented:
+            return NotImplemented
+        with np.errstate(divide='ignore', invalid='ignore'):
+            values = operation(operand, self.values) if reflected else operation(self.values, operand)
+        return Spectrum(values, self.wavelengths, self.wavelength_labels)
+
+    def __add__(self, other):
+        return self._apply(other, np.add)
+
+    def __radd__(self, other):
+        return self._apply(other, np.add, reflected=True)
+
+    def __sub__(self, other):
+        return self._apply(other, np.subtract)
+
+    def __rsub__(self, other):
+        return self._apply(other, np.subtract, reflected=True)
+
+    def __mul__(self, other):
+        return self._apply(other, np.multiply)
+
+    def __rmul__(self, other):
+        return self._apply(other, np.multiply, reflected=True)
+
+    def __truediv__(self, other):
+        return self._apply(other, np.divide)
+
+    def __rtruediv__(self, other):
+        return self._apply(other, np.divide, reflected=True)
+
+    def __neg__(self):
+        return Spectrum(-self.values, self.wavelengths, self.wavelength_labels)
+
+    def __abs__(self):
+        return Spectrum(np.abs(self.values), self.wavelengths, self.wavelength_labels)
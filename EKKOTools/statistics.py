@@ -1,12 +1,25 @@
-import pandas as pd
-from itertools import combinations
-from sklearn.decomposition import PCA
-from sklearn.preprocessing import StandardScaler
+from __future__ import annotations
 
-from .EKKOScanFormats import EKKOScanSummary, Well
-from .utilities import GetAllSpectraFromWells
+import numpy as np
+import pickle
+from collections.abc import Iterator
+from math import comb
+from pathlib import Path
+
+from .lazy import LazyModule
+from .EKKOScanFormats import EKKOScanSummary, Well, _aligned_spectrum
+from .corpus import EKKOCorpus
+from .export import _summary_batches
+from .instrument import Staged
+from .store import SpectralStore
+from .utilities import GetAllSpectraFromWells, GetChannel, GetSpectraMatrix
 from .utilities import bcolors, SpectraType
 
+pd = LazyModule('pandas')
+
+# PickNSpectra compares every group of wells exactly up to this many groups
+EXACT_SEARCH_LIMIT = 100_000
+
 def CalculateStdSpectra(
     spectra: list[dict], 
     wl: int = 520, 
@@ -54,6 +67,7 @@ def CalculateAvgSpectra(
     df = pd.DataFrame(spectra)
     return df.describe().transpose()['mean'].to_dict()[str(wl)]
 
+@Staged('pickn')
 def PickN(
     l: list[Well], 
     n = 2, 
@@ -63,6 +77,11 @@ def PickN(
     '''
     Picks the n-closest spectra in a list at some wavelength by calculating the lowest
     standard deviation of the spectra at the selected wavelength.
+
+    The n values with the lowest standard deviation are always neighbours once
+    the values are sorted, so only the len(l) - n + 1 windows of the sorted
+    values are compared instead of every combination. The variance of every
+    window comes from running sums, so the search costs a sort plus O(len(l)).
     
     Parameters
     ----------
@@ -76,7 +95,8 @@ def PickN(
         Wavelength at which the standard deviation is to be calculated
 
     spectra_type: SpectraType
-        'cd', 'abs', or 'cd_per_abs'
+        'cd', 'abs', or 'cd_per_abs' if l holds Well objects, or None if l
+        holds spectra dictionaries
 
     verbose: Bool
         Prints the details of the spectrum selection process
@@ -86,74 +106,562 @@ def PickN(
     best: iterable[Well]
         The n-number of spectra which provide the lowest standard deviation 
     '''
-    combos = list(combinations(l, n))
-
     if len(l) < n:
         raise Exception('Number of spectra requested exceeds number of spectra provided')
 
-    # Initialize comparison variables with the first combination
-    best = combos[0]
-    best_std = CalculateStdSpectra(best, wl=wl, spectra_type=spectra_type)
-    best_avg = CalculateAvgSpectra(best, wl=wl, spectra_type=spectra_type)
+    if spectra_type == None:
+        if not all([isinstance(s, dict) for s in l]):
+            raise TypeError(f'Spectra type was {spectra_type} but not all items in spectra list were dicts')
+        values = np.array([s[str(wl)] for s in l], dtype=np.float64)
+    else:
+        if not all([isinstance(s, Well) for s in l]):
+            raise TypeError(f'Spectra type was {spectra_type} but not all items in spectra list were Well objects')
+        if len(set([x.analyte for x in l])) != 1:
+            raise Exception("All wells must have the same analyte")
+        values = _values_at(l, wl, GetChannel(spectra_type))
 
-    for combo in combos:
-        avg = CalculateAvgSpectra(combo, wl=wl, spectra_type=spectra_type)
-        std = CalculateStdSpectra(combo, wl=wl, spectra_type=spectra_type)
-        if std < best_std:
-            best = combo
-            best_std = std
-            best_avg = avg
+    best_idx, best_std, best_avg = _min_std_window(values, n)
+    best = tuple(l[i] for i in best_idx)
 
     if verbose:
         _verbose_statistics_printer(analyte=l[0].analyte, best_stddev=best_std, best_avg=best_avg, best_wells=list(best))
     
     return best
 
+@Staged('pickn')
+def PickNForAllAnalytes(
+    scan_summaries,
+    n = 2,
+    wl = 520,
+    spectra_type: SpectraType = 'cd_per_abs',
+    verbose = False) -> dict:
+    '''
+    Runs PickN for every analyte of an EKKOCorpus or a list of EKKOScanSummary
+    objects. The wells of each analyte come from the analyte index of the
+    corpus, and the values at wl of all of them are read in one pass over
+    the spectra arrays.
+
+    Parameters
+    ----------
+    scan_summaries: EKKOCorpus | list[EKKOScanSummary]
+        Summaries whose wells are grouped by analyte
+
+    n, wl, verbose:
+        See PickN
+
+    spectra_type: SpectraType
+        'cd', 'abs', or 'cd_per_abs'. Unlike PickN, which defaults to None
+        for spectra dictionaries, this always hands Well objects to PickN,
+        so it needs a spectra type and defaults to 'cd_per_abs' like
+        PickNSpectra.
+
+    Returns
+    ----------
+    dict
+        The best wells of each analyte keyed by analyte. Analytes with fewer
+        than n wells and wells without an analyte are left out.
+    '''
+    if not isinstance(scan_summaries, EKKOCorpus):
+        scan_summaries = EKKOCorpus(scan_summaries)
+
+    groups = [(analyte, scan_summaries.get_wells(analyte)) for analyte in sorted(scan_summaries.analytes - {None}, key=str)]
+    groups = [(analyte, wells) for analyte, wells in groups if len(wells) >= n]
+    values = _values_at([well for _, wells in groups for well in wells], wl, GetChannel(spectra_type))
+
+    best, start = {}, 0
+    for analyte, wells in groups:
+        best_idx, best_std, best_avg = _min_std_window(values[start:start + len(wells)], n)
+        start += len(wells)
+        best[analyte] = tuple(wells[i] for i in best_idx)
+        if verbose:
+            _verbose_statistics_printer(analyte=analyte, best_stddev=best_std, best_avg=best_avg, best_wells=list(best[analyte]))
+    return best
+
+def _values_at(wells: list[Well], wl, channel: int) -> np.ndarray:
+    '''
+    Current value of a channel of every well at the wavelength written as
+    str(wl) in the file. The position of the wavelength is looked up once
+    for every wavelength grid.
+    '''
+    label = str(wl)
+    positions = {}
+    values = np.empty(len(wells), dtype=np.float64)
+    for k, well in enumerate(wells):
+        labels = well.wavelength_labels
+        i = positions.get(id(labels))
+        if i is None:
+            try:
+                i = positions[id(labels)] = labels.index(label)
+            except ValueError:
+                raise KeyError(label) from None
+        values[k] = _aligned_spectrum(well, channel)[i]
+    return values
+
+def _min_std_window(values: np.ndarray, n: int) -> tuple:
+    '''
+    Returns the indices (in input order), the sample standard deviation and
+    the mean of the n values with the lowest standard deviation. Windows
+    which contain NaN are never selected. If every window does, the first
+    n values are returned.
+    '''
+    # NaN sorts last, so only the windows of the first n_finite values are free of it
+    order = np.argsort(values, kind='stable')
+    n_finite = int(np.count_nonzero(~np.isnan(values)))
+
+    if n < 2 or n_finite < n:
+        idx = np.arange(n)
+    else:
+        # Centering keeps the running sums of squares from cancelling
+        x = values[order[:n_finite]]
+        x = x - x.mean()
+        s1 = np.concatenate(([0.0], np.cumsum(x)))
+        s2 = np.concatenate(([0.0], np.cumsum(x * x)))
+        sums = s1[n:] - s1[:-n]
+        variances = (s2[n:] - s2[:-n] - sums * sums / n) / (n - 1)
+
+        # Windows within rounding error of the minimum are compared exactly,
+        # the first of equal windows wins
+        tolerance = 64 * np.finfo(np.float64).eps * n * float(np.max(x * x))
+        candidates = np.flatnonzero(variances <= variances.min() + tolerance)
+        exact = [x[start:start + n].var() for start in candidates]
+        start = int(candidates[int(np.argmin(exact))])
+        idx = np.sort(order[start:start + n])
+
+    chosen = values[idx]
+    std = float(chosen.std(ddof=1)) if n > 1 else np.nan
+    return idx.tolist(), std, float(chosen.mean())
+
+def PairwiseSpectralDistances(
+    wells: list[Well],
+    spectra_type: str = 'cd_per_abs',
+    metric: str = 'rms',
+    wl_range: list[float, float] = None) -> np.ndarray:
+    '''
+    Calculates the distance between the spectra of every pair of wells over
+    all wavelengths (or those within wl_range) in one vectorized pass.
+    Wavelengths at which any of the spectra is NaN are ignored.
+
+    Parameters
+    ----------
+    wells: list[Well]
+        Wells which were measured at the same wavelengths
+
+    spectra_type: str
+        'cd', 'abs', or 'cd_per_abs'
+
+    metric: str
+        'rms' is the root mean square difference of two spectra,
+        'relative_rms' is the rms divided by the root mean square
+        intensity of the pair and 'correlation' is 1 minus the Pearson
+        correlation of the two spectra
+
+    wl_range: list[float, float]
+        Lowest and highest wavelength (inclusive) to compare
+
+    Returns
+    ----------
+    np.ndarray
+        Symmetric (n_wells, n_wells) matrix of distances
+    '''
+    _, x = GetSpectraMatrix(wells, spectra_type=spectra_type, wl_range=wl_range)
+    x = x[:, ~np.isnan(x).any(axis=0)]
+
+    if x.shape[1] == 0:
+        raise ValueError('No wavelengths are left to compare the spectra')
+
+    if metric == 'correlation':
+        with np.errstate(divide='ignore', invalid='ignore'):
+            d = 1 - np.corrcoef(x)
+    elif metric in ('rms', 'relative_rms'):
+        # Squared distances from the Gram matrix: |a - b|^2 = |a|^2 + |b|^2 - 2ab
+        sq = np.einsum('ij,ij->i', x, x)
+        d = np.sqrt(np.clip(sq[:, None] + sq[None, :] - 2 * x @ x.T, 0, None) / x.shape[1])
+        if metric == 'relative_rms':
+            with np.errstate(divide='ignore', invalid='ignore'):
+                d = d / np.sqrt((sq[:, None] + sq[None, :]) / (2 * x.shape[1]))
+    else:
+        raise ValueError(f"metric must be 'rms', 'relative_rms' or 'correlation', not {metric}")
+
+    np.fill_diagonal(d, 0)
+    return d
+
+def PickNSpectra(
+    l: list[Well],
+    n = 2,
+    spectra_type: str = 'cd_per_abs',
+    metric: str = 'rms',
+    wl_range: list[float, float] = None,
+    method: str = 'auto',
+    exact_limit: int = EXACT_SEARCH_LIMIT,
+    verbose = False) -> tuple[Well]:
+    '''
+    Picks the n wells whose whole spectra agree best with one another, as
+    opposed to PickN which compares a single wavelength. The result can be
+    handed to GetAverageWell.
+
+    The group of n wells with the lowest mean pairwise distance according
+    to PairwiseSpectralDistances is returned. The exact search scores every
+    group on the distance matrix. The greedy search takes every well as a
+    seed together with its n - 1 nearest wells and improves each of these
+    groups by swapping single wells for as long as the score drops. Its
+    result is exact for n = 2, but for larger n it is only a local optimum
+    and can be worse than the result of the exact search.
+
+    Parameters
+    ----------
+    l: list[Well]
+        List which contains the EKKOTools.EKKOScanFormats.Well objects
+
+    n: int
+        Number of spectra which are to be selected
+
+    spectra_type, metric, wl_range:
+        See PairwiseSpectralDistances
+
+    method: str
+        'exact', 'greedy' or 'auto'. 'auto' searches exactly as long as
+        there are at most exact_limit groups (comb(len(l), n)) and greedily
+        above that. 'exact' keeps every group in memory
+
+    exact_limit: int
+        Largest number of groups for which 'auto' searches exactly
+
+    verbose: Bool
+        Prints the details of the spectrum selection process
+
+    Returns
+    ----------
+    best: tuple[Well]
+        The n wells with the lowest mean pairwise distance in the order of l
+    '''
+    if len(l) < n:
+        raise Exception('Number of spectra requested exceeds number of spectra provided')
+    if method not in ('auto', 'exact', 'greedy'):
+        raise ValueError(f"method must be 'auto', 'exact' or 'greedy', not {method!r}")
+
+    d = PairwiseSpectralDistances(l, spectra_type=spectra_type, metric=metric, wl_range=wl_range)
+    d = np.where(np.isnan(d), np.inf, d)
+
+    if method == 'exact' or (method == 'auto' and comb(len(l), n) <= exact_limit):
+        group, score = _exact_group(d, n)
+    else:
+        group, score = _greedy_group(d, n)
+    best = tuple(l[i] for i in np.sort(group))
+
+    if verbose:
+        pairs = n * (n - 1) / 2
+        mean_distance = score / pairs if pairs else 0.0
+        best_wells_str = ' '.join([str(t.parent_scanfile.name[:9]) + " " + t.name for t in best if t.parent_scanfile is not None])
+        print(f'{str(l[0].analyte).ljust(4)}:\tmean {metric}: {str(round(mean_distance, 4)).rjust(9)}\tnSpectra: {n}\tBest Wells: {best_wells_str}')
+
+    return best
+
+def _exact_group(d: np.ndarray, n: int) -> tuple[np.ndarray, float]:
+    '''Group of n wells with the lowest sum of pairwise distances, found by scoring every group'''
+    m = len(d)
+    # Groups are built one column at a time in increasing index order, each
+    # prefix only grows by the indices which still leave room for the rest
+    groups = np.arange(m - n + 1, dtype=np.intp)[:, None]
+    scores = np.zeros(len(groups))
+    for column in range(1, n):
+        last = groups[:, -1]
+        counts = m - n + column - last
+        starts = np.cumsum(counts) - counts
+        rows = np.repeat(np.arange(len(groups)), counts)
+        added = last[rows] + 1 + np.arange(len(rows)) - starts[rows]
+        scores = scores[rows] + d[groups[rows], added[:, None]].sum(axis=1)
+        groups = np.column_stack((groups[rows], added))
+    best = int(np.argmin(scores))
+    return groups[best], float(scores[best])
+
+def _greedy_group(d: np.ndarray, n: int) -> tuple[np.ndarray, float]:
+    '''Group of n wells with a low sum of pairwise distances, found by swapping wells of nearest-neighbour seeds'''
+    m = len(d)
+    groups = np.column_stack((np.arange(m), _nearest_excluding_self(d, n)))
+    seeds = np.arange(m)[:, None]
+    # Finite stand-in for missing distances, the swaps need differences
+    finite = np.where(np.isinf(d), d[np.isfinite(d)].max(initial=0.0) * m * n + 1.0, d)
+    for _ in range(m * n):
+        # Distance of every well to the members of every group
+        to_group = finite[groups].sum(axis=1)
+        member = np.take_along_axis(to_group, groups, axis=1)
+        # Change of the score if member i is swapped for well k
+        delta = to_group[:, None, :] - finite[groups] - member[:, :, None]
+        in_group = np.zeros((m, m), dtype=bool)
+        in_group[seeds, groups] = True
+        delta[np.broadcast_to(in_group[:, None, :], delta.shape)] = np.inf
+        flat = delta.reshape(m, -1).argmin(axis=1)
+        gain = delta.reshape(m, -1)[seeds[:, 0], flat]
+        improving = gain < -1e-12 * np.abs(member).sum(axis=1).clip(min=1.0)
+        if not improving.any():
+            break
+        rows = np.flatnonzero(improving)
+        i, k = np.divmod(flat[rows], m)
+        groups[rows, i] = k
+    scores = d[groups[:, :, None], groups[:, None, :]].sum(axis=(1, 2)) / 2
+    best = int(np.argmin(scores))
+    return groups[best], float(scores[best])
+
+def _nearest_excluding_self(d: np.ndarray, n: int) -> np.ndarray:
+    '''Indices of the n - 1 nearest wells of every well, not counting the well itself'''
+    if n < 2:
+        return np.empty((len(d), 0), dtype=int)
+    d = d.copy()
+    np.fill_diagonal(d, np.inf)
+    return np.argpartition(d, n - 2, axis=1)[:, :n - 1]
+
 def PCAWells(
     wells: list[Well], 
     n_comp: int = 3, 
     spectra_type: str = 'cd_per_abs', 
     umap = False, 
-    scale = True) -> None:
+    scale = True,
+    batch_size: int = None) -> pd.DataFrame:
     '''
     Performs PCA on the spectral data
-    '''
-    dfs = []
-
-    for well in wells:
-        if spectra_type.casefold() == 'cd':
-            spectrum = well.CD
 
-        elif spectra_type.casefold() == 'abs':
-            spectrum = well.ABS
-
-        elif spectra_type.casefold() == 'cd_per_abs':
-            spectrum = well.CD_PER_ABS
+    The wells must be measured at the same wavelengths. With batch_size,
+    the PCA is fit incrementally batch_size wells at a time with
+    SpectralPCA, which is also the way to transform new wells with a
+    saved model. UMAP needs the whole matrix at once, so umap cannot be
+    combined with batch_size.
+    '''
+    if umap and batch_size is not None:
+        raise ValueError('UMAP is fit on the whole spectra matrix, batch_size can only be used for PCA')
 
-        else:
-            raise Exception('Only CD, ABS, and CD_per_ABS are acceptable spectral types')
+    index = pd.Index([f'{well.analyte}' for well in wells])
 
-        wls = [f"WL_{x}" for x in spectrum.keys()]
-        data = [float(x) for x in spectrum.values()]
-        df = pd.DataFrame([wls, data]).transpose().rename(columns={1:f'{well.analyte}'}).set_index(0).transpose()
-        dfs.append(df)
+    if batch_size is not None:
+        return SpectralPCA(n_comp=n_comp, spectra_type=spectra_type, scale=scale, batch_size=batch_size).fit_transform(wells)
 
-    x = pd.concat(dfs)
+    _, x = GetSpectraMatrix(wells, spectra_type=spectra_type)
 
     if scale:
+        from sklearn.preprocessing import StandardScaler
         scaler = StandardScaler()
-        x[x.columns] = scaler.fit_transform(x[x.columns])
+        x = scaler.fit_transform(x)
 
     if umap:
         from umap import UMAP
         transformer = UMAP(n_components=n_comp)
         labels = [f"UMAP_{x + 1}" for x in range(n_comp)]
     else:
+        from sklearn.decomposition import PCA
         labels = [f"PC{x + 1}" for x in range(n_comp)]
         transformer = PCA(n_components=n_comp)
 
     
-    return pd.DataFrame(transformer.fit_transform(x), columns=labels, index=x.index) #columns=labels
+    return pd.DataFrame(transformer.fit_transform(x), columns=labels, index=index) #columns=labels
+
+class SpectralPCA():
+    '''
+    PCA of spectra which is fit out-of-core with sklearn's IncrementalPCA,
+    so the spectra never have to be held in memory at once, and which can
+    be saved and used to transform new wells without refitting.
+
+    Spectra are read batch_size wells at a time from any of the sources
+
+        list[Well], EKKOScanSummary, EKKOCorpus or list[EKKOScanSummary]
+        EKKOTools.store.SpectralStore (read from its memory map)
+        a folder of .cdxs files (parsed batch by batch)
+
+    Wells whose spectrum holds NaN or inf are skipped by fit and get NaN
+    components from transform.
+
+    fit with scale and fit_transform read the source twice, so they do not
+    accept one-shot iterators or generators. Pass a list instead, or fit
+    with scale=False or partial_fit, which read it once.
+
+    Parameters
+    ----------
+    n_comp: int
+        Number of principal components
+
+    spectra_type: str
+        'cd', 'abs', or 'cd_per_abs'
+
+    scale: bool
+        Standardize every wavelength before the PCA like PCAWells. This
+        takes one extra pass over the spectra in fit.
+
+    batch_size: int
+        Number of wells read and fit at once
+    '''
+    def __init__(
+        self,
+        n_comp: int = 3,
+        spectra_type: str = 'cd_per_abs',
+        scale: bool = True,
+        batch_size: int = 1000):
+        self.n_comp = n_comp
+        self.spectra_type = spectra_type
+        self.channel = GetChannel(spectra_type)
+        self.scale = scale
+        self.batch_size = max(batch_size, n_comp)
+
+        self.wavelength_labels = None
+        self.scaler = None
+        self.pca = None
+
+    @property
+    def labels(self) -> list[str]:
+        return [f"PC{x + 1}" for x in range(self.n_comp)]
+
+    @property
+    def explained_variance_ratio(self) -> np.ndarray:
+        return self.pca.explained_variance_ratio_
+
+    def fit(self, source):
+        '''Fits the scaler and the PCA to the spectra of a source'''
+        from sklearn.decomposition import IncrementalPCA
+        from sklearn.preprocessing import StandardScaler
+
+        if self.scale:
+            _check_reiterable(source, 'SpectralPCA.fit with scale=True')
+
+        self.wavelength_labels = None
+        self.scaler = StandardScaler() if self.scale else None
+        self.pca = IncrementalPCA(n_components=self.n_comp)
+
+        if self.scaler is not None:
+            for _, x in self._finite_batches(source):
+                self.scaler.partial_fit(x)
+
+        for _, x in _rebatch(self._finite_batches(source), self.batch_size, self.n_comp):
+            self.pca.partial_fit(self._scale(x))
+        return self
+
+    def partial_fit(self, source):
+        '''
+        Updates a fitted PCA with the spectra of a source, e.g. the plates of
+        a new day. The scaler is not refit.
+        '''
+        if self.pca is None:
+            return self.fit(source)
+        for _, x in _rebatch(self._finite_batches(source), self.batch_size, self.n_comp):
+            self.pca.partial_fit(self._scale(x))
+        return self
+
+    def transform(self, source) -> pd.DataFrame:
+        '''Principal components of the spectra of a source indexed by analyte like PCAWells'''
+        if self.pca is None:
+            raise ValueError('SpectralPCA must be fit before it can transform spectra')
+        index, blocks = [], []
+        for analytes, x in self._batches(source):
+            finite = np.isfinite(x).all(axis=1)
+            components = np.full((len(x), self.n_comp), np.nan)
+            if finite.any():
+                components[finite] = self.pca.transform(self._scale(x[finite]))
+            index.extend(analytes)
+            blocks.append(components)
+        x = np.concatenate(blocks) if blocks else np.empty((0, self.n_comp))
+        return pd.DataFrame(x, columns=self.labels, index=pd.Index(index))
+
+    def fit_transform(self, source) -> pd.DataFrame:
+        _check_reiterable(source, 'SpectralPCA.fit_transform')
+        return self.fit(source).transform(source)
+
+    def save(self, file: Path) -> None:
+        '''Pickles the fitted model. Only load models from trusted files.'''
+        with open(file, 'wb') as f:
+            pickle.dump(self, f)
+
+    @classmethod
+    def load(cls, file: Path):
+        with open(file, 'rb') as f:
+            model = pickle.load(f)
+        if not isinstance(model, cls):
+            raise TypeError(f'{file} does not hold a {cls.__name__}')
+        return model
+
+    def _scale(self, x: np.ndarray) -> np.ndarray:
+        return self.scaler.transform(x) if self.scaler is not None else x
+
+    def _finite_batches(self, source):
+        for analytes, x in self._batches(source):
+            finite = np.isfinite(x).all(axis=1)
+            yield [a for a, f in zip(analytes, finite) if f], x[finite]
+
+    def _batches(self, source):
+        '''Yields (analytes, spectra) with at most batch_size rows and checks the wavelengths'''
+        for labels, analytes, x in _spectra_batches(source, self.channel, self.spectra_type, self.batch_size):
+            if self.wavelength_labels is None:
+                self.wavelength_labels = list(labels)
+            elif list(labels) != self.wavelength_labels:
+                raise ValueError('Spectra must be measured have equal wavelengths measured.')
+            for start in range(0, len(x), self.batch_size):
+                yield analytes[start:start + self.batch_size], np.asarray(x[start:start + self.batch_size], dtype=np.float64)
+
+def _check_reiterable(source, reader: str) -> None:
+    '''Raises a TypeError for sources which would be used up by the first of several passes'''
+    if isinstance(source, Iterator):
+        raise TypeError(f'{reader} reads the source twice, but {type(source).__name__} can only be read once. Pass a list instead.')
+
+def _spectra_batches(source, channel: int, spectra_type: str, batch_size: int):
+    '''Yields (wavelength_labels, analytes, spectra) for the wells of a source'''
+    if isinstance(source, SpectralStore):
+        if len(source.grids) == 1:
+            matrix = source.get_channel(channel)
+            analytes = source.analytes
+            for start in range(0, len(matrix), batch_size):
+                codes = source.wells['analyte'][start:start + batch_size]
+                yield source.grids[0], [f'{analytes[a]}' if a >= 0 else 'None' for a in codes.tolist()], matrix[start:start + batch_size]
+            return
+        source = iter(source)
+    elif isinstance(source, (str, Path)):
+        # About batch_size wells of plates are parsed at a time
+        source = (summary for batch in _summary_batches(source, max(1, batch_size // 96), None, None, 'raise') for summary in batch)
+    elif isinstance(source, (Well, EKKOScanSummary)):
+        source = [source]
+    elif isinstance(source, EKKOCorpus):
+        source = source.summaries
+
+    batch = []
+    for item in source:
+        if isinstance(item, EKKOScanSummary):
+            yield item.wavelength_labels, [f'{well.analyte}' for well in item.wells], item.get_current_spectra()[:, :, channel]
+            continue
+        batch.append(item)
+        if len(batch) == batch_size:
+            yield _well_batch(batch, spectra_type)
+            batch = []
+    if batch:
+        yield _well_batch(batch, spectra_type)
+
+def _well_batch(wells: list[Well], spectra_type: str) -> tuple:
+    _, x = GetSpectraMatrix(wells, spectra_type=spectra_type)
+    return wells[0].wavelength_labels, [f'{well.analyte}' for well in wells], x
+
+def _rebatch(batches, batch_size: int, min_rows: int):
+    '''
+    Joins (analytes, spectra) batches into batches of batch_size rows. The
+    last batch is merged with the one before it if it has less than
+    min_rows rows, which IncrementalPCA.partial_fit requires.
+    '''
+    pending_analytes, pending = [], []
+    previous = None
+    for analytes, x in batches:
+        pending_analytes.extend(analytes)
+        pending.append(x)
+        if sum(len(p) for p in pending) >= batch_size:
+            x = np.concatenate(pending)
+            while len(x) >= batch_size:
+                if previous is not None:
+                    yield previous
+                previous = (pending_analytes[:batch_size], x[:batch_size])
+                pending_analytes, x = pending_analytes[batch_size:], x[batch_size:]
+            pending = [x]
+
+    rest = np.concatenate(pending) if pending else np.empty((0, 0))
+    if previous is not None and len(rest) < min_rows:
+        if len(rest):
+            previous = (previous[0] + pending_analytes, np.concatenate([previous[1], rest]))
+        yield previous
+        return
+    if previous is not None:
+        yield previous
+    if len(rest):
+        yield pending_analytes, rest
 
 def _verbose_statistics_printer(
     analyte: str = None, 
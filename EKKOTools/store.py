@@ -0,0 +1,245 @@
+'''
+Memory-mapped on-disk store of the spectra of many EKKOScanSummary objects.
+
+A store is a directory holding
+
+    spectra.npy    (3, n_values) array with one contiguous row per channel
+                   (see EKKOTools.parsing.CD, ABS and CD_PER_ABS). The wells
+                   of each summary occupy n_wells * n_wavelengths values.
+    wells.npy      Structured array with the label and analyte index of every well
+    meta.json      Wavelength grids, analytes and the header of every summary
+
+Opening a store only reads meta.json and memory maps the arrays, so it
+takes about the same time for ten files as for ten thousand. Summaries
+opened from a store are views into the memory map, and processes which
+open the same store share its pages through the OS page cache.
+'''
+import json
+import os
+import shutil
+import tempfile
+from functools import lru_cache
+from pathlib import Path
+
+import numpy as np
+
+from .EKKOScanFormats import EKKOScanSummary
+from .cache import _native
+from .export import _folder_pool, _summary_batches
+from .instrument import Staged
+from .parsing import ParsedScanSummary, N_CHANNELS
+
+STORE_VERSION = 1
+
+# Number of values copied at once when the channels are assembled
+_COPY_CHUNK = 1 << 20
+
+class SpectralStore():
+    '''
+    Read-only view of a store written by WriteSpectralStore.
+
+    Summaries are created on access and are not kept by the store, so
+    iterating over a large store holds one summary at a time.
+
+    Parameters
+    ----------
+    directory: Path
+        Directory of the store
+    '''
+    def __init__(self, directory: Path):
+        self.directory = Path(directory).resolve()
+        meta = json.loads((self.directory / 'meta.json').read_text())
+        if meta['version'] != STORE_VERSION:
+            raise ValueError(f'{self.directory} was written by an incompatible version of EKKOTools')
+
+        self.grids = meta['grids']
+        self.analytes = meta['analytes']
+        self._summaries = meta['summaries']
+
+        self.spectra = np.load(self.directory / 'spectra.npy', mmap_mode='r')
+        self.wells = np.load(self.directory / 'wells.npy', mmap_mode='r')
+
+    def __repr__(self) -> str:
+        return f'SpectralStore({str(self.directory)!r})'
+
+    def __len__(self) -> int:
+        return len(self._summaries)
+
+    def __getitem__(self, index: int) -> EKKOScanSummary:
+        return self.get_summary(index)
+
+    def __iter__(self):
+        for i in range(len(self)):
+            yield self.get_summary(i)
+
+    @property
+    def files(self) -> list[Path]:
+        return [Path(s['file']) for s in self._summaries]
+
+    def get_channel(self, channel: int) -> np.ndarray:
+        '''
+        All values of a channel as one contiguous memory-mapped array. If the
+        store holds a single wavelength grid, it has the shape
+        (n_wells, n_wavelengths) with one row per well.
+        '''
+        values = self.spectra[channel]
+        if len(self.grids) == 1:
+            return values.reshape(-1, len(self.grids[0]))
+        return values
+
+    def get_summary_spectra(self, index: int) -> np.ndarray:
+        '''
+        (n_wells, n_wavelengths, channel) view of the spectra of a summary
+        like EKKOScanSummary.spectra. Nothing is copied.
+        '''
+        s = self._summaries[index]
+        n_wavelengths = len(self.grids[s['grid']])
+        block = self.spectra[:, s['offset']:s['offset'] + s['n_wells'] * n_wavelengths]
+        return block.reshape(N_CHANNELS, s['n_wells'], n_wavelengths).transpose(1, 2, 0)
+
+    def get_summary(self, index: int) -> EKKOScanSummary:
+        '''Returns the EKKOScanSummary of a file of the store as a view into the memory map'''
+        if index < 0:
+            index += len(self)
+        s = self._summaries[index]
+        wells = self.wells[s['well_start']:s['well_start'] + s['n_wells']]
+        well_names = wells['name'].tolist()
+        analyte_map = {name: self.analytes[a] for name, a in zip(well_names, wells['analyte'].tolist()) if a >= 0}
+
+        parsed = ParsedScanSummary(
+            Path(s['file']),
+            s['header'],
+            well_names,
+            self.grids[s['grid']],
+            self.get_summary_spectra(index),
+            analyte_map)
+        summary = EKKOScanSummary.from_parsed(parsed)
+        summary._store = (str(self.directory), index)
+        return summary
+
+    def get_summaries(self) -> list[EKKOScanSummary]:
+        return [self.get_summary(i) for i in range(len(self))]
+
+    def get_well_indices(self, analyte: str) -> np.ndarray:
+        '''Indices (into wells and the rows of get_channel) of the wells of an analyte'''
+        try:
+            a = self.analytes.index(analyte)
+        except ValueError:
+            return np.empty(0, dtype=np.intp)
+        return np.flatnonzero(self.wells['analyte'] == a)
+
+@lru_cache(maxsize=16)
+def OpenSpectralStore(directory: str) -> SpectralStore:
+    '''
+    Returns a SpectralStore which is shared by all callers in this process.
+    Pickled summaries of a store use it to reattach to the memory map.
+    '''
+    return SpectralStore(directory)
+
+@Staged('export.store')
+def WriteSpectralStore(
+    scan_summaries,
+    directory: Path,
+    dtype = np.float64,
+    overwrite: bool = False,
+    batch_size: int = 100,
+    n_jobs: int = 1,
+    cache = None,
+    errors: str = 'raise') -> SpectralStore:
+    '''
+    Writes the current spectra and metadata of scan summaries to a store.
+
+    Parameters
+    ----------
+    scan_summaries: Path | EKKOCorpus | Iterable[EKKOScanSummary]
+        Summaries to store. A folder is parsed batch by batch like in
+        EKKOTools.export.WriteParquetDataset, so memory stays flat.
+
+    directory: Path
+        Directory of the store. It is created and must not exist unless
+        overwrite is True.
+
+    dtype:
+        np.float64, or np.float32 to halve the size of the store
+
+    batch_size, n_jobs, cache, errors:
+        See EKKOTools.export.WriteParquetDataset
+
+    Returns
+    ----------
+    SpectralStore
+        The opened store
+    '''
+    directory = Path(directory)
+    if directory.exists():
+        if not overwrite:
+            raise FileExistsError(f'{directory} already exists')
+        shutil.rmtree(directory)
+    directory.parent.mkdir(parents=True, exist_ok=True)
+    dtype = np.dtype(dtype)
+
+    # Everything is written to a temporary directory which is renamed at the end
+    tmp = Path(tempfile.mkdtemp(prefix=f'.{directory.name}-', dir=directory.parent))
+    pool = _folder_pool(scan_summaries, n_jobs)
+    try:
+        grids, analytes, summaries = {}, {}, []
+        well_names, well_analytes = [], []
+        n_values = 0
+
+        # The channels are streamed to one file each and assembled once the size is known
+        channel_files = [open(tmp / f'channel_{c}.tmp', 'wb') for c in range(N_CHANNELS)]
+        try:
+            for batch in _summary_batches(scan_summaries, batch_size, pool, cache, errors):
+                for summary in batch:
+                    spectra = summary.get_current_spectra()
+                    grid = grids.setdefault(tuple(summary.wavelength_labels), len(grids))
+                    summaries.append({
+                        'file': str(summary.file),
+                        'header': summary.header,
+                        'grid': grid,
+                        'well_start': len(well_names),
+                        'n_wells': len(spectra),
+                        'offset': n_values})
+                    for well in summary.wells:
+                        well_names.append(well.name)
+                        well_analytes.append(-1 if well.analyte is None else analytes.setdefault(_native(well.analyte), len(analytes)))
+                    for c, f in enumerate(channel_files):
+                        np.ascontiguousarray(spectra[:, :, c], dtype=dtype).tofile(f)
+                    n_values += spectra.shape[0] * spectra.shape[1]
+        finally:
+            for f in channel_files:
+                f.close()
+
+        values = np.lib.format.open_memmap(tmp / 'spectra.npy', mode='w+', dtype=dtype, shape=(N_CHANNELS, n_values))
+        for c in range(N_CHANNELS):
+            with open(tmp / f'channel_{c}.tmp', 'rb') as f:
+                for start in range(0, n_values, _COPY_CHUNK):
+                    chunk = np.fromfile(f, dtype=dtype, count=_COPY_CHUNK)
+                    values[c, start:start + len(chunk)] = chunk
+            os.remove(tmp / f'channel_{c}.tmp')
+        values.flush()
+        del values
+
+        label_width = max([len(name) for name in well_names], default=1)
+        wells = np.empty(len(well_names), dtype=[('name', f'U{label_width}'), ('analyte', np.int32)])
+        wells['name'] = well_names
+        wells['analyte'] = well_analytes
+        np.save(tmp / 'wells.npy', wells)
+
+        (tmp / 'meta.json').write_text(json.dumps({
+            'version': STORE_VERSION,
+            'dtype': dtype.str,
+            'grids': [list(grid) for grid in grids],
+            'analytes': list(analytes),
+            'summaries': summaries}))
+
+        os.replace(tmp, directory)
+    except BaseException:
+        shutil.rmtree(tmp, ignore_errors=True)
+        raise
+    finally:
+        if pool is not None:
+            pool.shutdown(cancel_futures=True)
+
+    OpenSpectralStore.cache_clear()
+    return SpectralStore(directory)
@@ -0,0 +1,145 @@
+'''
+Generator of synthetic EKKO ScanSummary files (.cdxs) for tests and benchmarks.
+
+The files follow the layout which EKKOScanSummary reads: the
+"Hinds Instruments CD Reader" header, the scan body with one block of
+blocksize rows per well and the "Well Info:" ... "End Annotation" trailer.
+'''
+import zlib
+import numpy as np
+from pathlib import Path
+
+from .parsing import HEADER_TEXT, EMPTY_WELL
+from .plates import GetPlateGeometry
+
+def WriteSyntheticScanSummary(
+    file: Path,
+    start: int = 400,
+    end: int = 700,
+    step: int = 5,
+    well_plate_type: str = '96 Well Plate',
+    analytes: list[str] = None,
+    date: str = '3/14/2023',
+    seed: int = None) -> Path:
+    '''
+    Writes a synthetic ScanSummary file with realistic looking CD and
+    absorbance spectra (a few Gaussian bands with noise) for every well.
+
+    Parameters
+    ----------
+    file: Path
+        File which is written. Should end in _summary.cdxs
+
+    start, end, step: int
+        Wavelength range (nm) of the scan process
+
+    well_plate_type: str
+        Plate type written to the header, e.g. '384 Well Plate'. See
+        EKKOTools.plates.GetPlateGeometry
+
+    analytes: list[str]
+        Analytes which are written to the Well Info table. They are assigned
+        to the wells column by column and repeated until the plate is full.
+        None leaves every well empty (MT).
+
+    date: str
+        Date written to the header
+
+    seed: int
+        Seed of the random number generator
+
+    Returns
+    ----------
+    Path
+        The file which was written
+    '''
+    file = Path(file)
+    rng = np.random.default_rng(seed)
+    plate = GetPlateGeometry(well_plate_type)
+    n_rows, n_columns = plate.shape
+    row_letters = plate.row_labels
+    wells = plate.labels
+    wavelengths = np.arange(start, end + step, step)
+
+    # Every analyte has its own bands so that replicates resemble each other
+    if analytes:
+        well_analytes = [analytes[i % len(analytes)] for i in range(len(wells))]
+        names = sorted(set(analytes))
+    else:
+        well_analytes = [None] * len(wells)
+        names = [None]
+    bands = {name: _random_bands(np.random.default_rng(zlib.crc32(str(name).encode())), start, end) for name in names}
+
+    lines = [
+        HEADER_TEXT,
+        f'{date}   10:22:11 AM',
+        'Operator:\tEKKOTools',
+        'Instrument:\tEKKO CD Microplate Reader',
+        f'Spectral Scan {start} to {end} nm step {step} nm',
+        'Averaging:\t1',
+        'PEM Frequency:\t50 kHz',
+        'Gain:\t1',
+        'Temperature:\t25 C',
+        f'Plate Type:\t{well_plate_type}',
+        'Read Time:\t60 s',
+        'WL\tCD-mDeg\tABS',
+    ]
+
+    for well, analyte in zip(wells, well_analytes):
+        cd_bands, abs_bands = bands[analyte]
+        scale = rng.normal(1, 0.03)
+        cd = scale * _spectrum(wavelengths, cd_bands) + rng.normal(0, 0.5, len(wavelengths))
+        absorbance = scale * _spectrum(wavelengths, abs_bands) + 0.05 + rng.normal(0, 0.005, len(wavelengths))
+        lines.append(f'{well}\t\t')
+        lines.extend(f'{wl}\t{c:.4f}\t{a:.4f}' for wl, c, a in zip(wavelengths, cd, absorbance))
+
+    lines.append('')
+    lines.extend(f'Annotation {i}:\t' for i in range(1, 16))
+    lines.append('Well Info:')
+    lines.append('\t' + '\t'.join(str(column) for column in range(1, n_columns + 1)))
+    for r, row in enumerate(row_letters):
+        cells = [well_analytes[(column - 1) * n_rows + r] for column in range(1, n_columns + 1)]
+        lines.append(row + '\t' + '\t'.join(EMPTY_WELL if cell is None else str(cell) for cell in cells))
+    lines.append('End Annotation')
+
+    file.write_text('\n'.join(lines) + '\n')
+    return file
+
+def WriteSyntheticCorpus(
+    folder: Path,
+    n_files: int,
+    n_analytes: int = 24,
+    seed: int = 0,
+    **kwargs) -> list[Path]:
+    '''
+    Writes n_files synthetic ScanSummary files to a folder. The analytes
+    analyte_0 ... analyte_<n_analytes - 1> are spread over the files so
+    that every analyte has replicates in many files.
+
+    Keyword arguments are handed to WriteSyntheticScanSummary.
+    '''
+    folder = Path(folder)
+    folder.mkdir(parents=True, exist_ok=True)
+    analytes = [f'analyte_{i}' for i in range(n_analytes)]
+
+    files = []
+    for i in range(n_files):
+        shift = i % n_analytes
+        files.append(WriteSyntheticScanSummary(
+            folder / f'SYN_{i:05d}_summary.cdxs',
+            analytes=analytes[shift:] + analytes[:shift],
+            seed=seed + i,
+            **kwargs))
+    return files
+
+def _random_bands(rng: np.random.Generator, start: float, end: float) -> tuple:
+    '''Random (center, width, amplitude) Gaussian bands for the CD and ABS spectra'''
+    n = rng.integers(1, 4)
+    centers = rng.uniform(start, end, n)
+    widths = rng.uniform(10, 40, n)
+    cd = list(zip(centers, widths, rng.uniform(-60, 60, n)))
+    absorbance = list(zip(centers, widths * 1.2, rng.uniform(0.2, 1.5, n)))
+    return cd, absorbance
+
+def _spectrum(wavelengths: np.ndarray, bands: list) -> np.ndarray:
+    return sum(a * np.exp(-0.5 * ((wavelengths - c) / w) ** 2) for c, w, a in bands)
@@ -1,10 +1,24 @@
-from .EKKOScanFormats import Well, EKKOScanSummary
+from __future__ import annotations
+
+from .lazy import LazyModule
+from .EKKOScanFormats import Well, EKKOScanSummary, _aligned_spectrum
+from .corpus import EKKOCorpus
+from .aggregate import AggregateReplicates, _wells_and_spectra, _select
+from .resample import CommonGrid, ResampleSpectra, _grid_key
+from .parsing import CD, ABS, CD_PER_ABS
+from .instrument import Staged, Count
 from pathlib import Path
 from enum import Enum
+from functools import lru_cache
+from concurrent.futures import Executor, ProcessPoolExecutor, ThreadPoolExecutor, as_completed
 
-import pandas as pd
+import numpy as np
 
-import copy
+import math
+import os
+import warnings
+
+pd = LazyModule('pandas')
 
 class bcolors:
     HEADER = '\033[95m'
@@ -22,10 +36,30 @@ class SpectraType(Enum):
     ABS = 'abs'
     CD_PER_ABS = 'cd_per_abs'
 
+# Channel of Well.spectra which holds each SpectraType
+SPECTRA_CHANNELS = {
+    SpectraType.CD: CD,
+    SpectraType.ABS: ABS,
+    SpectraType.CD_PER_ABS: CD_PER_ABS,
+}
+
+def GetChannel(spectra_type) -> int:
+    '''
+    Returns the channel of Well.spectra for a SpectraType or one of the
+    strings 'cd', 'abs' and 'cd_per_abs'
+    '''
+    if not isinstance(spectra_type, SpectraType):
+        try:
+            spectra_type = SpectraType(str(spectra_type).casefold())
+        except ValueError:
+            raise Exception('Only CD, ABS, and CD_per_ABS are acceptable spectral types')
+    return SPECTRA_CHANNELS[spectra_type]
+
 def _getSpectrumDifference(
     d1: dict,
     d2: dict,
-    compare: SpectraType = SpectraType.CD) -> dict:
+    compare: SpectraType = SpectraType.CD,
+    method: str = None) -> dict:
     '''
     Calculates the difference between two spectra which are formatted
     as dictionaries. The dictionary keys are the wavelengths which
@@ -42,14 +76,21 @@ def _getSpectrumDifference(
         Dictionary with the wavelengths as keys and the spectral signal
         as its values.
 
+    method: str
+        If the spectra were measured at different wavelengths, they are
+        resampled onto the wavelengths which both cover with 'linear' or
+        'cubic' interpolation (see EKKOTools.resample). By default
+        different wavelengths raise a ValueError.
+
     Returns
     ----------
     dict
     '''
     # Check the dictionaries are equal
-    #TODO Add support for unequal length measurements (i.e., change of method in EKKO spectrometer)
     if d1.keys() != d2.keys():
-        raise ValueError('Spectra must be measured have equal wavelengths measured.')
+        if method is None:
+            raise ValueError('Spectra must be measured have equal wavelengths measured.')
+        d1, d2 = _align_spectrum_dicts(d1, d2, method)
 
     return {x: d1[x] - d2[x] for x in d1 if x in d2}
 
@@ -57,7 +98,8 @@ def _getSpectrumDifference(
 def getSpectrumSum(
     d1: dict,
     d2: dict,
-    compare: SpectraType = SpectraType.CD) -> dict:
+    compare: SpectraType = SpectraType.CD,
+    method: str = None) -> dict:
     '''
     Calculates the sum between two spectra which are formatted
     as dictionaries. The dictionary keys are the wavelengths which
@@ -74,17 +116,34 @@ def getSpectrumSum(
         Dictionary with the wavelengths as keys and the spectral signal
         as its values.
 
+    method: str
+        If the spectra were measured at different wavelengths, they are
+        resampled onto the wavelengths which both cover with 'linear' or
+        'cubic' interpolation (see EKKOTools.resample). By default
+        different wavelengths raise a ValueError.
+
     Returns
     ----------
     dict
     '''
     # Check the dictionaries are equal
-    #TODO Add support for unequal length measurements (i.e., change of method in EKKO spectrometer)
     if d1.keys() != d2.keys():
-        raise ValueError('Spectra must be measured have equal wavelengths measured.')
+        if method is None:
+            raise ValueError('Spectra must be measured have equal wavelengths measured.')
+        d1, d2 = _align_spectrum_dicts(d1, d2, method)
 
     return {x: d1[x] + d2[x] for x in d1 if x in d2}
 
+def _align_spectrum_dicts(d1: dict, d2: dict, method: str) -> tuple[dict, dict]:
+    '''Resamples two spectrum dicts onto the wavelengths which both cover'''
+    w1 = np.array(list(d1.keys()), dtype=np.float64)
+    w2 = np.array(list(d2.keys()), dtype=np.float64)
+    grid = CommonGrid([w1, w2], policy='intersection')
+    labels = [f'{wl:g}' for wl in grid]
+    y1 = ResampleSpectra(np.fromiter(d1.values(), dtype=np.float64, count=len(d1)), w1, grid, method=method)
+    y2 = ResampleSpectra(np.fromiter(d2.values(), dtype=np.float64, count=len(d2)), w2, grid, method=method)
+    return dict(zip(labels, y1.tolist())), dict(zip(labels, y2.tolist()))
+
 def GetDifferenceWell(
     w1: Well,
     w2: Well) -> Well:
@@ -107,37 +166,157 @@ def GetDifferenceWell(
         CD, ABS, and CD_PER_ABS
     '''
 
-    # Make a new copy of the well
-    newWell = copy.deepcopy(w1)
-    
+    # The new well shares the measured data of w1 and only holds the differences
+    newWell = Well(w1.spectra, w1.wavelengths, w1.name, w1.parent_scanfile, wavelength_labels=w1.wavelength_labels)
+
     # Change the analyte
     newWell.analyte = f'{w1.analyte} - {w2.analyte}'
 
-    cd1 = w1.CD
-    cd2 = w2.CD
-    #newWell.CD = {x: cd1[x] - cd2[x] for x in cd1 if x in cd2}
-    newWell.CD = _getSpectrumDifference(cd1,cd2)
-
-    abs1 = w1.ABS
-    abs2 = w2.ABS
-    newWell.ABS = _getSpectrumDifference(abs1,abs2)
-
-    cd_per_abs1 = w1.CD_PER_ABS
-    cd_per_abs2 = w2.CD_PER_ABS
-    newWell.CD_PER_ABS = _getSpectrumDifference(cd_per_abs1, cd_per_abs2)
+    for attribute, channel in (('CD', CD), ('ABS', ABS), ('CD_PER_ABS', CD_PER_ABS)):
+        try:
+            difference = w1.as_spectrum(channel) - w2.as_spectrum(channel)
+        except ValueError:
+            # Spectra assigned with other wavelengths than the wells were measured at
+            difference = _getSpectrumDifference(getattr(w1, attribute), getattr(w2, attribute))
+        setattr(newWell, attribute, difference)
 
     return newWell
 
-def GetAllEKKOScanSummaries(p: Path) -> list[EKKOScanSummary]:
+def GetAllEKKOScanSummaries(
+    p: Path,
+    n_jobs: int = 1,
+    executor = 'process',
+    chunksize: int = None,
+    ordered: bool = True,
+    errors: str = 'raise',
+    cache = None) -> list[EKKOScanSummary]:
     '''
     Returns all EKKOScanSummaries in a directory
+
+    Parameters
+    ----------
+    p: Path
+        Directory which contains the .cdxs files
+
+    n_jobs: int
+        Number of workers used to parse the files. 1 parses the files serially
+        in this process and None or -1 uses one worker per CPU.
+
+    executor: str | concurrent.futures.Executor
+        'process' or 'thread' to create a pool of n_jobs workers, or an
+        existing Executor which is used as-is
+
+    chunksize: int
+        Number of files handed to a worker at once. By default the files are
+        split into about four chunks per worker.
+
+    ordered: bool
+        Return the summaries in directory order. If False, they are returned
+        in the order in which they finish.
+
+    errors: str
+        'raise' stops at the first file which cannot be parsed, 'warn' skips
+        it with a warning and 'ignore' skips it silently
+
+    cache: ScanSummaryCache | bool
+        Cache of parsed files handed to EKKOScanSummary. True uses the
+        default cache directory.
+
+    Returns
+    ----------
+    list[EKKOScanSummary]
     '''
     if not isinstance(p, Path):
         p = Path(p)
     if not p.is_dir():
         raise NotADirectoryError('Can only find scan summaries within a directory')
+    if errors not in ('raise', 'warn', 'ignore'):
+        raise ValueError(f"errors must be 'raise', 'warn' or 'ignore', not {errors}")
+
+    summaries = []
+    for file, summary, error in IterEKKOScanSummaries(
+        p.glob('*.cdxs'),
+        n_jobs=n_jobs,
+        executor=executor,
+        chunksize=chunksize,
+        ordered=ordered,
+        cache=cache):
+        if error is None:
+            summaries.append(summary)
+        elif errors == 'raise':
+            raise error
+        elif errors == 'warn':
+            warnings.warn(f'Could not read {file.name}: {error}')
+
+    return summaries
+
+def IterEKKOScanSummaries(
+    files: list[Path],
+    n_jobs: int = 1,
+    executor = 'process',
+    chunksize: int = None,
+    ordered: bool = True,
+    cache = None):
+    '''
+    Parses .cdxs files, optionally in a pool of workers, and yields a
+    (file, summary, error) tuple for each of them. If a file could not be
+    parsed, summary is None and error holds the exception so that one bad
+    file does not abort the batch.
 
-    return [EKKOScanSummary(x) for x in p.glob('*.cdxs')]
+    See GetAllEKKOScanSummaries for the parameters.
+    '''
+    files = [Path(f) for f in files]
+
+    if n_jobs is None or n_jobs < 1:
+        n_jobs = os.cpu_count() or 1
+
+    if n_jobs == 1 and not isinstance(executor, Executor):
+        for file in files:
+            yield _read_scan_summary(file, cache)
+        return
+
+    if chunksize is None:
+        chunksize = max(1, math.ceil(len(files) / (4 * n_jobs)))
+    chunks = [files[i:i + chunksize] for i in range(0, len(files), chunksize)]
+
+    if isinstance(executor, Executor):
+        pool = executor
+    elif executor == 'process':
+        pool = ProcessPoolExecutor(max_workers=n_jobs)
+    elif executor == 'thread':
+        pool = ThreadPoolExecutor(max_workers=n_jobs)
+    else:
+        raise ValueError(f"executor must be 'process', 'thread' or an Executor, not {executor}")
+
+    # Worker processes do not share the instrumentation of this process, so their results are counted here
+    count = isinstance(pool, ProcessPoolExecutor)
+    try:
+        futures = [pool.submit(_read_scan_summaries, chunk, cache) for chunk in chunks]
+        for future in (futures if ordered else as_completed(futures)):
+            for result in future.result():
+                if count and result[1] is not None:
+                    Count('files')
+                    Count('wells', len(result[1].wells))
+                yield result
+    finally:
+        if pool is not executor:
+            pool.shutdown(cancel_futures=True)
+
+def _read_scan_summaries(files: list[Path], cache = None) -> list[tuple]:
+    '''Worker for IterEKKOScanSummaries which parses a chunk of files'''
+    return [_read_scan_summary(file, cache) for file in files]
+
+def _read_scan_summary(file: Path, cache = None) -> tuple:
+    try:
+        return (file, EKKOScanSummary(file, cache=cache), None)
+    except Exception as e:
+        return (file, None, e)
+
+# Lookup methods of SampleWavelengths
+SAMPLING_METHODS = ['nearest', 'linear']
+
+# Combinations of two sampled wavelengths of GetSignalRatios
+SIGNAL_OPERATIONS = ['ratio', 'difference']
 
 def GetSignalRatio(
     well: Well, 
@@ -147,17 +326,200 @@ def GetSignalRatio(
     ) -> float:
     '''
     Given a Well and two wavelengths, calculates the ratio of wavelength_1 to 
-    wavelength_2
+    wavelength_2. The wavelengths are compared as numbers, so 520 and
+    '520.0' are the same wavelength. For many wells and wavelength pairs at
+    once use GetSignalRatios.
+    '''
+    channel = GetChannel(spectra_type)
+    wavelengths = np.asarray(well.wavelengths, dtype=np.float64)
+    index, _, _, found = _wavelength_lookup(_grid_key(wavelengths), (float(wavelength_1), float(wavelength_2)), 'nearest', None)
+    if not found.all():
+        missing = [wl for wl, f in zip((wavelength_1, wavelength_2), found) if not f]
+        raise KeyError(f'Well {well.name} was not measured at {missing}')
+
+    spectrum = _aligned_spectrum(well, channel)
+    return float(spectrum[index[0]]) / float(spectrum[index[1]])
+
+def SampleWavelengths(
+    wells,
+    wavelengths: list[float],
+    spectra_type: str = 'cd',
+    method: str = 'nearest',
+    tolerance: float = None,
+    as_frame: bool = True):
     '''
-    #TODO Get all of this conditional/string interpretation out of here.
-    if spectra_type.casefold() == 'cd':
-        spectrum = well.get_CD()
-    elif spectra_type.casefold() == 'abs':
-        spectrum = well.get_abs()
-    elif spectra_type.casefold() == 'cd_per_abs':
-        spectrum = well.get_CD_per_abs()
+    Samples the current spectra of many wells at a set of wavelengths in
+    one vectorized lookup per wavelength grid. The indices and weights of
+    the lookup are computed once per grid and cached.
+
+    Parameters
+    ----------
+    wells: list[Well] | EKKOScanSummary | EKKOCorpus | list[EKKOScanSummary]
+        Wells to sample
 
-    return float(spectrum[str(wavelength_1)]) / float(spectrum[str(wavelength_2)])
+    wavelengths: list[float]
+        Wavelengths (nm) to sample. Strings like '520' are accepted.
+
+    spectra_type: str
+        'cd', 'abs', or 'cd_per_abs'
+
+    method: str
+        'nearest' takes the measured wavelength closest to each requested
+        one. 'linear' interpolates between the two neighbouring measured
+        wavelengths.
+
+    tolerance: float
+        Largest distance (nm) from a requested wavelength to the closest
+        measured wavelength. Values beyond it are NaN. By default 'nearest'
+        only accepts measured wavelengths and 'linear' accepts any
+        wavelength within the measured range.
+
+    as_frame: bool
+        Return a DataFrame with the columns file, well and analyte and one
+        column per wavelength, rather than an array
+
+    Returns
+    ----------
+    pd.DataFrame | np.ndarray
+        Sampled intensities. The array has the shape (n_wells, n_wavelengths).
+    '''
+    wells, sampled = _sample_wavelengths(wells, [float(wl) for wl in wavelengths], spectra_type, method, tolerance)
+    if not as_frame:
+        return sampled
+    return _well_frame(wells, {f'{float(wl):g}': sampled[:, k] for k, wl in enumerate(wavelengths)})
+
+def GetSignalRatios(
+    wells,
+    pairs: list[tuple[float, float]],
+    spectra_type: str = 'cd',
+    operation: str = 'ratio',
+    method: str = 'nearest',
+    tolerance: float = None,
+    as_frame: bool = True):
+    '''
+    Ratios (or differences) of the signals at pairs of wavelengths for
+    every well, computed from one SampleWavelengths call.
+
+    Parameters
+    ----------
+    wells: list[Well] | EKKOScanSummary | EKKOCorpus | list[EKKOScanSummary]
+        Wells to screen
+
+    pairs: list[tuple[float, float]]
+        (wavelength_1, wavelength_2) pairs. Each result is the signal at
+        wavelength_1 divided by (or minus) the signal at wavelength_2.
+
+    spectra_type: str
+        'cd', 'abs', or 'cd_per_abs'
+
+    operation: str
+        'ratio' or 'difference'
+
+    method, tolerance:
+        See SampleWavelengths
+
+    as_frame: bool
+        Return a DataFrame with the columns file, well and analyte and one
+        column per pair (e.g. '520/600'), rather than an array
+
+    Returns
+    ----------
+    pd.DataFrame | np.ndarray
+        The array has the shape (n_wells, n_pairs).
+    '''
+    if operation not in SIGNAL_OPERATIONS:
+        raise ValueError(f'operation must be one of {SIGNAL_OPERATIONS}, not {operation}')
+    pairs = [(float(wl_1), float(wl_2)) for wl_1, wl_2 in pairs]
+
+    # Every wavelength is sampled once, also if it appears in several pairs
+    targets = list(dict.fromkeys(wl for pair in pairs for wl in pair))
+    column = {wl: k for k, wl in enumerate(targets)}
+    wells, sampled = _sample_wavelengths(wells, targets, spectra_type, method, tolerance)
+
+    first = sampled[:, [column[wl_1] for wl_1, _ in pairs]]
+    second = sampled[:, [column[wl_2] for _, wl_2 in pairs]]
+    with np.errstate(divide='ignore', invalid='ignore'):
+        result = first / second if operation == 'ratio' else first - second
+
+    if not as_frame:
+        return result
+    symbol = '/' if operation == 'ratio' else '-'
+    return _well_frame(wells, {f'{wl_1:g}{symbol}{wl_2:g}': result[:, k] for k, (wl_1, wl_2) in enumerate(pairs)})
+
+def _sample_wavelengths(wells, targets: list[float], spectra_type, method: str, tolerance: float) -> tuple:
+    '''Flat list of the wells and their (n_wells, n_targets) samples'''
+    if method not in SAMPLING_METHODS:
+        raise ValueError(f'method must be one of {SAMPLING_METHODS}, not {method}')
+    channel = GetChannel(spectra_type)
+    targets = tuple(targets)
+
+    wells, spectra = _wells_and_spectra(wells)
+    rows_by_grid = {}
+    for i, well in enumerate(wells):
+        rows_by_grid.setdefault(tuple(well.wavelength_labels), []).append(i)
+
+    sampled = np.full((len(wells), len(targets)), np.nan)
+    for rows in rows_by_grid.values():
+        index, neighbour, weight, found = _wavelength_lookup(_grid_key(wells[rows[0]].wavelengths), targets, method, tolerance)
+        values = _select(spectra, rows)[:, :, channel]
+        with np.errstate(invalid='ignore'):
+            block = values[:, index] * (1 - weight) + values[:, neighbour] * weight
+        block[:, ~found] = np.nan
+        sampled[rows] = block
+    return wells, sampled
+
+def _well_frame(wells: list[Well], columns: dict) -> pd.DataFrame:
+    table = pd.DataFrame({
+        'file': [getattr(well.parent_scanfile, 'name', well.parent_scanfile) for well in wells],
+        'well': [well.name for well in wells],
+        'analyte': [well.analyte for well in wells]})
+    for name, values in columns.items():
+        table[name] = values
+    return table
+
+@lru_cache(maxsize=128)
+def _wavelength_lookup(grid: tuple, targets: tuple, method: str, tolerance: float) -> tuple:
+    '''
+    Indices into the grid for sampling the targets. A sampled value is
+    y[index] * (1 - weight) + y[neighbour] * weight, and found marks the
+    targets within the tolerance.
+    '''
+    grid = np.asarray(grid)
+    targets = np.asarray(targets, dtype=np.float64)
+    n = len(targets)
+    if len(grid) == 0:
+        empty = np.zeros(n, dtype=np.intp)
+        return empty, empty, np.zeros(n), np.zeros(n, dtype=bool)
+
+    order = np.argsort(grid, kind='stable')
+    xs = grid[order]
+
+    # Closest measured wavelength of every target
+    right = np.clip(np.searchsorted(xs, targets), 1, len(xs) - 1) if len(xs) > 1 else np.zeros(n, dtype=np.intp)
+    left = np.maximum(right - 1, 0)
+    closest = np.where(np.abs(targets - xs[left]) <= np.abs(xs[right] - targets), left, right)
+    distance = np.abs(xs[closest] - targets)
+    rounding = 1e-9 * max(1.0, np.abs(xs).max())
+
+    if method == 'nearest':
+        found = distance <= (rounding if tolerance is None else tolerance + rounding)
+        index = neighbour = order[closest]
+        weight = np.zeros(n)
+    else:
+        found = (targets >= xs[0] - rounding) & (targets <= xs[-1] + rounding)
+        if tolerance is not None:
+            found &= distance <= tolerance + rounding
+        with np.errstate(divide='ignore', invalid='ignore'):
+            weight = np.clip((targets - xs[left]) / (xs[right] - xs[left]), 0.0, 1.0)
+        # Exact matches use a single point, so a NaN neighbour does not spread
+        exact = distance <= rounding
+        index = np.where(exact, order[closest], order[left])
+        neighbour = np.where(exact, order[closest], order[right])
+        weight = np.where(exact | ~np.isfinite(weight), 0.0, weight)
+
+    for array in (index, neighbour, weight, found):
+        array.setflags(write=False)
+    return index, neighbour, weight, found
 
 def GetAllSpectraFromWells(
     wells: list[Well] = None, 
@@ -197,6 +559,57 @@ def GetAllSpectraFromWells(
 
     return spectra
 
+def GetSpectraMatrix(
+    wells: list[Well],
+    spectra_type: str = 'cd',
+    wl_range: list[float, float] = None) -> tuple[np.ndarray, np.ndarray]:
+    '''
+    Stacks the spectra of a list of wells into one matrix.
+
+    Parameters
+    ----------
+    wells: list[Well]
+        Wells which were measured at the same wavelengths
+
+    spectra_type: str
+        'cd', 'abs', or 'cd_per_abs'
+
+    wl_range: list[float, float]
+        Lowest and highest wavelength (inclusive) to keep. None keeps all.
+
+    Returns
+    ----------
+    wavelengths: np.ndarray
+        Wavelengths of the columns, shape (n_wavelengths,)
+
+    spectra: np.ndarray
+        float64 array of shape (n_wells, n_wavelengths)
+    '''
+    if isinstance(wells, Well):
+        wells = [wells]
+
+    channel = GetChannel(spectra_type)
+    labels = wells[0].wavelength_labels
+    try:
+        if any(w.wavelength_labels is not labels and w.wavelength_labels != labels for w in wells):
+            raise ValueError
+        wavelengths = np.asarray(wells[0].wavelengths, dtype=np.float64)
+        matrix = np.stack([w.get_spectrum(channel) for w in wells])
+    except ValueError:
+        # Fall back on the spectrum dicts, which may have been assigned with other wavelengths
+        spectra = GetAllSpectraFromWells(wells, spectra_type=spectra_type, all_same_analyte=False)
+        keys = list(spectra[0].keys())
+        if any(list(s.keys()) != keys for s in spectra[1:]):
+            raise ValueError('Spectra must be measured have equal wavelengths measured.')
+        wavelengths = np.array(keys, dtype=np.float64)
+        matrix = np.array([list(s.values()) for s in spectra], dtype=np.float64)
+
+    if wl_range is not None:
+        keep = (wavelengths >= wl_range[0]) & (wavelengths <= wl_range[1])
+        wavelengths, matrix = wavelengths[keep], matrix[:, keep]
+
+    return wavelengths, matrix
+
 def GetAllWells(
     scan_summaries: list = None,
     analyte: str = '') -> list[Well]:
@@ -207,8 +620,9 @@ def GetAllWells(
     
     Parameters
     ----------
-    scan_summaries: list[EKKOScanSummary]
-        List of EKKOScanSummary objects which is to be searched
+    scan_summaries: list[EKKOScanSummary] | EKKOCorpus
+        List of EKKOScanSummary objects which is to be searched. An
+        EKKOCorpus is searched through its analyte index.
 
     analyte: str
         Name of the analyte of interest
@@ -219,6 +633,9 @@ def GetAllWells(
         A list of Well objects which possess the <analyte> str
     '''
 
+    if isinstance(scan_summaries, EKKOCorpus):
+        return scan_summaries.get_wells(analyte)
+
     # Check if a single EKKOScanSummary was passed
     if isinstance(scan_summaries, EKKOScanSummary):
         scan_summaries = [scan_summaries]
@@ -231,7 +648,7 @@ def GetAllWells(
                 wells.append(well)
     return wells
 
-def GetAllAnalytes(folder: Path) -> set[str]:
+def GetAllAnalytes(folder: Path, cache = None) -> set[str]:
     '''
     Finds all the Well objects within a list of EKKOScanSummary objects
     that possess an analyte property (Well.analyte) which is equal to the
@@ -239,14 +656,21 @@ def GetAllAnalytes(folder: Path) -> set[str]:
     
     Parameters
     ----------
-    folder: Path
-        Folder which contains the datafiles from the EKKO spectrometer
+    folder: Path | EKKOCorpus
+        Folder which contains the datafiles from the EKKO spectrometer, or
+        an EKKOCorpus whose analyte index is used instead
+
+    cache: ScanSummaryCache | bool
+        Cache of parsed files handed to GetAllEKKOScanSummaries
 
     Returns
     ----------
     analytes: set
         A set of all analyte strings
     '''
+    if isinstance(folder, EKKOCorpus):
+        return folder.analytes
+
     # If given a single EKKOScanSummary, return all the analytes
     if isinstance(folder, EKKOScanSummary):
         return set([x.analyte for x in folder.wells])
@@ -257,7 +681,7 @@ def GetAllAnalytes(folder: Path) -> set[str]:
             raise ValueError(f'{folder} is not a directory.')
 
     analytes = set()
-    ss = GetAllEKKOScanSummaries(folder)
+    ss = GetAllEKKOScanSummaries(folder, cache=cache)
 
     for summary in ss:
         for well in summary.wells:
@@ -265,23 +689,27 @@ def GetAllAnalytes(folder: Path) -> set[str]:
 
     return analytes
 
+@Staged('export.xlsx')
 def WriteWellsToXLSX(
     wells: list[Well], 
     filename: Path) -> None:
     '''
-    Writes the well spectra to a nicely formatted XLSX file
+    Writes the well spectra to a nicely formatted XLSX file. For large
+    numbers of wells use EKKOTools.export.WriteParquetDataset instead.
     '''
 
     assert(filename.suffix == '.xlsx')
 
     wavelengths = [float(x) for x in wells[0].CD.keys()]
 
-    df = pd.DataFrame({'WAVELENGTHS':wavelengths})
-
+    # Collect the columns first so that the frame is built in one step
+    columns = {'WAVELENGTHS': wavelengths}
     for well in wells:
-        df[f'CD_{well.name}'] = well.CD.values()
+        columns[f'CD_{well.name}'] = list(well.CD.values())
     for well in wells:
-        df[f'ABS_{well.name}'] = well.ABS.values()
+        columns[f'ABS_{well.name}'] = list(well.ABS.values())
+
+    df = pd.DataFrame(columns)
 
     df.to_excel(filename, index=False)
 
@@ -289,7 +717,8 @@ def GetAverageWell(wells: list[Well]) -> Well:
     '''
 
     Get's the well which has the average CD, ABS, and 
-    CD_PER_ABS of the input wells.
+    CD_PER_ABS of the input wells. To average every analyte
+    at once use EKKOTools.aggregate.AggregateReplicates.
 
     Parameters
     ----------
@@ -304,38 +733,26 @@ def GetAverageWell(wells: list[Well]) -> Well:
     '''
     if len(set([x.analyte for x in wells])) != 1:
         raise Exception("All wells must have the same analyte")
-        
-    analyte_name = wells[0].analyte  + '_avg'
-
-    cds = pd.DataFrame([x.CD for x in wells]).transpose().mean(axis=1)
-    absorbances = pd.DataFrame([x.ABS for x in wells]).transpose().mean(axis=1)
 
-    #TODO Change hardcoded column names to accomodate different units
-    # Get dataframe with the CD and the ABS values
-    df = pd.concat([cds, absorbances], axis=1)
-    df.columns = ['CD-mDeg', 'ABS']
-
-    # Add the wavelengths
-    df.insert(0, column='WL', value=df.index.to_list())
-
-    # Put it in the strange format which the Well object requires
-    #TODO Handing a specifically formatted dataframe to Well is inflexible
-    data_row = pd.DataFrame(dict(zip(['WL', 'CD-mDeg', 'ABS'], [['Average'], ['NaN'], ['Nan']])))
-    df = pd.concat([data_row, df], axis=0)
-
-    return Well(df, parent_scanfile=None, analyte_name=analyte_name)
+    return AggregateReplicates(wells)[wells[0].analyte].to_well()
 
 def DetermineLambdaMaxRange(well: Well, range: list[float, float]) -> float:
     '''
     Given a well, determine the lambda max (wavelength)
-    within a certain range
+    within a certain range. The largest absolute CD is used, so negative
+    Cotton effects are found too. NaN is returned if the CD is NaN at
+    every wavelength of the range. For the peaks of many wells at once
+    use EKKOTools.features.SpectralFeatures.
     '''
-    possible_wl = [x for x in well.CD.keys() if float(x) <= range[1] and float(x) >= range[0]]
-
-    # Changed to include abs() function for negative CD spectra
-    results = {p: abs(well.CD[p]) for p in possible_wl}
-
-    return max(results, key=results.get) 
+    wavelengths = np.asarray(well.wavelengths, dtype=np.float64)
+    inside = np.flatnonzero((wavelengths >= range[0]) & (wavelengths <= range[1]))
+    if len(inside) == 0:
+        raise ValueError(f'No wavelengths of well {well.name} are within {range}')
+
+    magnitude = np.abs(_aligned_spectrum(well, CD)[inside])
+    if np.isnan(magnitude).all():
+        return np.nan
+    return well.wavelength_labels[inside[np.nanargmax(magnitude)]]
 
 
 #TODO
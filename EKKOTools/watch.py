@@ -0,0 +1,249 @@
+'''
+Incremental ingestion of a folder which is written to by the EKKO reader.
+'''
+import os
+import time
+import threading
+from pathlib import Path
+
+from .EKKOScanFormats import EKKOScanSummary
+
+# Suffixes of the scan keys which belong to a file named <stem>.cdxs
+SCAN_KEY_SUFFIXES = ['_scan_key.csv', '_scan_key.xlsx', '_scankey.csv', '_scankey.xlsx']
+
+# Folders modified more recently than this (in ns) are listed again, since
+# changes within the resolution of their timestamp would not show up
+RACY_WINDOW_NS = 2 * 10**9
+
+class ScanSummaryWatcher():
+    '''
+    Polls a folder for new or modified .cdxs files and their scan keys and
+    hands a new EKKOScanSummary for each of them to a callback.
+
+    A file is only parsed once its size and modification time have not
+    changed for settle_time seconds, so files which are still being written
+    are waited out.
+
+    Polls are incremental: the folder is only listed when its modification
+    time changed (files were added, removed or renamed), and only new files
+    and files which have not settled yet are stat'ed. Files which are
+    modified in place without changing the folder are caught by a full
+    rescan every rescan_interval seconds. Files which are deleted are
+    forgotten.
+
+    Parameters
+    ----------
+    folder: Path
+        Folder which is watched
+
+    callback: callable
+        Called with each new EKKOScanSummary. Pass the put method of a
+        queue.Queue to collect them in a queue, or the add method of an
+        EKKOCorpus to keep a corpus up to date.
+
+    on_error: callable
+        Called with (file, exception) if a settled file cannot be parsed.
+        The file is retried once it changes again. By default errors are
+        ignored.
+
+    settle_time: float
+        Seconds a file must be unchanged before it is parsed
+
+    cache:
+        Cache handed to EKKOScanSummary
+
+    include_existing: bool
+        If False, the files which are in the folder when the watcher is
+        created are not reported until they change
+
+    rescan_interval: float
+        Seconds between full rescans which stat every file of the folder
+    '''
+    def __init__(
+        self,
+        folder: Path,
+        callback,
+        on_error = None,
+        settle_time: float = 2.0,
+        cache = None,
+        include_existing: bool = True,
+        rescan_interval: float = 60.0):
+        self.folder = Path(folder)
+        if not self.folder.is_dir():
+            raise NotADirectoryError('Can only watch for scan summaries within a directory')
+
+        self.callback = callback
+        self.on_error = on_error
+        self.settle_time = settle_time
+        self.cache = cache
+        self.rescan_interval = rescan_interval
+
+        # Fingerprints of the .cdxs files (including their scan keys) which were handed to the callback
+        self._ingested = {}
+        # Fingerprint of each pending file and the time it was first seen with it
+        self._pending = {}
+
+        # (size, mtime) of every .cdxs file and scan key in the folder by name
+        self._stats = {}
+        # Name of the .cdxs file of every stem
+        self._stems = {}
+        self._folder_mtime = None
+        self._last_full_scan = None
+
+        self._stop = threading.Event()
+        self._thread = None
+
+        if not include_existing:
+            self._refresh()
+            self._ingested = {self.folder / name: self._fingerprint(name) for name in self._stems.values()}
+
+    def poll(self) -> list[EKKOScanSummary]:
+        '''
+        Checks the folder once and returns the summaries which were handed
+        to the callback
+        '''
+        now = time.monotonic()
+        summaries = []
+
+        changed = self._refresh()
+        for file in sorted({self.folder / name for name in changed} | set(self._pending)):
+            if file.name not in self._stats:
+                # Deleted
+                self._ingested.pop(file, None)
+                self._pending.pop(file, None)
+                continue
+
+            fingerprint = self._fingerprint(file.name)
+            if self._ingested.get(file) == fingerprint:
+                self._pending.pop(file, None)
+                continue
+
+            # Restart the clock whenever the file (or its scan key) changes
+            first_seen = self._pending.get(file)
+            if first_seen is None or first_seen[0] != fingerprint:
+                self._pending[file] = (fingerprint, now)
+                if self.settle_time > 0:
+                    continue
+            elif now - first_seen[1] < self.settle_time:
+                continue
+
+            del self._pending[file]
+            self._ingested[file] = fingerprint
+            try:
+                summary = EKKOScanSummary(file, cache=self.cache)
+            except Exception as e:
+                if self.on_error is not None:
+                    self.on_error(file, e)
+                continue
+
+            summaries.append(summary)
+            self.callback(summary)
+
+        return summaries
+
+    def start(self, interval: float = 5.0) -> None:
+        '''Polls the folder every interval seconds in a background thread'''
+        if self._thread is not None and self._thread.is_alive():
+            return
+        self._stop.clear()
+        self._thread = threading.Thread(target=self._run, args=(interval,), daemon=True)
+        self._thread.start()
+
+    def stop(self) -> None:
+        '''Stops the background thread started by start()'''
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join()
+            self._thread = None
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args) -> None:
+        self.stop()
+
+    def _run(self, interval: float) -> None:
+        while not self._stop.is_set():
+            self.poll()
+            self._stop.wait(interval)
+
+    def _refresh(self) -> set[str]:
+        '''
+        Brings the stats of the folder up to date and returns the names of
+        the .cdxs files which were added, removed or changed (including
+        their scan keys) since the last call
+        '''
+        now = time.monotonic()
+        try:
+            folder_mtime = os.stat(self.folder).st_mtime_ns
+        except OSError:
+            folder_mtime = None
+
+        full = self._last_full_scan is None or now - self._last_full_scan >= self.rescan_interval
+        racy = folder_mtime is None or time.time_ns() - folder_mtime < RACY_WINDOW_NS
+        pending = self._pending_names()
+
+        removed = set()
+        if full or racy or folder_mtime != self._folder_mtime:
+            names = self._list()
+            removed = self._stats.keys() - names
+            stale = names if full else (names - self._stats.keys()) | pending
+            self._stems = {name[:-len('.cdxs')]: name for name in names if name.casefold().endswith('.cdxs')}
+            if full:
+                self._last_full_scan = now
+        else:
+            stale = pending
+        self._folder_mtime = folder_mtime
+
+        changed = set()
+        for name in removed:
+            del self._stats[name]
+            changed.add(name)
+        for name in stale:
+            try:
+                stat = os.stat(self.folder / name)
+            except OSError:
+                if self._stats.pop(name, None) is not None:
+                    changed.add(name)
+                continue
+            stat = (stat.st_size, stat.st_mtime_ns)
+            if self._stats.get(name) != stat:
+                self._stats[name] = stat
+                changed.add(name)
+
+        return {summary for summary in map(self._summary_name, changed) if summary is not None}
+
+    def _list(self) -> set[str]:
+        '''Names of the .cdxs files and scan keys in the folder, without stat'ing them'''
+        names = set()
+        with os.scandir(self.folder) as entries:
+            for entry in entries:
+                if (entry.name.casefold().endswith('.cdxs') or entry.name.endswith(tuple(SCAN_KEY_SUFFIXES))) and entry.is_file():
+                    names.add(entry.name)
+        return names
+
+    def _pending_names(self) -> set[str]:
+        '''Names of the pending .cdxs files and their scan keys'''
+        names = set()
+        for file in self._pending:
+            stem = file.name[:-len('.cdxs')]
+            names.add(file.name)
+            names.update(stem + suffix for suffix in SCAN_KEY_SUFFIXES if stem + suffix in self._stats)
+        return names
+
+    def _summary_name(self, name: str) -> str:
+        '''Name of the .cdxs file which a .cdxs file or scan key belongs to'''
+        if name.casefold().endswith('.cdxs'):
+            return name
+        for suffix in SCAN_KEY_SUFFIXES:
+            if name.endswith(suffix):
+                return self._stems.get(name[:-len(suffix)])
+
+    def _fingerprint(self, name: str) -> tuple:
+        '''
+        Fingerprint of a .cdxs file together with its scan keys as
+        ((size, mtime), ((suffix, (size, mtime)), ...))
+        '''
+        stem = name[:-len('.cdxs')]
+        scan_keys = tuple((suffix, self._stats[stem + suffix]) for suffix in SCAN_KEY_SUFFIXES if stem + suffix in self._stats)
+        return (self._stats[name], scan_keys)
@@ -0,0 +1,108 @@
+'''
+Import-time budget of EKKOTools.
+
+Every module is imported in a fresh interpreter, which reports the time of
+the import and the heavy dependencies (pandas, scipy, scikit-learn,
+matplotlib, umap, openpyxl, pyarrow) it loaded. A module fails if it loads
+any of them or takes longer than --budget seconds (the fastest of --repeat
+runs). The parse scenario also parses and averages a synthetic ScanSummary
+file, like a batch worker does, which must not load them either:
+
+    python benchmarks/bench_import.py
+    python benchmarks/bench_import.py --budget 0.3 --repeat 5
+
+The script exits with status 1 if any module is over budget or loaded a
+heavy dependency.
+'''
+import argparse
+import json
+import subprocess
+import sys
+from pathlib import Path
+
+ROOT = Path(__file__).resolve().parent.parent
+
+# Dependencies which are only imported by the functions that need them
+HEAVY_MODULES = ('pandas', 'scipy', 'sklearn', 'matplotlib', 'umap', 'openpyxl', 'pyarrow')
+
+MODULES = (
+    'EKKOTools',
+    'EKKOTools.EKKOScanFormats',
+    'EKKOTools.parsing',
+    'EKKOTools.plates',
+    'EKKOTools.cache',
+    'EKKOTools.utilities',
+    'EKKOTools.corpus',
+    'EKKOTools.aggregate',
+    'EKKOTools.smooth',
+    'EKKOTools.blank',
+    'EKKOTools.spectrum',
+    'EKKOTools.resample',
+    'EKKOTools.features',
+    'EKKOTools.statistics',
+    'EKKOTools.plotting',
+    'EKKOTools.render',
+    'EKKOTools.export',
+    'EKKOTools.store',
+    'EKKOTools.watch',
+)
+
+# Parses and averages one file after the imports, like the worker of a batch job
+PARSE_SCENARIO = '''
+import tempfile
+from pathlib import Path
+from EKKOTools.EKKOScanFormats import EKKOScanSummary
+from EKKOTools.aggregate import AggregateReplicates
+from EKKOTools.synthetic import WriteSyntheticScanSummary
+with tempfile.TemporaryDirectory() as directory:
+    summary = EKKOScanSummary(WriteSyntheticScanSummary(Path(directory) / 'plate.cdxs', seed=0))
+    AggregateReplicates(summary.wells)
+'''
+
+PROBE = '''
+import json, sys, time
+start = time.perf_counter()
+{code}
+seconds = time.perf_counter() - start
+heavy = sorted(name for name in {heavy!r} if name in sys.modules)
+print(json.dumps({{'seconds': seconds, 'heavy': heavy}}))
+'''
+
+def probe(code: str) -> dict:
+    '''Runs code in a fresh interpreter and returns its time and loaded heavy modules'''
+    source = PROBE.format(code=code, heavy=HEAVY_MODULES)
+    result = subprocess.run(
+        [sys.executable, '-c', source],
+        cwd=ROOT, capture_output=True, text=True, check=True)
+    return json.loads(result.stdout.strip().splitlines()[-1])
+
+def main() -> int:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--budget', type=float, default=0.5, help='Seconds which every import may take')
+    parser.add_argument('--repeat', type=int, default=3, help='Runs of every import, the fastest one counts')
+    args = parser.parse_args()
+
+    scenarios = {name: f'import {name}' for name in MODULES}
+    scenarios['parse'] = PARSE_SCENARIO
+
+    failures = 0
+    for name, code in scenarios.items():
+        runs = [probe(code) for _ in range(max(args.repeat, 1))]
+        seconds = min(run['seconds'] for run in runs)
+        heavy = sorted(set().union(*(run['heavy'] for run in runs)))
+
+        problems = []
+        if heavy:
+            problems.append('loaded ' + ', '.join(heavy))
+        # The parse scenario does more than importing, only its imports are checked
+        if name != 'parse' and seconds > args.budget:
+            problems.append(f'over budget of {args.budget:.3f} s')
+        failures += bool(problems)
+
+        status = 'FAIL ' + '; '.join(problems) if problems else 'ok'
+        print(f'{name:<28} {seconds:8.3f} s  {status}')
+
+    return 1 if failures else 0
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,231 @@
+'''
+Performance benchmarks of EKKOTools on synthetic ScanSummary files.
+
+Every benchmark is timed and memory-profiled (tracemalloc peak) at each of
+the requested scales, where the scale is the number of .cdxs files. The
+results are written to benchmarks/results/<label>.json so that runs of
+different versions can be compared:
+
+    python benchmarks/run_benchmarks.py --scales 1 100 --label 1.0.0
+    python benchmarks/run_benchmarks.py --scales 1 100 --compare benchmarks/results/1.0.0.json
+
+With --compare, the script exits with status 1 if any benchmark became
+slower than --threshold times its previous time.
+'''
+import argparse
+import gc
+import json
+import platform
+import subprocess
+import sys
+import tempfile
+import time
+import tracemalloc
+from datetime import datetime, timezone
+from pathlib import Path
+
+ROOT = Path(__file__).resolve().parent.parent
+sys.path.insert(0, str(ROOT))
+
+import numpy as np
+
+from EKKOTools.aggregate import AggregateReplicates
+from EKKOTools.cache import ScanSummaryCache
+from EKKOTools.corpus import EKKOCorpus
+from EKKOTools.features import SpectralFeatures
+from EKKOTools.smooth import SmoothWells
+from EKKOTools.synthetic import WriteSyntheticCorpus
+from EKKOTools.utilities import GetAllEKKOScanSummaries, GetAverageWell, WriteWellsToXLSX
+
+RESULTS_DIR = Path(__file__).resolve().parent / 'results'
+
+# Number of wells written by the xlsx export benchmark (Excel limits the number of columns)
+EXPORT_WELLS = 1000
+
+BENCHMARKS = {}
+
+def benchmark(name: str, setup = None):
+    '''
+    Registers a benchmark which is called with the Context of a scale.
+    setup is called with the same Context before the benchmark is timed.
+    '''
+    def register(function):
+        BENCHMARKS[name] = (function, setup)
+        return function
+    return register
+
+class Context():
+    '''Data shared by the benchmarks of one scale'''
+    def __init__(self, folder: Path, workdir: Path):
+        self.folder = folder
+        self.workdir = workdir
+        self._corpus = None
+
+    @property
+    def corpus(self) -> EKKOCorpus:
+        if self._corpus is None:
+            self._corpus = EKKOCorpus.from_folder(self.folder, n_jobs=-1)
+        return self._corpus
+
+    @property
+    def cache(self) -> ScanSummaryCache:
+        return ScanSummaryCache(self.workdir / 'cache', max_bytes=None)
+
+def _load_corpus(ctx: Context):
+    ctx.corpus
+
+def _fill_cache(ctx: Context):
+    GetAllEKKOScanSummaries(ctx.folder, cache=ctx.cache)
+
+@benchmark('ingest_serial')
+def _ingest_serial(ctx: Context):
+    GetAllEKKOScanSummaries(ctx.folder)
+
+@benchmark('ingest_parallel')
+def _ingest_parallel(ctx: Context):
+    GetAllEKKOScanSummaries(ctx.folder, n_jobs=-1)
+
+@benchmark('ingest_cached_warm', setup=_fill_cache)
+def _ingest_cached_warm(ctx: Context):
+    GetAllEKKOScanSummaries(ctx.folder, cache=ctx.cache)
+
+@benchmark('pickn', setup=_load_corpus)
+def _pickn(ctx: Context):
+    from EKKOTools.statistics import PickNForAllAnalytes
+    PickNForAllAnalytes(ctx.corpus, n=3, wl=520, spectra_type='cd')
+
+@benchmark('average', setup=_load_corpus)
+def _average(ctx: Context):
+    for analyte in ctx.corpus.analytes - {None}:
+        GetAverageWell(ctx.corpus.get_wells(analyte))
+
+@benchmark('aggregate', setup=_load_corpus)
+def _aggregate(ctx: Context):
+    AggregateReplicates(ctx.corpus)
+
+@benchmark('features', setup=_load_corpus)
+def _features(ctx: Context):
+    SpectralFeatures(ctx.corpus)
+
+@benchmark('smooth', setup=_load_corpus)
+def _smooth(ctx: Context):
+    SmoothWells(ctx.corpus, window_length=11, polyorder=3)
+
+@benchmark('pca', setup=_load_corpus)
+def _pca(ctx: Context):
+    from EKKOTools.statistics import PCAWells
+    PCAWells(ctx.corpus.wells, n_comp=3, spectra_type='cd')
+
+@benchmark('export_xlsx', setup=_load_corpus)
+def _export_xlsx(ctx: Context):
+    WriteWellsToXLSX(ctx.corpus.wells[:EXPORT_WELLS], ctx.workdir / 'export.xlsx')
+
+@benchmark('export_parquet', setup=_load_corpus)
+def _export_parquet(ctx: Context):
+    from EKKOTools.export import WriteParquetDataset
+    WriteParquetDataset(ctx.corpus, ctx.workdir / 'export.parquet', overwrite=True)
+
+def run(scales: list[int], names: list[str], data_dir: Path, repeat: int) -> list[dict]:
+    results = []
+    for scale in scales:
+        folder = data_dir / f'{scale}_files'
+        if len(list(folder.glob('*.cdxs'))) != scale:
+            print(f'Writing {scale} synthetic files to {folder}')
+            for f in folder.glob('*.cdxs'):
+                f.unlink()
+            WriteSyntheticCorpus(folder, scale)
+
+        with tempfile.TemporaryDirectory() as workdir:
+            ctx = Context(folder, Path(workdir))
+            for name in names:
+                result = {'name': name, 'scale': scale}
+                try:
+                    result.update(_measure(BENCHMARKS[name], ctx, repeat))
+                    result['status'] = 'ok'
+                except ImportError as e:
+                    result['status'] = f'skipped: {e}'
+                print(_format_result(result))
+                results.append(result)
+    return results
+
+def _measure(benchmark: tuple, ctx: Context, repeat: int) -> dict:
+    '''Best wall time of repeat runs followed by one run under tracemalloc'''
+    function, setup = benchmark
+    if setup is not None:
+        setup(ctx)
+
+    times = []
+    for _ in range(repeat):
+        gc.collect()
+        start = time.perf_counter()
+        function(ctx)
+        times.append(time.perf_counter() - start)
+
+    gc.collect()
+    tracemalloc.start()
+    try:
+        function(ctx)
+        _, peak = tracemalloc.get_traced_memory()
+    finally:
+        tracemalloc.stop()
+
+    return {'seconds': min(times), 'peak_bytes': peak}
+
+def _format_result(result: dict) -> str:
+    if result['status'] != 'ok':
+        return f"{result['name']:<22}{result['scale']:>7} files  {result['status']}"
+    return f"{result['name']:<22}{result['scale']:>7} files  {result['seconds']:10.4f} s  {result['peak_bytes'] / 1024**2:10.1f} MiB"
+
+def compare(results: list[dict], previous: dict, threshold: float) -> bool:
+    '''Prints the change against a previous results file and returns True if anything regressed'''
+    old = {(r['name'], r['scale']): r for r in previous['results'] if r['status'] == 'ok'}
+    regressed = False
+    print(f"\nCompared with {previous['label']}")
+    for r in results:
+        before = old.get((r['name'], r['scale']))
+        if r['status'] != 'ok' or before is None:
+            continue
+        ratio = r['seconds'] / before['seconds'] if before['seconds'] else float('inf')
+        flag = 'REGRESSION' if ratio > threshold else ''
+        regressed |= ratio > threshold
+        print(f"{r['name']:<22}{r['scale']:>7} files  {ratio:8.2f}x time  {r['peak_bytes'] / max(before['peak_bytes'], 1):8.2f}x memory  {flag}")
+    return regressed
+
+def _default_label() -> str:
+    try:
+        return subprocess.run(['git', 'rev-parse', '--short', 'HEAD'], cwd=ROOT, capture_output=True, text=True, check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return 'unlabelled'
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--scales', type=int, nargs='+', default=[1, 100, 10000], help='Numbers of .cdxs files to benchmark')
+    parser.add_argument('--benchmarks', nargs='+', default=list(BENCHMARKS), choices=list(BENCHMARKS), help='Benchmarks to run')
+    parser.add_argument('--data-dir', type=Path, default=Path(tempfile.gettempdir()) / 'ekkotools-benchmarks', help='Folder for the synthetic files')
+    parser.add_argument('--repeat', type=int, default=3, help='Timed runs per benchmark; the fastest is reported')
+    parser.add_argument('--label', default=None, help='Name of the results file (defaults to the git revision)')
+    parser.add_argument('--compare', type=Path, default=None, help='Previous results file to compare against')
+    parser.add_argument('--threshold', type=float, default=1.25, help='Slowdown ratio which counts as a regression')
+    args = parser.parse_args()
+
+    label = args.label or _default_label()
+    results = run(args.scales, args.benchmarks, args.data_dir, args.repeat)
+
+    RESULTS_DIR.mkdir(exist_ok=True)
+    output = RESULTS_DIR / f'{label}.json'
+    output.write_text(json.dumps({
+        'label': label,
+        'date': datetime.now(timezone.utc).isoformat(),
+        'python': platform.python_version(),
+        'numpy': np.__version__,
+        'machine': platform.platform(),
+        'results': results,
+    }, indent=2))
+    print(f'\nResults written to {output}')
+
+    if args.compare is not None:
+        if compare(results, json.loads(args.compare.read_text()), args.threshold):
+            sys.exit(1)
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,38 @@
+import sys
+from pathlib import Path
+
+import numpy as np
+import pytest
+
+ROOT = Path(__file__).resolve().parent.parent
+sys.path.insert(0, str(ROOT))
+
+from EKKOTools.EKKOScanFormats import EKKOScanSummary
+from EKKOTools.synthetic import WriteSyntheticScanSummary
+
+@pytest.fixture
+def summary(tmp_path):
+    '''Synthetic 96 well plate whose analytes alternate between DMSO, a and b'''
+    file = WriteSyntheticScanSummary(tmp_path / 'plate.cdxs', analytes=['DMSO', 'a', 'b'], seed=0)
+    return EKKOScanSummary(file)
+
+def legacy_scan(file: Path) -> tuple:
+    '''
+    Reads the scan body with pandas the way EKKOTools did before the single
+    pass parser: every well is a block of its label row followed by one row
+    per wavelength. Returns (well_names, wavelength_labels, cd, abs) with
+    cd and abs of shape (n_wells, n_wavelengths).
+    '''
+    import pandas as pd
+    df = pd.read_csv(file, skiprows=11, delimiter='\t', usecols=['WL', 'CD-mDeg', 'ABS'], dtype=str, skip_blank_lines=True)
+    end = df.index[df['WL'].str.startswith('Annotation')][0]
+    df = df.iloc[:end]
+
+    labels = df.index[~df['WL'].str.match(r'^\d')]
+    blocksize = labels[1] - labels[0]
+    blocks = [df.iloc[i:i + blocksize] for i in range(0, len(df), blocksize)]
+    well_names = [block['WL'].iloc[0] for block in blocks]
+    wavelength_labels = list(blocks[0]['WL'].iloc[1:])
+    cd = np.array([pd.to_numeric(block['CD-mDeg'].iloc[1:], errors='coerce') for block in blocks])
+    absorbance = np.array([pd.to_numeric(block['ABS'].iloc[1:], errors='coerce') for block in blocks])
+    return well_names, wavelength_labels, cd, absorbance
@@ -0,0 +1,100 @@
+import numpy as np
+import pytest
+
+from EKKOTools.EKKOScanFormats import EKKOScanSummary
+from EKKOTools.aggregate import AggregateReplicates
+from EKKOTools.blank import BlankCorrectWells
+from EKKOTools.features import SpectralFeatures
+from EKKOTools.parsing import CD, ABS, CD_PER_ABS
+from EKKOTools.resample import ResampleWells
+from EKKOTools.smooth import SmoothSpectra, SmoothWells
+from EKKOTools.spectrum import Spectrum
+from EKKOTools.synthetic import WriteSyntheticScanSummary
+from EKKOTools.utilities import GetSpectraMatrix
+
+def corrected_spectra(summary) -> np.ndarray:
+    '''Expected spectra of the wells of summary after subtracting the mean DMSO well'''
+    blanks = [i for i, well in enumerate(summary.wells) if well.analyte == 'DMSO']
+    expected = summary.spectra - summary.spectra[blanks].mean(axis=0)
+    with np.errstate(divide='ignore', invalid='ignore'):
+        expected[:, :, CD_PER_ABS] = expected[:, :, CD] / expected[:, :, ABS]
+    expected[blanks] = summary.spectra[blanks]
+    return expected
+
+@pytest.fixture
+def corrected(summary):
+    expected = corrected_spectra(summary)
+    assert BlankCorrectWells(summary, analyte='DMSO') == []
+    return summary, expected
+
+def test_blank_correction_is_current(corrected):
+    summary, expected = corrected
+    np.testing.assert_allclose(summary.get_current_spectra(), expected)
+    for channel in (CD, ABS, CD_PER_ABS):
+        np.testing.assert_allclose(Spectrum.from_summary(summary, channel).values, expected[:, :, channel])
+    samples = [well for well in summary.wells if well.analyte != 'DMSO']
+    assert all(well.blank is not None for well in samples)
+
+def test_smooth_after_blank_correction(corrected):
+    summary, expected = corrected
+    smoothed, _ = SmoothSpectra(expected.transpose(0, 2, 1), 7, 2)
+    assert SmoothWells(summary, window_length=7, polyorder=2) == []
+    np.testing.assert_allclose(summary.get_current_spectra()[:, :, CD], smoothed[:, CD])
+
+def test_aggregate_after_blank_correction(corrected):
+    summary, expected = corrected
+    statistics = AggregateReplicates(summary)
+    rows = [i for i, well in enumerate(summary.wells) if well.analyte == 'a']
+    np.testing.assert_allclose(statistics['a'].mean, expected[rows].mean(axis=0))
+
+def test_features_after_blank_correction(corrected):
+    summary, expected = corrected
+    features = SpectralFeatures(summary, channels=['cd'])
+    extrema = expected[np.arange(len(expected)), np.abs(expected[:, :, CD]).argmax(axis=1), CD]
+    np.testing.assert_allclose(features['cd_extremum'], extrema)
+
+def test_matrix_and_resample_after_blank_correction(corrected):
+    summary, expected = corrected
+    _, matrix = GetSpectraMatrix(summary.wells, spectra_type='cd')
+    np.testing.assert_allclose(matrix, expected[:, :, CD])
+    resampled = ResampleWells(summary.wells, grid=summary.wavelengths)
+    np.testing.assert_allclose(np.stack([well.get_spectrum(CD) for well in resampled]), expected[:, :, CD])
+
+def test_blank_correction_twice_raises(corrected):
+    summary, _ = corrected
+    with pytest.raises(ValueError):
+        BlankCorrectWells(summary, analyte='DMSO')
+
+def plates(tmp_path, n):
+    return [EKKOScanSummary(WriteSyntheticScanSummary(tmp_path / f'plate_{i}.cdxs', analytes=['DMSO', 'a', 'b'], seed=i)) for i in range(n)]
+
+def assert_uncorrected(summaries):
+    for summary in summaries:
+        np.testing.assert_array_equal(summary.get_current_spectra(), summary.spectra)
+        assert all(well.blank is None for well in summary.wells)
+
+def test_blank_correction_is_all_or_nothing(tmp_path):
+    first, second, third = plates(tmp_path, 3)
+    BlankCorrectWells(third, analyte='DMSO')
+    with pytest.raises(ValueError, match='already corrected'):
+        BlankCorrectWells([first, second, third], analyte='DMSO')
+    assert_uncorrected([first, second])
+
+    with pytest.raises(ValueError, match='more than once'):
+        BlankCorrectWells([first, second, first], analyte='DMSO')
+    assert_uncorrected([first, second])
+
+    other = EKKOScanSummary(WriteSyntheticScanSummary(tmp_path / 'other.cdxs', end=600, analytes=['DMSO', 'a'], seed=5))
+    with pytest.raises(ValueError, match='wavelengths'):
+        BlankCorrectWells([first, second, other], analyte='DMSO', reference=first)
+    assert_uncorrected([first, second])
+
+def test_reference_plate_which_is_corrected_too(tmp_path):
+    reference, sample = plates(tmp_path, 2)
+    blanks = [i for i, well in enumerate(reference.wells) if well.analyte == 'DMSO']
+    mean = reference.spectra[blanks].mean(axis=0)
+
+    # The blank is taken before the reference plate itself is corrected
+    BlankCorrectWells([reference, sample], analyte='DMSO', reference=reference)
+    for summary in (reference, sample):
+        np.testing.assert_allclose(summary.get_current_spectra()[:, :, CD], summary.spectra[:, :, CD] - mean[:, CD])
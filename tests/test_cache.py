@@ -0,0 +1,59 @@
+import pickle
+
+import numpy as np
+import pytest
+
+from EKKOTools.cache import ScanSummaryCache
+from EKKOTools.synthetic import WriteSyntheticCorpus
+from EKKOTools.utilities import GetAllEKKOScanSummaries
+
+from test_ingest import assert_same_summaries
+
+@pytest.fixture
+def folder(tmp_path):
+    WriteSyntheticCorpus(tmp_path / 'plates', n_files=12, n_analytes=5, start=400, end=500)
+    return tmp_path / 'plates'
+
+def entries_size(cache: ScanSummaryCache) -> int:
+    return sum(entry.stat().st_size for entry in cache.directory.glob('*.npz'))
+
+def test_cached_ingest_matches_uncached(folder, tmp_path):
+    cache = ScanSummaryCache(tmp_path / 'cache')
+    uncached = GetAllEKKOScanSummaries(folder)
+    assert_same_summaries(GetAllEKKOScanSummaries(folder, cache=cache), uncached)
+    assert_same_summaries(GetAllEKKOScanSummaries(folder, cache=cache), uncached)
+    assert len(list(cache.directory.glob('*.npz'))) == 12
+    assert cache.size == entries_size(cache)
+
+def test_thread_pool_ingest_shares_one_cache(folder, tmp_path):
+    expected = GetAllEKKOScanSummaries(folder)
+
+    cache = ScanSummaryCache(tmp_path / 'full')
+    assert_same_summaries(GetAllEKKOScanSummaries(folder, n_jobs=4, executor='thread', chunksize=1, cache=cache), expected)
+    assert cache.size == entries_size(cache)
+    assert len(list(cache.directory.glob('*.npz'))) == 12
+    entry_size = cache.size // 12
+
+    # Room for about half of the files, so the threads evict while they fill the cache
+    for i in range(3):
+        cache = ScanSummaryCache(tmp_path / f'small_{i}', max_bytes=6 * entry_size)
+        assert_same_summaries(GetAllEKKOScanSummaries(folder, n_jobs=4, executor='thread', chunksize=1, cache=cache), expected)
+        assert cache.size == entries_size(cache) <= 6 * entry_size
+        assert ScanSummaryCache(cache.directory).size == cache.size
+
+def test_edited_file_replaces_its_entry(folder, tmp_path):
+    cache = ScanSummaryCache(tmp_path / 'cache')
+    GetAllEKKOScanSummaries(folder, cache=cache)
+    file = sorted(folder.glob('*.cdxs'))[0]
+    file.write_text(file.read_text().replace('Operator:\tEKKOTools', 'Operator:\tsomeone else'))
+    summaries = GetAllEKKOScanSummaries(folder, cache=cache)
+    assert any(s.header[2] == ['Operator:', 'someone else'] for s in summaries)
+    assert len(list(cache.directory.glob('*.npz'))) == 12
+    assert cache.size == entries_size(cache)
+
+def test_pickled_cache_rebuilds_its_index(folder, tmp_path):
+    cache = ScanSummaryCache(tmp_path / 'cache')
+    GetAllEKKOScanSummaries(folder, cache=cache)
+    copy = pickle.loads(pickle.dumps(cache))
+    assert copy.size == cache.size
+    assert copy.get(sorted(folder.glob('*.cdxs'))[0]) is not None
@@ -0,0 +1,40 @@
+from EKKOTools.corpus import EKKOCorpus
+from EKKOTools.synthetic import WriteSyntheticCorpus
+from EKKOTools.utilities import GetAllEKKOScanSummaries
+
+def index_state(corpus: EKKOCorpus) -> tuple:
+    return (
+        corpus.analytes,
+        {analyte: {id(well) for well in corpus.get_wells(analyte)} for analyte in corpus.analytes},
+        [summary.file for summary in corpus.summaries],
+        [summary.file for summary in corpus.get_summaries_between('1/1/2000', '1/1/2100')],
+        len(corpus.wells))
+
+def test_remove_and_replace_match_a_rebuilt_index(tmp_path):
+    WriteSyntheticCorpus(tmp_path, n_files=6, n_analytes=5, start=400, end=450)
+    summaries = GetAllEKKOScanSummaries(tmp_path)
+    corpus = EKKOCorpus(summaries)
+
+    corpus.remove(summaries[1])
+    corpus.add(summaries[3])
+    assert summaries[1] not in corpus
+    assert len(corpus) == 5
+    assert index_state(corpus) == index_state(EKKOCorpus(corpus.summaries))
+
+    for summary in list(corpus):
+        corpus.remove(summary)
+    assert len(corpus) == 0
+    assert corpus.analytes == set()
+    assert corpus.get_summaries_between('1/1/2000', '1/1/2100') == []
+
+def test_queries_match_filtering_every_well(tmp_path):
+    WriteSyntheticCorpus(tmp_path, n_files=4, n_analytes=3, start=400, end=450)
+    summaries = GetAllEKKOScanSummaries(tmp_path)
+    corpus = EKKOCorpus(summaries)
+    wells = [well for summary in summaries for well in summary.wells]
+
+    for analyte in corpus.analytes:
+        assert {id(w) for w in corpus.get_wells(analyte)} == {id(w) for w in wells if w.analyte == analyte}
+    date = summaries[0].date
+    assert corpus.get_summaries_by_date(date) == [s for s in summaries if s.date == date]
+    assert len(corpus.query(analyte='analyte_0', date=date)) == len([w for w in wells if w.analyte == 'analyte_0'])
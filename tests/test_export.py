@@ -0,0 +1,116 @@
+import datetime
+from urllib.parse import unquote
+
+import numpy as np
+import pandas as pd
+import pytest
+
+pa = pytest.importorskip('pyarrow')
+
+from EKKOTools.EKKOScanFormats import EKKOScanSummary
+from EKKOTools.export import WriteParquetDataset
+from EKKOTools.synthetic import WriteSyntheticScanSummary
+
+from conftest import legacy_scan
+
+@pytest.fixture
+def folder(tmp_path):
+    '''Four plates, two of which are measured on a longer wavelength grid'''
+    folder = tmp_path / 'scans'
+    folder.mkdir()
+    for i in range(4):
+        WriteSyntheticScanSummary(folder / f'plate_{i}.cdxs', start=400, end=420 if i < 2 else 430, analytes=['x', 'y', 'z'], seed=i)
+    return folder
+
+def legacy_long(files) -> pd.DataFrame:
+    '''Long table of the spectra of files read by the legacy reader'''
+    frames = []
+    for file in files:
+        well_names, wavelength_labels, cd, absorbance = legacy_scan(file)
+        analytes = {well.name: well.analyte for well in EKKOScanSummary(file).wells}
+        n_wl = len(wavelength_labels)
+        frames.append(pd.DataFrame({
+            'file': str(file),
+            'well': np.repeat(well_names, n_wl),
+            'analyte': np.repeat([analytes[name] for name in well_names], n_wl),
+            'wavelength': np.tile(np.array(wavelength_labels, dtype=float), len(well_names)),
+            'CD': cd.ravel(),
+            'ABS': absorbance.ravel(),
+            'CD_PER_ABS': (cd / absorbance).ravel()}))
+    return pd.concat(frames, ignore_index=True)
+
+def read(root, columns) -> pd.DataFrame:
+    df = pd.read_parquet(root)
+    for column in ('file', 'well', 'analyte', 'scan_process'):
+        df[column] = df[column].astype(object)
+    return df.sort_values(columns, kind='stable').reset_index(drop=True)
+
+def test_long_layout_matches_legacy_reader(folder, tmp_path):
+    files = sorted(folder.glob('*.cdxs'))
+    root = WriteParquetDataset(folder, tmp_path / 'dataset', batch_size=3)
+
+    partitions = sorted(unquote(path.name) for path in root.iterdir())
+    assert partitions == ['scan_process=Spectral Scan 400 to 420 nm step 5 nm', 'scan_process=Spectral Scan 400 to 430 nm step 5 nm']
+
+    expected = legacy_long(files)
+    keys = ['file', 'well', 'wavelength']
+    df = read(root, keys)
+    expected = expected.sort_values(keys, kind='stable').reset_index(drop=True)
+    pd.testing.assert_frame_equal(df[expected.columns], expected, check_dtype=False)
+    assert (df['date'] == datetime.date(2023, 3, 14)).all()
+    assert set(df['scan_process']) == {partition.split('=')[1] for partition in partitions}
+
+def test_wide_layout_matches_legacy_reader(folder, tmp_path):
+    files = sorted(folder.glob('*.cdxs'))[:2]
+    summaries = (EKKOScanSummary(file) for file in files)
+    root = WriteParquetDataset(summaries, tmp_path / 'dataset', layout='wide', partition_cols=[], batch_size=1)
+
+    df = read(root, ['file', 'well'])
+    assert len(df) == 2 * 96
+    for file in files:
+        well_names, wavelength_labels, cd, absorbance = legacy_scan(file)
+        rows = df[df['file'] == str(file)].set_index('well').loc[well_names]
+        np.testing.assert_array_equal(rows[[f'CD_{wl}' for wl in wavelength_labels]].to_numpy(), cd)
+        np.testing.assert_array_equal(rows[[f'ABS_{wl}' for wl in wavelength_labels]].to_numpy(), absorbance)
+        np.testing.assert_allclose(rows[[f'CD_PER_ABS_{wl}' for wl in wavelength_labels]].to_numpy(), cd / absorbance)
+
+def test_wide_layout_requires_one_wavelength_grid(folder, tmp_path):
+    with pytest.raises(ValueError, match='wavelengths of the first summary'):
+        WriteParquetDataset(folder, tmp_path / 'dataset', layout='wide')
+
+def test_assigned_spectra_and_non_string_analytes(folder, tmp_path):
+    summary = EKKOScanSummary(sorted(folder.glob('*.cdxs'))[0])
+    first, second, third = summary.wells[:3]
+    first.analyte = 3
+    second.analyte = np.nan
+    third.CD = {wl: 1.0 for wl in third.wavelength_labels}
+    root = WriteParquetDataset(summary, tmp_path / 'dataset', partition_cols=['well'])
+
+    df = read(root, ['well', 'wavelength'])
+    analytes = df.groupby('well')['analyte'].first()
+    assert analytes[first.name] == '3'
+    assert analytes.isna()[second.name]
+    assert (df.loc[df['well'] == third.name, 'CD'] == 1.0).all()
+
+def test_existing_dataset_and_bad_arguments(folder, tmp_path):
+    root = tmp_path / 'dataset'
+    WriteParquetDataset(folder, root)
+    with pytest.raises(pa.ArrowInvalid):
+        WriteParquetDataset(folder, root)
+    WriteParquetDataset(folder, root, overwrite=True)
+    assert len(pd.read_parquet(root)) == len(legacy_long(sorted(folder.glob('*.cdxs'))))
+
+    with pytest.raises(ValueError):
+        WriteParquetDataset(folder, tmp_path / 'other', layout='tall')
+    with pytest.raises(ValueError):
+        WriteParquetDataset(folder, tmp_path / 'other', partition_cols=['CD'])
+    with pytest.raises(ValueError):
+        WriteParquetDataset([], tmp_path / 'other')
+
+def test_unreadable_files_of_a_folder(folder, tmp_path):
+    (folder / 'broken.cdxs').write_text('not a scan summary\n')
+    with pytest.raises(ValueError):
+        WriteParquetDataset(folder, tmp_path / 'raised')
+    with pytest.warns(UserWarning, match='broken.cdxs'):
+        root = WriteParquetDataset(folder, tmp_path / 'warned', errors='warn')
+    assert pd.read_parquet(root)['file'].nunique() == 4
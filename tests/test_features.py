@@ -0,0 +1,103 @@
+import numpy as np
+import pytest
+
+from EKKOTools.EKKOScanFormats import EKKOScanSummary
+from EKKOTools.corpus import EKKOCorpus
+from EKKOTools.features import SpectralFeatures, _spectra_features
+from EKKOTools.synthetic import WriteSyntheticScanSummary
+from EKKOTools.utilities import DetermineLambdaMaxRange
+
+from conftest import legacy_scan
+
+def legacy_features(x: np.ndarray, y: np.ndarray) -> dict:
+    '''Features of one NaN-free spectrum, found point by point'''
+    peak = int(np.argmax(np.abs(y)))
+    extremum = y[peak]
+
+    signs = [np.sign(v) for v in y if v != 0]
+    crossings = sum(a != b for a, b in zip(signs, signs[1:]))
+
+    s, half = y * np.sign(extremum), abs(extremum) / 2
+    left = peak
+    while left > 0 and s[left - 1] >= half:
+        left -= 1
+    right = peak
+    while right < len(y) - 1 and s[right + 1] >= half:
+        right += 1
+    if left == 0 or right == len(y) - 1:
+        fwhm = np.nan
+    else:
+        x_left = np.interp(half, [s[left - 1], s[left]], [x[left - 1], x[left]])
+        x_right = np.interp(half, [s[right + 1], s[right]], [x[right + 1], x[right]])
+        fwhm = x_right - x_left
+
+    return {
+        'lambda_max': x[peak],
+        'extremum': extremum,
+        'zero_crossings': crossings,
+        'integral': np.trapezoid(y, x),
+        'fwhm': fwhm}
+
+def test_features_match_legacy_reader(tmp_path):
+    file = WriteSyntheticScanSummary(tmp_path / 'plate.cdxs', analytes=['x', 'y', 'z'], seed=4)
+    summary = EKKOScanSummary(file)
+    well_names, wavelength_labels, cd, absorbance = legacy_scan(file)
+    wavelengths = np.array(wavelength_labels, dtype=np.float64)
+    window = (wavelengths >= 450) & (wavelengths <= 650)
+
+    features = SpectralFeatures(summary, wl_range=[650, 450], bands={'blue': [400, 480]})
+    assert list(features['well']) == well_names
+    assert list(features['file']) == [file.name] * len(well_names)
+    for channel, values in (('cd', cd), ('abs', absorbance), ('g', cd / absorbance)):
+        for i in range(len(well_names)):
+            expected = legacy_features(wavelengths[window], values[i, window])
+            for name, value in expected.items():
+                assert features[f'{channel}_{name}'][i] == pytest.approx(value, rel=1e-9, abs=1e-12, nan_ok=True)
+            blue = wavelengths <= 480
+            assert features[f'{channel}_integral_blue'][i] == pytest.approx(np.trapezoid(values[i, blue], wavelengths[blue]))
+
+    for i, well in enumerate(summary.wells):
+        assert features['cd_lambda_max'][i] == float(DetermineLambdaMaxRange(well, [450, 650]))
+
+def test_fwhm_of_gaussians():
+    x = np.arange(300, 800, 0.5)
+    centers, sigmas = np.array([450.0, 520.0, 600.0]), np.array([10.0, 25.0, 5.0])
+    amplitudes = np.array([1.0, -3.0, 0.5])
+    y = amplitudes[:, None] * np.exp(-0.5 * ((x - centers[:, None]) / sigmas[:, None]) ** 2)
+
+    features = _spectra_features(y, x, None, {})
+    np.testing.assert_allclose(features['lambda_max'], centers)
+    np.testing.assert_allclose(features['extremum'], amplitudes)
+    np.testing.assert_allclose(features['fwhm'], 2 * np.sqrt(2 * np.log(2)) * sigmas, rtol=1e-3)
+    np.testing.assert_allclose(features['integral'], amplitudes * sigmas * np.sqrt(2 * np.pi), rtol=1e-6)
+    np.testing.assert_array_equal(features['zero_crossings'], 0)
+
+    # A peak which runs into the end of the range has no FWHM
+    assert np.isnan(_spectra_features(y, x, [450, 700], {})['fwhm'][0])
+
+def test_nan_and_zero_crossings():
+    x = np.arange(10, dtype=np.float64)
+    y = np.array([
+        [1, 0, -1, np.nan, -2, 0, 0, 3, 1, -1],
+        [np.nan] * 10,
+        [0] * 10])
+    features = _spectra_features(y, x, None, {})
+    assert features['zero_crossings'][0] == 3
+    assert features['lambda_max'][0] == 7
+    assert all(np.isnan(features[name][1]) for name in ('lambda_max', 'extremum', 'zero_crossings', 'integral', 'fwhm'))
+    assert features['zero_crossings'][2] == 0 and np.isnan(features['fwhm'][2])
+
+def test_corpus_with_several_grids(tmp_path):
+    summaries = [
+        EKKOScanSummary(WriteSyntheticScanSummary(tmp_path / 'a.cdxs', start=400, end=600, analytes=['x'], seed=0)),
+        EKKOScanSummary(WriteSyntheticScanSummary(tmp_path / 'b.cdxs', start=450, end=700, step=2, analytes=['y'], seed=1))]
+    features = SpectralFeatures(EKKOCorpus(summaries), channels=['cd'])
+    assert len(features) == 2 * 96
+    assert [column for column in features.columns if column.startswith('cd_')] == ['cd_lambda_max', 'cd_extremum', 'cd_zero_crossings', 'cd_integral', 'cd_fwhm']
+    for summary in summaries:
+        alone = SpectralFeatures(summary, channels=['cd'])
+        rows = features[features['file'] == summary.file.name].reset_index(drop=True)
+        np.testing.assert_array_equal(rows['cd_extremum'], alone['cd_extremum'])
+
+    with pytest.raises(ValueError):
+        SpectralFeatures(summaries[0], channels=['ellipticity'])
@@ -0,0 +1,21 @@
+import sys
+from pathlib import Path
+
+import pytest
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent / 'benchmarks'))
+
+from bench_import import MODULES, PARSE_SCENARIO, probe
+
+# Seconds an import may take in a fresh interpreter, well above the ~0.1 s
+# of numpy plus EKKOTools but below the cost of importing pandas or sklearn
+IMPORT_BUDGET = 1.0
+
+@pytest.mark.parametrize('module', MODULES)
+def test_import_loads_no_heavy_dependency(module):
+    result = probe(f'import {module}')
+    assert result['heavy'] == []
+    assert result['seconds'] < IMPORT_BUDGET
+
+def test_parse_and_average_load_no_heavy_dependency():
+    assert probe(PARSE_SCENARIO)['heavy'] == []
@@ -0,0 +1,35 @@
+import numpy as np
+import pytest
+
+from EKKOTools.parsing import CD, ABS
+from EKKOTools.synthetic import WriteSyntheticCorpus
+from EKKOTools.utilities import GetAllEKKOScanSummaries
+
+from conftest import legacy_scan
+
+@pytest.fixture
+def folder(tmp_path):
+    WriteSyntheticCorpus(tmp_path / 'plates', n_files=6, n_analytes=5, start=400, end=500)
+    return tmp_path / 'plates'
+
+def assert_same_summaries(summaries, expected):
+    assert [s.file.name for s in summaries] == [s.file.name for s in expected]
+    for summary, reference in zip(summaries, expected):
+        assert summary.well_names == reference.well_names
+        assert summary.wavelength_labels == reference.wavelength_labels
+        assert [well.analyte for well in summary.wells] == [well.analyte for well in reference.wells]
+        np.testing.assert_array_equal(summary.spectra, reference.spectra)
+
+def test_serial_ingest_matches_legacy_reader(folder):
+    summaries = GetAllEKKOScanSummaries(folder)
+    assert sorted(s.file.name for s in summaries) == sorted(f.name for f in folder.glob('*.cdxs'))
+    for summary in summaries:
+        well_names, _, cd, absorbance = legacy_scan(summary.file)
+        assert summary.well_names == well_names
+        np.testing.assert_array_equal(summary.spectra[:, :, CD], cd)
+        np.testing.assert_array_equal(summary.spectra[:, :, ABS], absorbance)
+
+def test_parallel_ingest_matches_serial(folder):
+    serial = GetAllEKKOScanSummaries(folder)
+    assert_same_summaries(GetAllEKKOScanSummaries(folder, n_jobs=2, chunksize=2), serial)
+    assert_same_summaries(GetAllEKKOScanSummaries(folder, n_jobs=2, executor='thread'), serial)
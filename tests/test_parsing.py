@@ -0,0 +1,88 @@
+import numpy as np
+import pytest
+
+from EKKOTools.parsing import ParseScanSummary, CD, ABS, CD_PER_ABS
+from EKKOTools.plates import PLATE_96
+from EKKOTools.synthetic import WriteSyntheticScanSummary
+
+from conftest import legacy_scan
+
+@pytest.fixture
+def small_file(tmp_path):
+    '''Scan summary of a 96 well plate measured at 400, 405 and 410 nm'''
+    return WriteSyntheticScanSummary(tmp_path / 'small.cdxs', start=400, end=410, analytes=['x', 'y'], seed=1)
+
+def replace_lines(file, replacements: dict):
+    '''Replaces whole lines of a file, keyed by their line number'''
+    lines = file.read_text().split('\n')
+    for i, line in replacements.items():
+        lines[i] = line
+    file.write_text('\n'.join(lines))
+
+def test_parse_matches_legacy_reader(small_file):
+    parsed = ParseScanSummary(small_file)
+    well_names, wavelength_labels, cd, absorbance = legacy_scan(small_file)
+
+    assert parsed.well_names == well_names
+    assert parsed.wavelength_labels == wavelength_labels
+    np.testing.assert_array_equal(parsed.wavelengths, [400, 405, 410])
+    np.testing.assert_array_equal(parsed.spectra[:, :, CD], cd)
+    np.testing.assert_array_equal(parsed.spectra[:, :, ABS], absorbance)
+    np.testing.assert_allclose(parsed.spectra[:, :, CD_PER_ABS], cd / absorbance)
+    assert parsed.spectra.flags['C_CONTIGUOUS']
+
+def test_parse_header_and_well_info(small_file):
+    parsed = ParseScanSummary(small_file)
+    assert parsed.date == '3/14/2023'
+    assert parsed.scan_process == 'Spectral Scan 400 to 410 nm step 5 nm'
+    assert parsed.well_plate_type == '96 Well Plate'
+    # Analytes are written column by column
+    assert parsed.well_info['A1'] == 'x'
+    assert parsed.well_info['B1'] == 'y'
+    assert len(parsed.well_info) == 96
+
+def test_unreadable_cells_are_nan(small_file):
+    # Lines 13-15 are the wavelengths of well A1
+    replace_lines(small_file, {13: '400\t\t1.0', 14: '405\tERR\t0', 15: '410\t2.0\tnan'})
+    parsed = ParseScanSummary(small_file)
+    a1 = parsed.spectra[0]
+    assert np.isnan(a1[0, CD]) and a1[0, ABS] == 1.0
+    assert np.isnan(a1[1, CD]) and np.isnan(a1[1, CD_PER_ABS])
+    assert np.isnan(a1[2, ABS]) and np.isnan(a1[2, CD_PER_ABS])
+    assert np.isfinite(parsed.spectra[1:]).all()
+
+def test_unequal_block_lengths_raise(small_file):
+    lines = small_file.read_text().split('\n')
+    del lines[15]
+    small_file.write_text('\n'.join(lines))
+    with pytest.raises(ValueError, match='same wavelengths'):
+        ParseScanSummary(small_file)
+
+def test_malformed_files_raise(small_file, tmp_path):
+    text = small_file.read_text()
+
+    other = tmp_path / 'other.cdxs'
+    other.write_text(text.replace('Hinds Instruments CD Reader', 'Some Other Reader'))
+    with pytest.raises(ValueError, match='not formatted'):
+        ParseScanSummary(other)
+
+    empty = tmp_path / 'empty.cdxs'
+    empty.write_text('')
+    with pytest.raises(ValueError, match='not formatted'):
+        ParseScanSummary(empty)
+
+    no_body = tmp_path / 'no_body.cdxs'
+    no_body.write_text(text.replace('WL\tCD-mDeg\tABS', 'Nothing here'))
+    with pytest.raises(ValueError, match='scan data'):
+        ParseScanSummary(no_body)
+
+    no_columns = tmp_path / 'no_columns.cdxs'
+    no_columns.write_text(text.replace('WL\tCD-mDeg\tABS', 'WL\tCD\tAbsorbance'))
+    with pytest.raises(ValueError, match='columns'):
+        ParseScanSummary(no_columns)
+
+def test_unknown_well_labels_raise(small_file):
+    replace_lines(small_file, {12: 'Z1\t\t'})
+    ParseScanSummary(small_file)
+    with pytest.raises(ValueError, match='Z1'):
+        ParseScanSummary(small_file, possible_wells=PLATE_96.labels)
@@ -0,0 +1,97 @@
+import pickle
+
+import numpy as np
+import pytest
+
+from EKKOTools.EKKOScanFormats import EKKOScanSummary
+from EKKOTools.parsing import ParseScanSummary, CD, ABS
+from EKKOTools.plates import GetPlateGeometry, IsWellLabel, PlateGeometry, PLATE_96, PLATE_384, PLATE_1536
+from EKKOTools.synthetic import WriteSyntheticScanSummary
+
+from conftest import legacy_scan
+
+PLATES = [(PLATE_96, '96 Well Plate'), (PLATE_384, '384 Well Plate'), (PLATE_1536, '1536 Well Plate')]
+
+def legacy_labels(n_rows: int, n_columns: int) -> list[str]:
+    '''Well labels of a plate, column by column, spelled out without PlateGeometry'''
+    letters = [chr(ord('A') + i) for i in range(26)] + ['A' + chr(ord('A') + i) for i in range(26)]
+    return [f'{letters[row]}{column + 1}' for column in range(n_columns) for row in range(n_rows)]
+
+@pytest.mark.parametrize('plate, well_plate_type', PLATES)
+def test_geometry_addresses_every_well(plate, well_plate_type):
+    labels = legacy_labels(plate.n_rows, plate.n_columns)
+    assert plate.labels == labels
+    assert plate.label_set == frozenset(labels)
+    assert len(plate) == len(labels)
+    assert GetPlateGeometry(well_plate_type) is plate
+
+    for i, label in enumerate(labels):
+        column, row = divmod(i, plate.n_rows)
+        assert plate.position(label) == (row, column)
+        assert plate.index(label) == row * plate.n_columns + column
+        assert plate.label(row, column) == label
+        assert label in plate
+
+def test_geometry_rejects_labels_outside_the_plate():
+    assert 'I1' not in PLATE_96 and 'A13' not in PLATE_96
+    assert 'P24' in PLATE_384 and 'Q1' not in PLATE_384
+    assert 'AF48' in PLATE_1536 and 'AG1' not in PLATE_1536
+    with pytest.raises(ValueError):
+        PLATE_96.position('H13')
+    with pytest.raises(IndexError):
+        PLATE_384.label(16, 0)
+    assert IsWellLabel('AF48') and not IsWellLabel('Average')
+
+def test_geometry_is_guessed_from_the_wells():
+    assert GetPlateGeometry('Custom Plate', ['A1', 'H12']) is PLATE_96
+    assert GetPlateGeometry('Custom Plate', ['A1', 'P24']) is PLATE_384
+    assert GetPlateGeometry('Custom Plate', ['A1', 'H30']) is PLATE_1536
+    assert GetPlateGeometry(None) is PLATE_96
+
+def test_unpickled_geometry_is_shared():
+    assert pickle.loads(pickle.dumps(PLATE_384)) is PLATE_384
+    custom = PlateGeometry(2, 3, 'Strip')
+    restored = pickle.loads(pickle.dumps(custom))
+    assert (restored.shape, restored.name, restored.labels) == ((2, 3), 'Strip', custom.labels)
+
+@pytest.mark.parametrize('plate, well_plate_type', PLATES)
+def test_summary_addresses_wells_like_the_legacy_reader(tmp_path, plate, well_plate_type):
+    file = WriteSyntheticScanSummary(tmp_path / 'plate.cdxs', start=400, end=410, well_plate_type=well_plate_type, seed=3)
+    summary = EKKOScanSummary(file)
+    well_names, wavelength_labels, cd, absorbance = legacy_scan(file)
+
+    assert summary.plate is plate
+    assert summary.well_names == well_names
+    assert sorted(well_names, key=plate.index) == sorted(plate.labels, key=plate.index)
+
+    plate_cd = summary.get_plate_spectra(CD)
+    plate_abs = summary.get_plate_spectra(ABS)
+    assert plate_cd.shape == (*plate.shape, len(wavelength_labels))
+    for i, name in enumerate(well_names):
+        well = summary.get_specific_well(name)
+        assert well.name == name
+        np.testing.assert_array_equal(well.get_spectrum(CD), cd[i])
+        np.testing.assert_array_equal(plate_cd[plate.position(name)], cd[i])
+        np.testing.assert_array_equal(plate_abs[plate.position(name)], absorbance[i])
+    assert summary.get_CD(well_names[-1]) == dict(zip(wavelength_labels, cd[-1]))
+
+def test_partial_plate_leaves_missing_wells_nan(tmp_path):
+    file = WriteSyntheticScanSummary(tmp_path / 'plate.cdxs', start=400, end=410, well_plate_type='384 Well Plate', seed=3)
+    parsed = ParseScanSummary(file, possible_wells=PLATE_384.label_set)
+    keep = [i for i, name in enumerate(parsed.well_names) if PLATE_384.position(name)[1] < 2]
+    parsed.well_names = [parsed.well_names[i] for i in keep]
+    parsed.spectra = np.ascontiguousarray(parsed.spectra[keep])
+    summary = EKKOScanSummary.from_parsed(parsed)
+
+    plate_cd = summary.get_plate_spectra(CD)
+    assert np.isnan(plate_cd[:, 2:]).all()
+    np.testing.assert_array_equal(plate_cd[PLATE_384.position('P2')], summary.get_specific_well('P2').get_spectrum(CD))
+    with pytest.raises(ValueError):
+        summary.get_specific_well('Q1')
+
+def test_parser_accepts_the_label_set_of_a_plate(tmp_path):
+    file = WriteSyntheticScanSummary(tmp_path / 'plate.cdxs', start=400, end=410, well_plate_type='384 Well Plate', seed=3)
+    with pytest.raises(ValueError, match='Well format not understood'):
+        ParseScanSummary(file, possible_wells=PLATE_96.label_set)
+    assert ParseScanSummary(file, possible_wells=PLATE_1536.label_set).well_names == legacy_scan(file)[0]
+    assert ParseScanSummary(file, possible_wells=PLATE_384.labels).well_names == legacy_scan(file)[0]
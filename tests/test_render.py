@@ -0,0 +1,105 @@
+import re
+import subprocess
+import sys
+
+import numpy as np
+import pytest
+
+pytest.importorskip('matplotlib')
+from matplotlib.image import imread
+
+from EKKOTools.EKKOScanFormats import EKKOScanSummary
+from EKKOTools.render import RenderSpectraPanels, _draw, _pages
+from EKKOTools.synthetic import WriteSyntheticScanSummary
+
+from conftest import ROOT, legacy_scan
+
+OPTIONS = (None, (17, 6), 50, 10)
+
+@pytest.fixture
+def plate(tmp_path):
+    '''A small plate with the analytes x, y and z'''
+    return WriteSyntheticScanSummary(tmp_path / 'plate.cdxs', start=400, end=500, analytes=['x', 'y', 'z'], seed=2)
+
+def test_lines_hold_the_spectra_of_the_legacy_reader(plate):
+    summary = EKKOScanSummary(plate)
+    well_names, wavelength_labels, cd, absorbance = legacy_scan(plate)
+    wavelengths = np.array(wavelength_labels, dtype=np.float64)
+    analytes = {well.name: well.analyte for well in summary.wells}
+
+    pages = _pages(summary, 'analyte')
+    assert [page['title'] for page in pages] == ['x', 'y', 'z']
+    for page in pages:
+        fig = _draw(page, OPTIONS)
+        rows = [i for i, name in enumerate(well_names) if analytes[name] == page['title']]
+        assert fig._suptitle.get_text() == page['title']
+        for ax, expected in zip(fig.axes, (cd, absorbance, cd / absorbance)):
+            lines = [line for line in ax.get_lines() if line.get_visible()]
+            assert len(lines) == len(rows)
+            for line, i in zip(lines, rows):
+                assert line.get_label() == f'plate.cdxs {well_names[i]}'
+                np.testing.assert_array_equal(line.get_xdata(), wavelengths)
+                np.testing.assert_allclose(line.get_ydata(), expected[i])
+
+def test_lines_are_reused_between_pages(plate):
+    summary = EKKOScanSummary(plate)
+    pages = _pages(summary.wells[:6], 'well')
+    many = {'title': 'many', 'name': 'many', 'traces': [trace for page in pages for trace in page['traces']]}
+
+    fig = _draw(many, OPTIONS)
+    lines = list(fig.axes[0].get_lines())
+    fig = _draw(pages[0], (None, (17, 6), 50, 0))
+    # The figure of this process is shared, so earlier tests may have added lines too
+    assert fig.axes[0].get_lines() == lines and len(lines) >= 6
+    assert [line.get_visible() for line in lines] == [True] + [False] * (len(lines) - 1)
+    assert fig.axes[0].get_legend() is None
+
+    # Only the wavelengths inside xlim are drawn
+    fig = _draw(pages[0], ((420, 460), (17, 6), 50, 10))
+    np.testing.assert_array_equal(fig.axes[1].get_lines()[0].get_xdata(), np.arange(420, 461, 5.0))
+
+def test_images_and_multi_page_pdf(plate, tmp_path):
+    summary = EKKOScanSummary(plate)
+    written = RenderSpectraPanels(summary, tmp_path / 'images', formats=['png', 'svg'], pdf=tmp_path / 'report.pdf', dpi=20)
+
+    names = [path.name for path in written]
+    assert names == ['x.png', 'x.svg', 'y.png', 'y.svg', 'z.png', 'z.svg', 'report.pdf']
+    assert imread(tmp_path / 'images' / 'x.png').shape[:2] == (6 * 20, 17 * 20)
+    assert (tmp_path / 'images' / 'y.svg').read_text().lstrip().startswith('<?xml')
+    assert len(re.findall(rb'/Type\s*/Page\b(?!s)', (tmp_path / 'report.pdf').read_bytes())) == 3
+
+def test_parallel_rendering_matches_serial(plate, tmp_path):
+    summary = EKKOScanSummary(plate)
+    serial = RenderSpectraPanels(summary, tmp_path / 'serial', group_by='file', dpi=20)
+    serial += RenderSpectraPanels(summary.wells[:8], tmp_path / 'serial', group_by='well', dpi=20)
+    parallel = RenderSpectraPanels(summary, tmp_path / 'parallel', group_by='file', dpi=20, n_jobs=2)
+    parallel += RenderSpectraPanels(summary.wells[:8], tmp_path / 'parallel', group_by='well', dpi=20, n_jobs=2, chunksize=3)
+
+    assert [path.name for path in parallel] == [path.name for path in serial]
+    for a, b in zip(serial, parallel):
+        np.testing.assert_array_equal(imread(a), imread(b))
+
+def test_groups_and_names(plate, tmp_path):
+    summary = EKKOScanSummary(plate)
+    written = RenderSpectraPanels(
+        summary.wells[:4], tmp_path, dpi=20,
+        group_by=lambda well: None if well.name == 'A1' else 'a/b' if well.name in ('B1', 'C1') else 'a b')
+    assert [path.name for path in written] == ['a_b.png', 'a_b_1.png']
+
+    with pytest.raises(ValueError):
+        RenderSpectraPanels(summary, tmp_path, formats=['jpg'])
+    with pytest.raises(ValueError):
+        RenderSpectraPanels(summary, tmp_path, group_by='row')
+    with pytest.raises(ValueError):
+        RenderSpectraPanels(summary)
+
+def test_rendering_does_not_load_pyplot(plate, tmp_path):
+    code = (
+        'import sys\n'
+        'from EKKOTools.EKKOScanFormats import EKKOScanSummary\n'
+        'from EKKOTools.render import RenderSpectraPanels\n'
+        f'RenderSpectraPanels(EKKOScanSummary({str(plate)!r}), {str(tmp_path)!r}, dpi=20)\n'
+        "print('matplotlib.pyplot' in sys.modules)\n")
+    result = subprocess.run([sys.executable, '-c', code], cwd=ROOT, capture_output=True, text=True, check=True)
+    assert result.stdout.strip() == 'False'
+    assert sorted(path.name for path in tmp_path.glob('*.png')) == ['x.png', 'y.png', 'z.png']
@@ -0,0 +1,95 @@
+import numpy as np
+import pytest
+from scipy.interpolate import CubicSpline
+
+from EKKOTools.EKKOScanFormats import EKKOScanSummary
+from EKKOTools.corpus import EKKOCorpus
+from EKKOTools.parsing import CD, ABS, CD_PER_ABS
+from EKKOTools.resample import CommonGrid, ResampleSpectra, ResampleWells
+from EKKOTools.synthetic import WriteSyntheticScanSummary
+
+from conftest import legacy_scan
+
+def reference(y: np.ndarray, source: np.ndarray, target: np.ndarray, method: str) -> np.ndarray:
+    '''np.interp or a natural CubicSpline of one spectrum, NaN outside of the source range'''
+    if method == 'linear':
+        result = np.interp(target, source, y)
+    else:
+        result = CubicSpline(source, y, bc_type='natural')(target)
+    result[(target < source.min()) | (target > source.max())] = np.nan
+    return result
+
+@pytest.mark.parametrize('method', ['linear', 'cubic'])
+def test_resample_spectra_matches_scipy(method):
+    rng = np.random.default_rng(0)
+    source = np.arange(400, 701, 5.0)
+    target = np.arange(390, 720, 2.0)
+    spectra = rng.normal(size=(4, 3, len(source)))
+
+    resampled = ResampleSpectra(spectra, source, target, method=method)
+    assert resampled.shape == (4, 3, len(target))
+    for y, expected in zip(spectra.reshape(-1, len(source)), resampled.reshape(-1, len(target))):
+        np.testing.assert_allclose(expected, reference(y, source, target, method), atol=1e-12)
+
+    # Descending wavelengths are the same spectra
+    np.testing.assert_allclose(ResampleSpectra(spectra[..., ::-1], source[::-1], target, method=method), resampled, atol=1e-12)
+
+@pytest.mark.parametrize('method', ['linear', 'cubic'])
+def test_spectra_with_nan_use_their_finite_points(method):
+    source = np.arange(400, 451, 5.0)
+    target = np.arange(400, 451, 1.0)
+    spectra = np.random.default_rng(1).normal(size=(3, len(source)))
+    spectra[1, 4] = np.nan
+    spectra[2, 1:] = np.nan
+
+    resampled = ResampleSpectra(spectra, source, target, method=method)
+    np.testing.assert_allclose(resampled[0], reference(spectra[0], source, target, method), atol=1e-12)
+    keep = np.isfinite(spectra[1])
+    np.testing.assert_allclose(resampled[1], reference(spectra[1, keep], source[keep], target, method), atol=1e-12)
+    assert np.isnan(resampled[2]).all()
+
+def test_common_grid():
+    first, second = np.arange(400, 701, 5.0), np.arange(450, 801, 2.0)
+    assert CommonGrid([first, first]) is first
+    np.testing.assert_array_equal(CommonGrid([first, first.copy()]), first)
+    np.testing.assert_allclose(CommonGrid([first, second]), np.arange(450, 701, 2.0))
+    np.testing.assert_allclose(CommonGrid([first, second], policy='union', step=10), np.arange(400, 801, 10.0))
+    with pytest.raises(ValueError):
+        CommonGrid([np.arange(400, 450, 5.0), np.arange(500, 550, 5.0)])
+    with pytest.raises(ValueError):
+        CommonGrid([first, second], policy='outer')
+
+@pytest.mark.parametrize('method', ['linear', 'cubic'])
+def test_resample_wells_matches_legacy_reader(tmp_path, method):
+    files = [
+        WriteSyntheticScanSummary(tmp_path / 'coarse.cdxs', start=400, end=600, step=10, analytes=['x', 'y'], seed=0),
+        WriteSyntheticScanSummary(tmp_path / 'fine.cdxs', start=450, end=700, step=5, analytes=['x', 'y'], seed=1)]
+    corpus = EKKOCorpus([EKKOScanSummary(file) for file in files])
+
+    wells = ResampleWells(corpus, method=method)
+    grid = np.arange(450, 601, 5.0)
+    assert len(wells) == 2 * 96
+    for file, start in zip(files, (0, 96)):
+        well_names, wavelength_labels, cd, absorbance = legacy_scan(file)
+        source = np.array(wavelength_labels, dtype=np.float64)
+        for i, name in enumerate(well_names):
+            well = wells[start + i]
+            assert well.name == name
+            assert well.wavelength_labels == [f'{wl:g}' for wl in grid]
+            expected_cd = reference(cd[i], source, grid, method)
+            expected_abs = reference(absorbance[i], source, grid, method)
+            np.testing.assert_allclose(well.get_spectrum(CD), expected_cd, atol=1e-12)
+            np.testing.assert_allclose(well.get_spectrum(ABS), expected_abs, atol=1e-12)
+            np.testing.assert_allclose(well.get_spectrum(CD_PER_ABS), expected_cd / expected_abs, rtol=1e-10)
+
+def test_resample_wells_keeps_the_input(summary):
+    well = summary.wells[0]
+    well.CD = {wl: 2.0 for wl in well.wavelength_labels}
+    measured = summary.spectra.copy()
+    wells = ResampleWells(summary, grid=np.arange(402.5, 690, 5.0))
+
+    np.testing.assert_array_equal(summary.spectra, measured)
+    np.testing.assert_allclose(wells[0].get_spectrum(CD), 2.0)
+    assert [new.analyte for new in wells] == [old.analyte for old in summary.wells]
+    with pytest.raises(ValueError):
+        ResampleWells(summary, method='nearest')
@@ -0,0 +1,43 @@
+from unittest import mock
+
+import numpy as np
+import pytest
+from scipy.signal import savgol_filter
+
+from EKKOTools import smooth
+from EKKOTools.smooth import SmoothSpectra, SmoothWells, SmoothWellSpectra
+
+def test_smooth_well_spectra_warns_instead_of_printing(summary, capsys):
+    well = summary.wells[0]
+    with mock.patch.object(smooth, 'SmoothWells', return_value=[(well, 'ABS')]):
+        with pytest.warns(UserWarning, match='absorbance'):
+            assert SmoothWellSpectra(well, window_length=7, polyorder=2) is well
+    assert capsys.readouterr().out == ''
+
+@pytest.mark.parametrize('deriv', [0, 1, 2])
+def test_smooth_spectra_matches_savgol_filter(deriv):
+    spectra = np.random.default_rng(deriv).normal(size=(2, 5, 61))
+    smoothed, failed = SmoothSpectra(spectra, 11, 3, deriv=deriv, delta=5.0)
+    expected = savgol_filter(spectra, 11, 3, deriv=deriv, delta=5.0, axis=-1)
+    np.testing.assert_allclose(smoothed, expected, atol=1e-12)
+    assert not failed.any()
+
+def test_smooth_spectra_with_nan():
+    spectra = np.random.default_rng(0).normal(size=(3, 61))
+    spectra[1, 30] = np.nan
+    spectra[2] = np.nan
+    smoothed, failed = SmoothSpectra(spectra, 11, 3, mode='nearest')
+    np.testing.assert_allclose(smoothed, savgol_filter(spectra, 11, 3, mode='nearest', axis=-1), atol=1e-12)
+    assert not failed.any()
+    # mode='interp' fits the edges, which fails for NaN, the rest is still smoothed
+    smoothed, failed = SmoothSpectra(spectra, 11, 3)
+    assert failed.tolist() == [False, False, True]
+    np.testing.assert_allclose(smoothed[0], savgol_filter(spectra[0], 11, 3), atol=1e-12)
+    assert np.isnan(smoothed[2]).all()
+
+def test_smooth_wells_matches_smoothing_each_well(summary):
+    wells = summary.wells[:6]
+    expected = [savgol_filter(well.get_current_spectra(), 7, 2, axis=0) for well in wells]
+    assert SmoothWells(wells, window_length=7, polyorder=2) == []
+    for well, spectra in zip(wells, expected):
+        np.testing.assert_allclose(well.get_current_spectra(), spectra, atol=1e-12)
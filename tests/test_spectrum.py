@@ -0,0 +1,109 @@
+import operator
+
+import numpy as np
+import pytest
+
+from EKKOTools.parsing import CD, ABS, CD_PER_ABS
+from EKKOTools.spectrum import Spectrum
+from EKKOTools.utilities import GetDifferenceWell
+
+OPERATIONS = [operator.add, operator.sub, operator.mul, operator.truediv]
+
+def legacy(d1: dict, d2, operation) -> dict:
+    '''Dict comprehension over the wavelength keys, like EKKOTools did before Spectrum'''
+    if isinstance(d2, dict):
+        return {x: operation(d1[x], d2[x]) for x in d1 if x in d2}
+    return {x: operation(d1[x], d2) for x in d1}
+
+def assert_dicts_equal(actual: dict, expected: dict):
+    assert list(actual) == list(expected)
+    np.testing.assert_allclose(list(actual.values()), list(expected.values()), rtol=1e-12)
+
+@pytest.mark.parametrize('operation', OPERATIONS)
+def test_arithmetic_matches_dict_comprehensions(summary, operation):
+    w1, w2 = summary.wells[:2]
+    result = operation(Spectrum.from_well(w1, CD), Spectrum.from_well(w2, CD))
+    assert_dicts_equal(result.to_dict(), legacy(w1.CD, w2.CD, operation))
+    assert result.wavelengths is w1.wavelengths
+
+    assert_dicts_equal(operation(Spectrum.from_well(w1, ABS), 2.5).to_dict(), legacy(w1.ABS, 2.5, operation))
+    reflected = operation(2.5, Spectrum.from_well(w1, ABS)).to_dict()
+    assert_dicts_equal(reflected, {x: operation(2.5, value) for x, value in w1.ABS.items()})
+
+def test_stack_minus_blank_broadcasts(summary):
+    wells, blank = summary.wells[1:40], summary.wells[0]
+    stack = Spectrum.from_wells(wells, CD_PER_ABS)
+    corrected = stack - Spectrum.from_well(blank, CD_PER_ABS)
+    assert corrected.shape == (len(wells), len(summary.wavelengths))
+    for well, spectrum in zip(wells, corrected):
+        assert_dicts_equal(spectrum.to_dict(), legacy(well.CD_PER_ABS, blank.CD_PER_ABS, operator.sub))
+
+    # Arrays broadcast like NumPy arrays, one factor per well
+    factors = np.arange(len(wells), dtype=np.float64)[:, None]
+    np.testing.assert_array_equal((factors * stack).values, factors * stack.values)
+    np.testing.assert_array_equal(-abs(stack).values, -np.abs(stack.values))
+
+def test_views_are_not_copied(summary):
+    spectra = Spectrum.from_summary(summary, CD)
+    assert np.shares_memory(spectra.values, summary.spectra)
+    np.testing.assert_array_equal(spectra.values, [well.get_spectrum(CD) for well in summary.wells])
+
+    window = spectra[2:5].between(450, 410)
+    assert np.shares_memory(window.values, summary.spectra)
+    assert window.wavelength_labels == [label for label in summary.wavelength_labels if 410 <= float(label) <= 450]
+    assert_dicts_equal(window[0].to_dict(), {x: summary.wells[2].CD[x] for x in window.wavelength_labels})
+    assert spectra.between(900, 950).shape == (len(summary.wells), 0)
+
+def test_mean_ignores_nan(summary):
+    stack = Spectrum.from_wells(summary.wells[:3], CD)
+    values = stack.values.copy()
+    values[0, 0] = np.nan
+    mean = Spectrum(values, stack.wavelengths).mean()
+    assert mean.values[0] == pytest.approx(values[1:, 0].mean())
+    np.testing.assert_allclose(mean.values[1:], values[:, 1:].mean(axis=0))
+
+def test_invalid_spectra_and_operands(summary):
+    spectrum = Spectrum.from_well(summary.wells[0], CD)
+    with pytest.raises(ValueError):
+        spectrum + spectrum.between(400, 500)
+    with pytest.raises(ValueError):
+        Spectrum(np.zeros(3), np.arange(4))
+    with pytest.raises(IndexError):
+        Spectrum.from_wells(summary.wells[:2], CD)[:, 0]
+    with pytest.raises(ValueError):
+        Spectrum.from_wells(summary.wells[:2], CD).to_dict()
+    with pytest.raises(ValueError):
+        Spectrum.from_wells([], CD)
+    with pytest.raises(TypeError):
+        spectrum + 'a'
+
+def test_dicts_round_trip(summary):
+    well = summary.wells[4]
+    spectrum = Spectrum.from_dict(well.CD)
+    np.testing.assert_array_equal(spectrum.wavelengths, well.wavelengths)
+    assert spectrum.to_dict() == well.CD
+
+def test_wells_take_spectra(summary):
+    well, blank = summary.wells[3], summary.wells[0]
+    expected = legacy(well.CD, blank.CD, operator.sub)
+    well.CD = well.as_spectrum(CD) - blank.as_spectrum(CD)
+    assert_dicts_equal(well.CD, expected)
+    np.testing.assert_allclose(well.get_spectrum(CD), list(expected.values()))
+
+def test_difference_well_matches_legacy(summary):
+    w1, w2 = summary.wells[5], summary.wells[6]
+    measured = w1.get_current_spectra().copy()
+    difference = GetDifferenceWell(w1, w2)
+
+    assert difference.analyte == f'{w1.analyte} - {w2.analyte}'
+    assert difference.name == w1.name
+    for attribute in ('CD', 'ABS', 'CD_PER_ABS'):
+        assert_dicts_equal(getattr(difference, attribute), legacy(getattr(w1, attribute), getattr(w2, attribute), operator.sub))
+    np.testing.assert_array_equal(w1.get_current_spectra(), measured)
+
+    # Spectra assigned on other wavelengths go through the dict path
+    w1.CD = {x: value for x, value in list(w1.CD.items())[::2]}
+    w2.CD = dict(w1.CD)
+    difference = GetDifferenceWell(w1, w2).CD
+    assert list(difference) == list(w1.CD)
+    assert all(value == 0 for value in difference.values())
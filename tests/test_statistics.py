@@ -0,0 +1,101 @@
+from itertools import combinations
+
+import numpy as np
+import pytest
+
+from EKKOTools.corpus import EKKOCorpus
+from EKKOTools.statistics import PairwiseSpectralDistances, PCAWells, PickN, PickNForAllAnalytes, PickNSpectra, SpectralPCA
+from EKKOTools.utilities import GetAllSpectraFromWells
+
+@pytest.mark.parametrize('seed', range(200))
+def test_pickn_matches_brute_force(seed):
+    rng = np.random.default_rng(seed)
+    m = int(rng.integers(2, 9))
+    n = int(rng.integers(2, m + 1))
+    values = np.round(rng.normal(size=m) * 10.0 ** rng.integers(-2, 4), 1)
+    if rng.random() < 0.3:
+        values[rng.integers(m)] = np.nan
+    spectra = [{'520': v} for v in values]
+
+    best = PickN(spectra, n=n)
+
+    finite = [c for c in combinations(range(m), n) if not np.isnan(values[list(c)]).any()]
+    if not finite:
+        return
+    expected = min(np.std(values[list(c)], ddof=1) for c in finite)
+    chosen = np.array([s['520'] for s in best])
+    assert np.std(chosen, ddof=1) == pytest.approx(expected, rel=1e-9, abs=1e-12)
+
+@pytest.mark.parametrize('spectra_type', ['cd', 'abs', 'cd_per_abs'])
+def test_pickn_of_wells_matches_spectrum_dicts(summary, spectra_type):
+    wells = summary.get_wells_of_particular_analytes('a')
+    # Assigned spectra are current and must be used as well
+    wells[0].CD = wells[0].get_spectrum(0) * 2
+    dicts = GetAllSpectraFromWells(wells, spectra_type=spectra_type)
+    for n in (2, 3, 5):
+        best = PickN(wells, n=n, wl=520, spectra_type=spectra_type)
+        legacy = PickN(dicts, n=n, wl=520)
+        assert [wells.index(well) for well in best] == [next(i for i, d in enumerate(dicts) if d is s) for s in legacy]
+
+def test_pickn_of_missing_wavelength_raises(summary):
+    with pytest.raises(KeyError):
+        PickN(summary.get_wells_of_particular_analytes('a'), wl=521, spectra_type='cd')
+
+def test_pickn_for_all_analytes_matches_pickn(summary):
+    best = PickNForAllAnalytes([summary], n=3, spectra_type='cd')
+    corpus = EKKOCorpus([summary])
+    assert set(best) == {'DMSO', 'a', 'b'}
+    for analyte, wells in best.items():
+        assert wells == PickN(corpus.get_wells(analyte), n=3, spectra_type='cd')
+
+def test_pickn_spectra_matches_brute_force(summary):
+    wells = summary.wells[:9]
+    d = PairwiseSpectralDistances(wells)
+    score = lambda group: sum(d[a, b] for a, b in combinations(group, 2))
+    for n in range(2, 6):
+        expected = min(score(group) for group in combinations(range(len(wells)), n))
+        for method in ('auto', 'exact', 'greedy'):
+            best = PickNSpectra(wells, n=n, method=method)
+            chosen = [wells.index(well) for well in best]
+            assert len(set(chosen)) == n
+            if method != 'greedy':
+                assert score(chosen) == pytest.approx(expected)
+            else:
+                assert score(chosen) >= expected - 1e-12
+
+def test_pickn_spectra_greedy_above_the_limit(summary):
+    wells = summary.wells[:12]
+    exact = PickNSpectra(wells, n=4, method='exact')
+    # Only two groups are allowed, so 'auto' has to search greedily
+    greedy = PickNSpectra(wells, n=4, exact_limit=2)
+    d = PairwiseSpectralDistances(wells)
+    score = lambda best: sum(d[wells.index(a), wells.index(b)] for a, b in combinations(best, 2))
+    assert score(greedy) >= score(exact) - 1e-12
+    assert score(PickNSpectra(wells, n=2, exact_limit=2)) == pytest.approx(score(PickNSpectra(wells, n=2)))
+    with pytest.raises(ValueError):
+        PickNSpectra(wells, n=2, method='random')
+
+def test_spectral_pca_rejects_iterators_it_reads_twice(summary):
+    with pytest.raises(TypeError):
+        SpectralPCA(n_comp=2).fit(iter([summary]))
+    with pytest.raises(TypeError):
+        SpectralPCA(n_comp=2, scale=False).fit_transform(s for s in [summary])
+    model = SpectralPCA(n_comp=2, scale=False).fit(iter([summary]))
+    assert len(model.transform([summary])) == len(summary.wells)
+
+def test_batched_pca_matches_pca(summary):
+    full = PCAWells(summary.wells, n_comp=2)
+    one_batch = PCAWells(summary.wells, n_comp=2, batch_size=len(summary.wells))
+    assert list(one_batch.columns) == list(full.columns)
+    assert list(one_batch.index) == list(full.index)
+    # Components are only defined up to their sign
+    np.testing.assert_allclose(np.abs(one_batch.to_numpy()), np.abs(full.to_numpy()), rtol=1e-6, atol=1e-8)
+
+    # Smaller batches approximate the same components
+    batched = PCAWells(summary.wells, n_comp=2, batch_size=32)
+    for column in full.columns:
+        assert abs(np.corrcoef(batched[column], full[column])[0, 1]) > 0.99
+
+def test_umap_cannot_be_batched(summary):
+    with pytest.raises(ValueError, match='UMAP'):
+        PCAWells(summary.wells, umap=True, batch_size=32)
@@ -0,0 +1,101 @@
+import pickle
+
+import numpy as np
+import pytest
+
+from EKKOTools.EKKOScanFormats import EKKOScanSummary
+from EKKOTools.parsing import CD, ABS, CD_PER_ABS
+from EKKOTools.store import OpenSpectralStore, SpectralStore, WriteSpectralStore
+from EKKOTools.synthetic import WriteSyntheticScanSummary
+
+from conftest import legacy_scan
+
+@pytest.fixture
+def folder(tmp_path):
+    '''Three plates, the last of which is measured on a longer wavelength grid'''
+    folder = tmp_path / 'scans'
+    folder.mkdir()
+    for i in range(3):
+        WriteSyntheticScanSummary(folder / f'plate_{i}.cdxs', start=400, end=420 if i < 2 else 440, analytes=['x', 'y', 'z'], seed=i)
+    return folder
+
+def assert_matches_legacy(summary, file, dtype=np.float64):
+    well_names, wavelength_labels, cd, absorbance = legacy_scan(file)
+    assert summary.file == file
+    assert summary.well_names == well_names
+    assert summary.wavelength_labels == wavelength_labels
+    np.testing.assert_array_equal(summary.spectra[:, :, CD], cd.astype(dtype))
+    np.testing.assert_array_equal(summary.spectra[:, :, ABS], absorbance.astype(dtype))
+    np.testing.assert_allclose(summary.spectra[:, :, CD_PER_ABS], cd / absorbance, rtol=1e-6 if dtype == np.float32 else 1e-12)
+
+def test_round_trip_matches_legacy_reader(folder, tmp_path):
+    files = sorted(folder.glob('*.cdxs'))
+    store = WriteSpectralStore(folder, tmp_path / 'store', batch_size=2)
+
+    assert len(store) == 3
+    assert store.files == files
+    assert len(store.grids) == 2
+    for summary, file in zip(store, files):
+        assert_matches_legacy(summary, file)
+        original = EKKOScanSummary(file)
+        assert summary.header == original.header
+        assert summary.date == original.date
+        assert [well.analyte for well in summary.wells] == [well.analyte for well in original.wells]
+        assert np.shares_memory(summary.spectra, store.spectra)
+    assert_matches_legacy(store[-1], files[-1])
+
+    expected = [i for i, well in enumerate(well for summary in store for well in summary.wells) if well.analyte == 'y']
+    np.testing.assert_array_equal(store.get_well_indices('y'), expected)
+    assert len(store.get_well_indices('missing')) == 0
+
+def test_single_grid_channel_has_one_row_per_well(folder, tmp_path):
+    files = sorted(folder.glob('*.cdxs'))[:2]
+    store = WriteSpectralStore([EKKOScanSummary(file) for file in files], tmp_path / 'store')
+    expected = np.concatenate([legacy_scan(file)[2] for file in files])
+    np.testing.assert_array_equal(store.get_channel(CD), expected)
+
+def test_float32_store(folder, tmp_path):
+    files = sorted(folder.glob('*.cdxs'))
+    wide = WriteSpectralStore(folder, tmp_path / 'float64')
+    narrow = WriteSpectralStore(folder, tmp_path / 'float32', dtype=np.float32)
+
+    assert narrow.spectra.dtype == np.float32
+    assert (narrow.directory / 'spectra.npy').stat().st_size < 0.6 * (wide.directory / 'spectra.npy').stat().st_size
+    for summary, file in zip(narrow, files):
+        assert_matches_legacy(summary, file, dtype=np.float32)
+
+def test_current_spectra_are_stored(summary, tmp_path):
+    well = summary.wells[5]
+    well.CD = {wl: 1.0 for wl in well.wavelength_labels}
+    store = WriteSpectralStore(summary, tmp_path / 'store')
+    np.testing.assert_array_equal(store[0].wells[5].get_spectrum(CD), 1.0)
+
+def test_pickled_summaries_reattach_to_the_store(folder, tmp_path):
+    files = sorted(folder.glob('*.cdxs'))
+    directory = tmp_path / 'store'
+    WriteSpectralStore(folder, directory)
+    summary = SpectralStore(directory)[1]
+
+    data = pickle.dumps(summary)
+    # Only the location in the store is pickled, not the spectra
+    assert len(data) < summary.spectra.nbytes
+    restored = pickle.loads(data)
+    assert np.shares_memory(restored.spectra, OpenSpectralStore(str(directory.resolve())).spectra)
+    assert_matches_legacy(restored, files[1])
+    assert [well.analyte for well in restored.wells] == [well.analyte for well in summary.wells]
+    np.testing.assert_array_equal(restored.wells[0].get_spectrum(CD), summary.wells[0].get_spectrum(CD))
+
+def test_existing_directory_and_failed_writes(folder, tmp_path):
+    directory = tmp_path / 'store'
+    WriteSpectralStore(folder, directory)
+    with pytest.raises(FileExistsError):
+        WriteSpectralStore(folder, directory)
+
+    (folder / 'broken.cdxs').write_text('not a scan summary\n')
+    with pytest.raises(ValueError):
+        WriteSpectralStore(folder, directory, overwrite=True)
+    # The temporary directory of the failed write is removed
+    assert sorted(path.name for path in tmp_path.iterdir()) == ['scans']
+
+    store = WriteSpectralStore(folder, directory, errors='ignore')
+    assert len(store) == 3
@@ -0,0 +1,21 @@
+import numpy as np
+
+from EKKOTools.utilities import DetermineLambdaMaxRange
+
+def test_lambda_max_range_finds_largest_absolute_cd(summary):
+    well = summary.wells[0]
+    wavelengths = np.asarray(well.wavelengths, dtype=np.float64)
+    cd = -np.exp(-((wavelengths - 450) / 10) ** 2)
+    cd[wavelengths > 600] = 1.5
+    well.CD = cd
+    assert DetermineLambdaMaxRange(well, [400, 500]) == '450'
+    assert DetermineLambdaMaxRange(well, [400, 700]) == '605'
+
+def test_lambda_max_range_of_all_nan_range_is_nan(summary):
+    well = summary.wells[0]
+    wavelengths = np.asarray(well.wavelengths, dtype=np.float64)
+    cd = np.ones(len(wavelengths))
+    cd[wavelengths < 500] = np.nan
+    well.CD = cd
+    assert np.isnan(DetermineLambdaMaxRange(well, [400, 495]))
+    assert DetermineLambdaMaxRange(well, [400, 505]) == '500'
@@ -0,0 +1,157 @@
+import os
+import queue
+import time
+from types import SimpleNamespace
+
+import numpy as np
+import pytest
+
+from EKKOTools import watch
+from EKKOTools.EKKOScanFormats import EKKOScanSummary
+from EKKOTools.cache import ScanSummaryCache
+from EKKOTools.corpus import EKKOCorpus
+from EKKOTools.synthetic import WriteSyntheticScanSummary
+from EKKOTools.watch import ScanSummaryWatcher
+
+from conftest import legacy_scan
+
+@pytest.fixture
+def clock(monkeypatch):
+    '''Monotonic clock of the watch module which only moves when it is told to'''
+    clock = SimpleNamespace(now=1000.0)
+    monkeypatch.setattr(watch, 'time', SimpleNamespace(monotonic=lambda: clock.now, time_ns=time.time_ns))
+    return clock
+
+def write(folder, name, seed, end=450):
+    return WriteSyntheticScanSummary(folder / name, start=400, end=end, analytes=['x', 'y'], seed=seed)
+
+def touch(file, seconds):
+    '''Moves the modification time of a file by seconds'''
+    stat = os.stat(file)
+    os.utime(file, ns=(stat.st_atime_ns, stat.st_mtime_ns + int(seconds * 1e9)))
+
+def assert_matches_legacy(summary, file):
+    well_names, wavelength_labels, cd, absorbance = legacy_scan(file)
+    assert summary.file == file
+    assert summary.well_names == well_names
+    assert summary.wavelength_labels == wavelength_labels
+    np.testing.assert_array_equal(summary.spectra[:, :, 0], cd)
+    np.testing.assert_array_equal(summary.spectra[:, :, 1], absorbance)
+
+def test_new_files_are_reported_once(tmp_path, clock):
+    first = write(tmp_path, 'first.cdxs', seed=0)
+    reported = []
+    watcher = ScanSummaryWatcher(tmp_path, reported.append, settle_time=0)
+
+    summaries = watcher.poll()
+    assert summaries == reported and len(summaries) == 1
+    assert_matches_legacy(summaries[0], first)
+
+    second = write(tmp_path, 'second.cdxs', seed=1)
+    (tmp_path / 'notes.txt').write_text('not a scan')
+    summaries = watcher.poll()
+    assert [summary.file for summary in summaries] == [second]
+    assert_matches_legacy(summaries[0], second)
+    assert watcher.poll() == []
+    assert len(reported) == 2
+
+def test_files_wait_until_they_settle(tmp_path, clock):
+    file = write(tmp_path, 'plate.cdxs', seed=0)
+    watcher = ScanSummaryWatcher(tmp_path, lambda summary: None, settle_time=2.0)
+    assert watcher.poll() == []
+
+    # A write restarts the clock
+    clock.now += 1.5
+    with open(file, 'a') as f:
+        f.write('\n')
+    assert watcher.poll() == []
+    clock.now += 1.5
+    assert watcher.poll() == []
+
+    clock.now += 1.0
+    summaries = watcher.poll()
+    assert len(summaries) == 1
+    assert_matches_legacy(summaries[0], file)
+
+def test_include_existing(tmp_path, clock):
+    old = write(tmp_path, 'old.cdxs', seed=0)
+    watcher = ScanSummaryWatcher(tmp_path, lambda summary: None, settle_time=0, include_existing=False)
+    new = write(tmp_path, 'new.cdxs', seed=1)
+    assert [summary.file for summary in watcher.poll()] == [new]
+
+    # Changing an existing file reports it after the next full rescan
+    write(tmp_path, 'old.cdxs', seed=2, end=460)
+    clock.now += 60
+    summaries = watcher.poll()
+    assert [summary.file for summary in summaries] == [old]
+    assert_matches_legacy(summaries[0], old)
+
+def test_files_modified_in_place_are_found_by_the_full_rescan(tmp_path, clock, monkeypatch):
+    file = write(tmp_path, 'plate.cdxs', seed=0)
+    watcher = ScanSummaryWatcher(tmp_path, lambda summary: None, settle_time=0, rescan_interval=60)
+    assert len(watcher.poll()) == 1
+
+    # Same size, newer modification time, and the folder is not racy anymore
+    monkeypatch.setattr(watch, 'RACY_WINDOW_NS', 0)
+    write(tmp_path, 'plate.cdxs', seed=1)
+    touch(file, 5)
+    assert watcher.poll() == []
+
+    clock.now += 60
+    summaries = watcher.poll()
+    assert len(summaries) == 1
+    assert_matches_legacy(summaries[0], file)
+
+def test_deleted_files_are_forgotten(tmp_path, clock):
+    file = write(tmp_path, 'plate.cdxs', seed=0)
+    watcher = ScanSummaryWatcher(tmp_path, lambda summary: None, settle_time=0)
+    assert len(watcher.poll()) == 1
+
+    file.unlink()
+    assert watcher.poll() == []
+    assert watcher._ingested == {} and watcher._stats == {}
+
+    write(tmp_path, 'plate.cdxs', seed=0)
+    assert len(watcher.poll()) == 1
+
+def test_errors_are_reported_and_retried_after_a_change(tmp_path, clock):
+    file = tmp_path / 'broken.cdxs'
+    file.write_text('not a scan summary\n')
+    errors = []
+    watcher = ScanSummaryWatcher(tmp_path, lambda summary: None, on_error=lambda *error: errors.append(error), settle_time=0)
+
+    assert watcher.poll() == []
+    assert [error[0] for error in errors] == [file]
+    assert watcher.poll() == []
+    assert len(errors) == 1
+
+    # Rewriting a file does not change the folder, the full rescan finds it
+    write(tmp_path, 'broken.cdxs', seed=0)
+    clock.now += 60
+    summaries = watcher.poll()
+    assert len(summaries) == 1
+    assert_matches_legacy(summaries[0], file)
+
+def test_watcher_keeps_a_corpus_up_to_date(tmp_path, clock):
+    corpus = EKKOCorpus([])
+    watcher = ScanSummaryWatcher(tmp_path, corpus.add, settle_time=0, cache=ScanSummaryCache(tmp_path / 'cache'))
+    for i in range(3):
+        write(tmp_path, f'plate_{i}.cdxs', seed=i)
+    watcher.poll()
+    assert sorted(summary.name for summary in corpus.summaries) == ['plate_0', 'plate_1', 'plate_2']
+    for summary in corpus.summaries:
+        assert_matches_legacy(summary, summary.file)
+
+def test_background_thread_fills_a_queue(tmp_path):
+    summaries = queue.Queue()
+    file = write(tmp_path, 'plate.cdxs', seed=0)
+    with ScanSummaryWatcher(tmp_path, summaries.put, settle_time=0) as watcher:
+        watcher.start(interval=0.01)
+        summary = summaries.get(timeout=10)
+    assert watcher._thread is None
+    assert isinstance(summary, EKKOScanSummary)
+    assert_matches_legacy(summary, file)
+
+def test_watch_requires_a_directory(tmp_path):
+    with pytest.raises(NotADirectoryError):
+        ScanSummaryWatcher(tmp_path / 'missing', lambda summary: None)